@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the gitmode=shallow/full/partial clones of git mode on a
+synthetic local repository, served over file:// so that the partial clone
+filter is honoured like on a real server.
+
+For every mode, measures wall time and bytes received (size of the objects
+of the clone) for the versionless search (clone + git log -1 or git
+describe) and for the export of the tarball that may follow (git archive,
+which fetches the missing blobs of a partial clone on demand).
+
+    python3 benchmarks/bench_git_clone_modes.py [--commits N] [--files F] [--file-size S]
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Same filter as Downloader.PARTIAL_CLONE_FILTER
+PARTIAL_CLONE_FILTER = 'blob:none'
+MODES = {
+    'shallow': ['--depth', '1'],
+    'full': [],
+    'partial': [f"--filter={PARTIAL_CLONE_FILTER}"],
+}
+
+
+def git(*args, cwd=None, stdout=subprocess.DEVNULL):
+    subprocess.run(('git',) + args, cwd=cwd, check=True, stdout=stdout, stderr=subprocess.DEVNULL)
+
+
+def make_repo(path, commits, files, file_size):
+    """Create a repository where every commit rewrites a few files, tagged every 50 commits."""
+    rng = random.Random(0)
+    git('init', '--quiet', path)
+    for key, value in (('user.name', 'bench'), ('user.email', 'bench@example.org'),
+                       ('uploadpack.allowFilter', 'true'), ('uploadpack.allowAnySHA1InWant', 'true')):
+        git('config', key, value, cwd=path)
+    for n in range(commits):
+        for index in (range(files) if n == 0 else rng.sample(range(files), max(1, files // 20))):
+            name = os.path.join(path, f"dir{index % 10}", f"file{index}.txt")
+            os.makedirs(os.path.dirname(name), exist_ok=True)
+            with open(name, 'wb') as f:
+                f.write(rng.randbytes(file_size // 2).hex().encode())
+        git('add', '-A', cwd=path)
+        git('commit', '--quiet', '-m', f"commit {n}", cwd=path)
+        if n % 50 == 0:
+            git('tag', '-a', '-m', f"release {n}", f"v1.{n}", cwd=path)
+
+
+def objects_size(git_dir):
+    total = 0
+    for root, dirs, names in os.walk(os.path.join(git_dir, 'objects')):
+        total += sum(os.lstat(os.path.join(root, name)).st_size for name in names)
+    return total
+
+
+def run(mode, url, workdir, pretty):
+    git_dir = os.path.join(workdir, f"{mode}.git")
+    start = time.perf_counter()
+    git('clone', '--quiet', '--bare', *MODES[mode], url, git_dir)
+    if pretty == 'describe':
+        git(f"--git-dir={git_dir}", 'describe', '--tags')
+    else:
+        git(f"--git-dir={git_dir}", 'log', '-1', f"--pretty={pretty}")
+    search_time, search_bytes = time.perf_counter() - start, objects_size(git_dir)
+
+    start = time.perf_counter()
+    git(f"--git-dir={git_dir}", 'archive', '--format=tar', '--prefix=pkg/', 'HEAD')
+    export_time, export_bytes = time.perf_counter() - start, objects_size(git_dir) - search_bytes
+    return search_time, search_bytes, export_time, export_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--commits', type=int, default=300)
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--file-size', type=int, default=8192)
+    args = parser.parse_args()
+
+    if shutil.which('git') is None:
+        sys.exit('git is not installed')
+    workdir = tempfile.mkdtemp(prefix='bench-git-')
+    try:
+        upstream = os.path.join(workdir, 'upstream')
+        make_repo(upstream, args.commits, args.files, args.file_size)
+        url = f"file://{upstream}"
+        print(f"{args.commits} commits, {args.files} files of {args.file_size} bytes, "
+              f"upstream objects {objects_size(os.path.join(upstream, '.git')) / 1e6:.1f} MB")
+        print(f"  {'':22} {'search':>9} {'received':>10}   {'archive':>9} {'fetched':>10}")
+        for pretty in ('0.0~git%cd.%h', 'describe'):
+            for mode in MODES:
+                if pretty == 'describe' and mode == 'shallow':
+                    # A depth 1 clone has no reachable tag
+                    continue
+                search_time, search_bytes, export_time, export_bytes = run(mode, url, workdir, pretty)
+                shutil.rmtree(os.path.join(workdir, f"{mode}.git"))
+                label = f"{mode} ({'describe' if pretty == 'describe' else 'log'})"
+                print(f"  {label:22} {search_time * 1000:7.0f}ms {search_bytes / 1e6:8.2f}MB"
+                      f"   {export_time * 1000:7.0f}ms {export_bytes / 1e6:8.2f}MB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the href matching stage of Uscan_http.html_search() on large
+synthetic index pages (kernel.org-like listings).
+
+Compares the former per-href loop (uncompiled re.fullmatch() of every
+pattern, eager urljoin() canonicalization, get_priority() with four
+searches) with HrefMatcher and the plain-href canonicalization shortcut.
+
+    python3 benchmarks/bench_href_matcher.py [--links N] [--repeat R]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from functools import partial
+
+sys.path[:0] = [os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'),
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'devscript', 'uscan')]
+
+from UscanUtils import UscanUtils  # noqa: E402
+from HrefMatcher import HrefMatcher  # noqa: E402
+from Uscan_http import Uscan_http, _canonicalize_dots  # noqa: E402
+
+BASE = 'https://cdn.example.org/pub/linux/kernel/v6.x/'
+FILEPATTERN = r'linux-(\d[\d.]*)\.tar\.(?:gz|xz)'
+
+
+def make_page(links):
+    """Return an HTML listing with about `links` links, few of them matching."""
+    rows = ['<html><head><title>Index of /pub/linux/kernel/v6.x/</title></head><body><pre>',
+            '<a href="../">../</a>']
+    kinds = ('ChangeLog-6.{0}.{1}', 'patch-6.{0}.{1}.xz', 'patch-6.{0}.{1}.sign', 'linux-6.{0}.{1}.tar.sign',
+             'incr/patch-6.{0}.{1}-{2}.xz', 'sha256sums.asc?v={1}', 'linux-6.{0}.{1}.tar.xz',
+             'linux-6.{0}.{1}.tar.gz')
+    n = 0
+    while n < links:
+        for kind in kinds:
+            href = kind.format(n // 800, n % 800, n % 7)
+            rows.append(f'<a href="{href}">{href}</a>     01-Jan-2024 00:00  {n * 13 % 99991}')
+            n += 1
+    rows.append('</pre></body></html>')
+    return '\n'.join(rows)
+
+
+def patterns():
+    site, path = re.match(r'^(\w+://[^/]+)(.*)$', BASE).groups()
+    return [re.escape(site) + re.escape(path) + FILEPATTERN,
+            re.escape(site) + re.escape('/pub/linux/kernel/') + FILEPATTERN]
+
+
+def old_get_priority(href):
+    priority = 0
+    if re.search(r'\.tar\.gz', href, re.IGNORECASE):
+        priority = 1
+    elif re.search(r'\.tar\.bz2', href, re.IGNORECASE):
+        priority = 2
+    elif re.search(r'\.tar\.lzma', href, re.IGNORECASE):
+        priority = 3
+    elif re.search(r'\.tar\.xz', href, re.IGNORECASE):
+        priority = 4
+    return priority
+
+
+def old_search(content, patterns, canonicalize):
+    hrefs = []
+    for match in re.finditer(r'<\s*a\s+[^>]*(?<=\s)href\s*=\s*["\'](.*?)["\']', content, re.IGNORECASE):
+        href = UscanUtils.fix_href(match.group(1))
+        href_canonical = canonicalize(href)
+        for pattern in patterns:
+            if re.fullmatch(pattern, href) or re.fullmatch(pattern, href_canonical):
+                hrefs.append((re.match(pattern, href_canonical).group(1), href_canonical,
+                              old_get_priority(href_canonical)))
+    return hrefs
+
+
+def new_search(content, patterns, canonicalize):
+    matcher = HrefMatcher.for_patterns(tuple(patterns))
+    return [(pattern.match(href).group(1), href, priority)
+            for pattern, href, priority in matcher.search(content, canonicalize)]
+
+
+def best_of(repeat, func, *args):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--links', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    content = make_page(args.links)
+    pats = patterns()
+
+    old_time, old_result = best_of(args.repeat, old_search, content, pats, partial(_canonicalize_dots, BASE))
+    new_time, new_result = best_of(args.repeat, new_search, content, pats,
+                                   partial(Uscan_http.url_canonicalize_dots, None, BASE))
+    if old_result != new_result:
+        sys.exit('Results differ!')
+
+    print(f"{args.links} links, {len(new_result)} matches, {len(content) / 1e6:.1f} MB page")
+    print(f"  per-href loop:  {old_time * 1000:8.1f} ms")
+    print(f"  HrefMatcher:    {new_time * 1000:8.1f} ms  ({old_time / new_time:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
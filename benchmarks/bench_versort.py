@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark of Versort.upstream_versort() on distinct synthetic versions.
+
+Cold runs start from empty key caches (every key is computed once), warm
+runs sort the same versions again with every key already cached.
+
+    python3 benchmarks/bench_versort.py [--versions N] [--repeat R]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from devscript.Versort import Versort  # noqa: E402
+
+
+def make_versions(count):
+    """Return `count` distinct versions like 1.2.3, 2.0~rc1 or 4.5a2."""
+    rng = random.Random(0)
+    versions = set()
+    while len(versions) < count:
+        version = '.'.join(str(rng.randint(0, 300)) for _ in range(rng.randint(2, 4)))
+        kind = rng.random()
+        if kind < 0.2:
+            version += f"~rc{rng.randint(1, 9)}"
+        elif kind < 0.3:
+            version += f"a{rng.randint(1, 9)}"
+        versions.add(version)
+    return sorted(versions)
+
+
+def best_of(repeat, func, setup=None):
+    best = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--versions', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    versions = make_versions(args.versions)
+    random.Random(1).shuffle(versions)
+    pairs = [[version, None] for version in versions]
+
+    cold = best_of(args.repeat, lambda: Versort.upstream_versort(pairs), Versort.upstream_key.cache_clear)
+    warm = best_of(args.repeat, lambda: Versort.upstream_versort(pairs))
+
+    print(f"{len(versions)} distinct versions")
+    print(f"  cold: {cold * 1000:8.1f} ms")
+    print(f"  warm: {warm * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,107 @@
-from packaging.version import Version
+import re
+from functools import lru_cache
+
+# Versions are turned into plain strings whose ordering is dpkg's ordering.
+# Non-digit parts are str.translate()d so that '~' sorts before the end of the
+# part (marked by \x02), letters come next and every other character last;
+# digits are left alone, so that the whole string is translated at once.
+_ORDER = str.maketrans({chr(c): (chr(1) if chr(c) == '~' else chr(c) if chr(c).isalnum() else chr(c + 128))
+                        for c in range(128)})
+_DIGITS_RE = re.compile(r'\d+')
+_VALID_RE = re.compile(r'^(?:\d+:)?[0-9][A-Za-z0-9.+~:-]*$')
+
+
+def _number(digits):
+    """Encode a digit string so that longer (larger) numbers sort last."""
+    digits = digits.lstrip('0')
+    return chr(0x30 + len(digits)) + digits
+
+
+class _DigitRuns(dict):
+    """Encoded digit runs (preceded by the end of the non-digit part), by run."""
+    def __missing__(self, digits):
+        part = self[digits] = '\x02' + _number(digits)
+        return part
+
+
+_DIGIT_RUNS = _DigitRuns()
+
+
+def _number_part(match, runs=_DIGIT_RUNS):
+    return runs[match.group()]
+
+
+# Key of an exhausted version part: empty non-digit string followed by 0
+_END = '\x02' + _number('')
+
+
+def _verrev_key(text):
+    """
+    Sort key of an upstream version or revision, following dpkg's verrevcmp().
+    Every non-digit part is followed by the encoded number after it (0 if none).
+    """
+    key = _DIGITS_RE.sub(_number_part, text.translate(_ORDER))
+    if text and not text[-1].isdigit():
+        key += _END
+    # Trailing empty parts compare equal to the end of the string: only a
+    # version made of zeros is a single such part. The second copy of _END
+    # makes an exhausted version compare as _END against a "0~"-like
+    # remainder as well
+    return ('' if key == _END else key) + _END + _END
+
+
+# Epoch and revision parts of the keys of upstream versions (1:<version>-0)
+_UPSTREAM_EPOCH = _number('1')
+_UPSTREAM_REVISION = _verrev_key('0')
 
 
 class Versort:
+    @staticmethod
+    @lru_cache(maxsize=262144)
+    def version_key(version):
+        """
+        Returns a sort key ordering Debian versions exactly like dpkg.
+        Keys are cached, so each version string is only parsed once.
+        :param version: Version string ([epoch:]upstream[-revision]).
+        :return: String comparable with the keys of other versions.
+        """
+        epoch, sep, rest = version.partition(':')
+        if not sep:
+            epoch, rest = '0', version
+        upstream, sep, revision = rest.rpartition('-')
+        if not sep:
+            upstream, revision = rest, ''
+        return _number(epoch if epoch.isdigit() else '') + _verrev_key(upstream) + _verrev_key(revision)
+
+    @staticmethod
+    @lru_cache(maxsize=262144)
+    def upstream_key(version):
+        """Returns the sort key of the upstream version as 1:<version>-0."""
+        return _UPSTREAM_EPOCH + _verrev_key(version) + _UPSTREAM_REVISION
+
+    @staticmethod
+    def check_version(version):
+        """Return True if version is a syntactically valid Debian version."""
+        return bool(_VALID_RE.match(version))
+
+    @staticmethod
+    def compare(version_a, version_b):
+        """
+        Compares two Debian versions like dpkg --compare-versions.
+        :return: -1, 0 or 1
+        """
+        key_a, key_b = Versort.version_key(version_a), Versort.version_key(version_b)
+        return (key_a > key_b) - (key_a < key_b)
+
+    @staticmethod
+    def upstream_compare(version_a, version_b):
+        """
+        Compares two upstream versions (as 1:<version>-0, like uscan always did).
+        :return: -1, 0 or 1
+        """
+        key_a, key_b = Versort.upstream_key(version_a), Versort.upstream_key(version_b)
+        return (key_a > key_b) - (key_a < key_b)
+
     @staticmethod
     def versort(namever_pairs):
         """
@@ -27,35 +127,23 @@ class Versort:
         :param namever_pairs: List of [version, data]
         :return: List sorted by version in descending order.
         """
-        return Versort._versort(check=False, getversion=lambda pair: f"1:{pair[0]}-0", namever_pairs=namever_pairs)
+        return Versort._versort(check=False, getversion=lambda pair: pair[0], namever_pairs=namever_pairs,
+                                version_key=Versort.upstream_key)
 
     @staticmethod
-    def _versort(check, getversion, namever_pairs):
+    def _versort(check, getversion, namever_pairs, version_key=None):
         """
         Helper function for sorting versions.
         :param check: Boolean, whether to perform strict checking.
         :param getversion: Function to extract version.
         :param namever_pairs: List of [version, data]
-        :return: List sorted by version in descending order.
+        :param version_key: Key function for the versions (version_key() by default).
+        :return: New list sorted by version in descending order (the input is left untouched).
         """
-        # Convert versions to Version objects for comparison
-        for pair in namever_pairs:
-            version_str = getversion(pair)
-            try:
-                pair.insert(0, Version(version_str))
-            except ValueError:
-                # If there's an error with the version format, handle it here
-                if check:
-                    raise ValueError(f"Invalid version: {version_str}")
-                else:
-                    # For non-strict sorting, use a basic fallback
-                    pair.insert(0, Version("0.0.0"))
-
-        # Sort the pairs by the version object (first element) in descending order
-        sorted_pairs = sorted(namever_pairs, key=lambda pair: pair[0], reverse=True)
-
-        # Remove the added version object before returning
-        for pair in sorted_pairs:
-            pair.pop(0)
-
-        return sorted_pairs
\ No newline at end of file
+        if check:
+            for pair in namever_pairs:
+                if not Versort.check_version(str(getversion(pair))):
+                    raise ValueError(f"Invalid version: {getversion(pair)}")
+
+        version_key = version_key or Versort.version_key
+        return sorted(namever_pairs, key=lambda pair: version_key(str(getversion(pair))), reverse=True)
@@ -0,0 +1,89 @@
+import os
+import json
+from CacheDir import CacheDir
+from Checksums import Checksums
+from Transfer import Transfer
+from UscanOutput import UscanOutput
+
+
+class ArtifactStore:
+    """
+    Content-addressed store of downloaded tarballs and signatures, shared by
+    every package and every run.
+
+    Blobs are keyed by their sha256. The index maps a URL to the validator
+    (ETag or Last-Modified) it was served with, its size and the sha256 of
+    its content. A download whose URL still answers a HEAD request with the
+    same validator is copied from the store instead of being fetched again.
+    Blobs are evicted least recently used first once the store exceeds its
+    size; copies out of the store hold a shared lock that eviction takes
+    exclusively, so a blob never disappears while it is being read.
+    """
+    DEFAULT_MAX_SIZE = 2048  # MiB
+
+    def __init__(self, path, max_size=None):
+        """
+        :param path: Store directory.
+        :param max_size: Size bound in MiB (defaults to DEFAULT_MAX_SIZE).
+        """
+        self.blobs = CacheDir(os.path.join(path, 'blobs'), (max_size or self.DEFAULT_MAX_SIZE) * 1024 * 1024)
+        self.index = CacheDir(os.path.join(path, 'index'))
+
+    def lookup(self, url):
+        """Return the index entry of url ({'validator', 'size', 'sha256'}), or None."""
+        data = self.index.read(url)
+        if data is None:
+            return None
+        try:
+            entry = json.loads(data)
+        except ValueError:
+            self.index.delete(url)
+            return None
+        return entry if entry.get('url') == url else None
+
+    def materialize(self, entry, fname):
+        """
+        Copy the blob of an index entry to fname (atomically).
+        The copy is hashed on the way and must match the sha256 of the entry.
+        :return: True on success, False if the blob is gone or damaged.
+        """
+        blob = self.blobs.key_path(entry['sha256'])
+        fd, tmp = Transfer.temporary_file(fname)
+        checksums = Checksums(('sha256',))
+        try:
+            with os.fdopen(fd, 'wb') as dst, self.blobs.lock('.evict.lock', shared=True), open(blob, 'rb') as src:
+                for chunk in iter(lambda: src.read(Checksums.CHUNK_SIZE), b''):
+                    checksums.update(chunk)
+                    dst.write(chunk)
+            if os.path.getsize(tmp) != entry['size'] or checksums.hexdigests()['sha256'] != entry['sha256']:
+                UscanOutput.uscan_debug(f"Dropping damaged stored copy of {entry['url']}")
+                self.blobs.delete(entry['sha256'])
+                os.unlink(tmp)
+                return False
+            os.replace(tmp, fname)
+        except FileNotFoundError:
+            self._unlink(tmp)
+            return False
+        except BaseException:
+            self._unlink(tmp)
+            raise
+        self.blobs.touch(blob)
+        return True
+
+    def store(self, url, validator, fname, sha256):
+        """Add the downloaded file fname, served for url with validator, to the store."""
+        size = os.path.getsize(fname)
+        try:
+            if not os.path.exists(self.blobs.key_path(sha256)):
+                self.blobs.write_file(sha256, fname)
+            entry = {'url': url, 'validator': validator, 'size': size, 'sha256': sha256}
+            self.index.write(url, json.dumps(entry).encode())
+        except OSError as e:
+            UscanOutput.uscan_warn(f"Could not store {fname} in the download cache: {e}")
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
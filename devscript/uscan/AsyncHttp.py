@@ -0,0 +1,90 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import urljoin
+from UscanOutput import UscanOutput
+from HttpPool import HttpPool
+
+
+class AsyncHttp:
+    """
+    asyncio front-end for the index-page fetches done by Uscan_http.
+    Requests are issued from coroutines and multiplexed over at most
+    max_connections connections of the process-wide HttpPool.
+    """
+    MAX_REDIRECTS = 30
+    _default = None
+
+    def __init__(self, max_connections=8, session=None, timeout=None):
+        self.max_connections = max_connections
+        self.session = session or HttpPool.instance().new_session()
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix='uscan-http')
+
+    @classmethod
+    def default(cls):
+        """Return the process-wide engine used by the synchronous wrappers."""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    @staticmethod
+    def run(coro):
+        """Run a coroutine to completion from synchronous code."""
+        return asyncio.run(coro)
+
+    async def _send(self, method, url, cache=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        kwargs.setdefault('timeout', self.timeout)
+        if cache:
+            send = partial(cache.request, self.session, method, url, **kwargs)
+        else:
+            send = partial(self.session.request, method, url, **kwargs)
+        return await loop.run_in_executor(self.executor, send)
+
+    async def call(self, func, *args):
+        """Run a blocking function (e.g. reading a streamed body) in the engine's threads."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args))
+
+    async def fetch(self, url, headers=None, cache=None, **kwargs):
+        """
+        GET url, following redirects by hand like CatchRedirections.
+        :param cache: Optional HttpCache used to revalidate the pages.
+        :return: Tuple (response, redirections) where redirections starts with url.
+        """
+        redirections = [url]
+        response = await self._send('GET', url, cache=cache, headers=headers, allow_redirects=False, **kwargs)
+
+        for _ in range(self.MAX_REDIRECTS):
+            if not response.is_redirect:
+                break
+            next_url = urljoin(response.url, response.headers.get('Location'))
+            if next_url not in redirections:
+                redirections.append(next_url)
+            UscanOutput.uscan_debug(f"Redirected to {next_url}")
+            response.close()
+            response = await self._send('GET', next_url, cache=cache, headers=headers, allow_redirects=False,
+                                        **kwargs)
+        else:
+            UscanOutput.uscan_warn(f"Too many redirections while requesting {url}")
+
+        return response, redirections
+
+    async def search(self, searcher):
+        """Run the search and the upstream URL step of one Uscan_http line."""
+        result = await searcher.http_search_async(self)
+        if not result:
+            return None
+        searcher.parse_result['newversion'], searcher.parse_result['newfile'] = result
+        return result, searcher.http_upstream_url()
+
+    async def search_all(self, searchers):
+        """
+        Search many watch lines concurrently from a single event loop.
+        :return: List of ((newversion, newfile), upstream_url) or None, in input order.
+        """
+        return await asyncio.gather(*(self.search(searcher) for searcher in searchers))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -0,0 +1,173 @@
+import os
+import time
+import fcntl
+import shutil
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from UscanOutput import UscanOutput
+
+
+class CacheDir:
+    """
+    Size-bounded on-disk cache shared by several uscan processes.
+    Entries are written to a temporary file and renamed into place, so
+    readers never see partial data; reading an entry refreshes its mtime,
+    which is what the LRU eviction sorts on.
+    """
+    EVICT_EVERY = 64  # writes of one process between two eviction passes
+    # Seconds between two eviction passes of all the processes sharing the
+    # directory, told by the mtime of the stamp file each pass touches
+    EVICT_INTERVAL = 60
+    EVICT_STAMP = '.evict.stamp'
+
+    def __init__(self, path, max_size=None):
+        """
+        :param path: Directory holding the entries (created if missing).
+        :param max_size: Maximum total size in bytes, or None for unbounded.
+        """
+        self.path = path
+        self.max_size = max_size
+        self._writes = 0
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+
+    @staticmethod
+    def default_root():
+        """Return the default uscan cache directory ($XDG_CACHE_HOME/uscan)."""
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(base, 'uscan')
+
+    @staticmethod
+    def hash_key(key):
+        if isinstance(key, str):
+            key = key.encode('utf-8', 'surrogateescape')
+        return hashlib.sha256(key).hexdigest()
+
+    def key_path(self, key, suffix=''):
+        """Return the file used for key (fanned out over 256 subdirectories)."""
+        digest = self.hash_key(key)
+        return os.path.join(self.path, digest[:2], digest[2:] + suffix)
+
+    def read(self, key, suffix=''):
+        """Return the stored bytes for key, or None on a miss."""
+        path = self.key_path(key, suffix)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        self.touch(path)
+        return data
+
+    def write(self, key, data, suffix=''):
+        """Atomically store data (bytes) for key and return the entry path."""
+        path = self.key_path(key, suffix)
+        self.write_path(path, data)
+        return path
+
+    def write_path(self, path, data):
+        def fill(tmp):
+            with open(tmp, 'wb') as f:
+                f.write(data)
+        self._write_with(path, fill)
+
+    def write_file(self, key, src, suffix=''):
+        """Atomically store a copy of the file src for key and return the entry path."""
+        path = self.key_path(key, suffix)
+        self._write_with(path, lambda tmp: shutil.copyfile(src, tmp))
+        return path
+
+    def _write_with(self, path, fill):
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        os.close(fd)
+        try:
+            fill(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            self._unlink(tmp)
+            raise
+
+        self._writes += 1
+        if self.max_size and (self._writes % self.EVICT_EVERY == 0 or self.evict_due()):
+            self.evict()
+
+    def evict_due(self):
+        """Return True if no process has evicted entries for EVICT_INTERVAL seconds."""
+        return self._older_than(os.path.join(self.path, self.EVICT_STAMP), self.EVICT_INTERVAL, missing=True)
+
+    def delete(self, key, suffix=''):
+        self._unlink(self.key_path(key, suffix))
+
+    @staticmethod
+    def touch(path):
+        """Mark an entry as recently used."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def lock(self, name='.lock', shared=False, blocking=True):
+        """Hold an flock() on a lock file of the cache directory (BlockingIOError if busy and not blocking)."""
+        with open(os.path.join(self.path, name), 'a') as f:
+            fcntl.flock(f, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB))
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def entries(self):
+        """Yield (mtime, size, path) for every entry file."""
+        for root, dirs, files in os.walk(self.path):
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def evict(self, max_size=None):
+        """Remove least recently used entries until the cache fits in max_size bytes."""
+        max_size = max_size or self.max_size
+        if not max_size:
+            return 0
+        with self.lock('.evict.lock'):
+            with open(os.path.join(self.path, self.EVICT_STAMP), 'a'):
+                pass
+            self.touch(os.path.join(self.path, self.EVICT_STAMP))
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for mtime, size, path in entries:
+                if total <= max_size:
+                    break
+                self._unlink(path)
+                total -= size
+                removed += 1
+            # Leftovers of writers that died between mkstemp() and rename()
+            for root, dirs, files in os.walk(self.path):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if name.startswith('.tmp-') and self._older_than(path, 3600):
+                        self._unlink(path)
+        if removed:
+            UscanOutput.uscan_debug(f"Evicted {removed} entries from {self.path}")
+        return removed
+
+    @staticmethod
+    def _older_than(path, seconds, missing=False):
+        try:
+            return os.stat(path).st_mtime < time.time() - seconds
+        except FileNotFoundError:
+            return missing
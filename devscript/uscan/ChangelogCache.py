@@ -0,0 +1,54 @@
+import os
+import json
+import threading
+from CacheDir import CacheDir
+
+
+class ChangelogCache:
+    """
+    (package, version) of debian/changelog files, keyed by path and
+    validated by inode, size and mtime. The whole index is one cache entry,
+    read once per process and merged back into the on-disk copy by save().
+    """
+    KEY = 'changelogs-v1'
+
+    def __init__(self, cache_dir):
+        self.store = CacheDir(os.path.join(cache_dir, 'changelogs'))
+        self.lock = threading.Lock()
+        self.entries = self._load()
+        self.dirty = {}
+
+    def _load(self):
+        try:
+            return json.loads(self.store.read(self.KEY) or b'{}')
+        except ValueError:
+            return {}
+
+    @staticmethod
+    def _stamp(st):
+        return [st.st_ino, st.st_size, st.st_mtime_ns]
+
+    def get(self, path, st):
+        """Return (package, version) for path if the file is unchanged since it was cached."""
+        entry = self.entries.get(path)
+        if entry and entry[0] == self._stamp(st):
+            return entry[1], entry[2]
+        return None
+
+    def put(self, path, st, package, version):
+        entry = [self._stamp(st), package, version]
+        with self.lock:
+            self.entries[path] = entry
+            self.dirty[path] = entry
+
+    def save(self):
+        """Merge the new entries into the shared index."""
+        with self.lock:
+            if not self.dirty:
+                return
+            with self.store.lock('.changelogs.lock'):
+                entries = self._load()
+                entries.update(self.dirty)
+                self.store.write(self.KEY, json.dumps(entries).encode())
+            self.entries.update(entries)
+            self.dirty = {}
@@ -0,0 +1,79 @@
+import os
+import hashlib
+from UscanOutput import UscanOutput
+
+
+class Checksums:
+    """
+    Digests of a file computed with several algorithms in a single pass.
+
+    Transfer feeds the body of a download through update() as it is
+    written, and the Downloader keeps the result keyed by the file's
+    identity (inode, size, mtime). Later users such as the --log of
+    WatchLine.mkorigtargz then get the digest for free; a file that was not
+    hashed in flight (or changed since) is read in CHUNK_SIZE pieces.
+    """
+    ALGORITHMS = ('md5', 'sha256', 'blake2b')
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, algorithms=('md5',)):
+        for name in algorithms:
+            if name not in self.ALGORITHMS:
+                raise ValueError(f"Unsupported digest algorithm: {name}")
+        self.hashes = {name: hashlib.new(name) for name in algorithms}
+
+    def __bool__(self):
+        return bool(self.hashes)
+
+    def update(self, data):
+        for digest in self.hashes.values():
+            digest.update(data)
+
+    def hexdigests(self):
+        return {name: digest.hexdigest() for name, digest in self.hashes.items()}
+
+    def update_from_file(self, path, limit=None):
+        """Hash the first limit bytes of path (the whole file by default), chunk by chunk."""
+        buffer = bytearray(self.CHUNK_SIZE)
+        view = memoryview(buffer)
+        remaining = limit
+        with open(path, 'rb', buffering=0) as f:
+            while remaining is None or remaining > 0:
+                read = f.readinto(view if remaining is None else view[:min(remaining, len(buffer))])
+                if not read:
+                    break
+                self.update(view[:read])
+                if remaining is not None:
+                    remaining -= read
+        return self
+
+    @staticmethod
+    def identity(path):
+        """Key telling whether a file is still the one that was hashed."""
+        st = os.stat(path)
+        return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+
+class DigestMemo:
+    """Digests known per file path, valid while the file identity is unchanged."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def record(self, path, checksums):
+        """Remember the digests computed in flight for the file just written at path."""
+        if checksums:
+            self.entries[os.path.abspath(path)] = (Checksums.identity(path), checksums.hexdigests())
+
+    def hexdigest(self, path, algorithm='md5'):
+        """Return the digest of path, hashing the file only if it was not hashed in flight."""
+        path = os.path.abspath(path)
+        identity = Checksums.identity(path)
+        known = self.entries.get(path)
+        if known and known[0] == identity and algorithm in known[1]:
+            return known[1][algorithm]
+        UscanOutput.uscan_debug(f"Computing the {algorithm} digest of {path}")
+        digests = dict(known[1]) if known and known[0] == identity else {}
+        digests.update(Checksums((algorithm,)).update_from_file(path).hexdigests())
+        self.entries[path] = (identity, digests)
+        return digests[algorithm]
@@ -0,0 +1,129 @@
+import os
+import bz2
+import gzip
+import lzma
+import shutil
+import subprocess
+from UscanOutput import UscanOutput
+
+
+class Compressor:
+    """
+    Compression of the tarballs uscan writes itself (VCS exports), within a
+    thread budget.
+
+    With a budget of one thread the single-threaded tools run as they
+    always did (gzip -n -9, bzip2, xz, lzma, zstd). With more, the parallel
+    ones are preferred when installed: pigz, pbzip2, and xz or zstd in
+    their multi-threaded mode. These cut the input in blocks of a fixed
+    size, so their output is reproducible and does not depend on the
+    number of threads, but it differs from the single-threaded tool's.
+    Without any tool, the stdlib gzip/bz2/lzma modules compress
+    in-process; bz2 and lzma give the same bytes as bzip2, lzma and
+    single-threaded xz, gzip's deflate does not match GNU gzip's.
+
+    The budget defaults to one thread, so that the tarballs are the same
+    bytes whatever the machine: the parallel tools, and xz and zstd with
+    more than one thread, write different (if reproducible) output. More
+    threads are used only on request, with --compress-threads N, or with
+    --compress-threads 0 the CPU count divided by the number of packages
+    processed concurrently (--jobs), so a fleet run does not oversubscribe
+    the machine.
+    """
+    CHUNK_SIZE = 1024 * 1024
+    # Byte-stable output unless more threads are requested
+    DEFAULT_THREADS = 1
+
+    SINGLE = {
+        'gz': ['gzip', '-n', '-9'],
+        'bz2': ['bzip2'],
+        'xz': ['xz'],
+        'lzma': ['lzma'],
+        'zst': ['zstd', '-q', '-c'],
+    }
+    PARALLEL = {
+        'gz': lambda threads: ['pigz', '-n', '-9', '-p', str(threads)],
+        'bz2': lambda threads: ['pbzip2', '-9', '-c', f"-p{threads}"],
+        'xz': lambda threads: ['xz', f"-T{threads}"],
+        'zst': lambda threads: ['zstd', '-q', '-c', f"-T{threads}"],
+    }
+    STDLIB = {
+        'gz': lambda out: gzip.GzipFile(filename='', mode='wb', compresslevel=9, fileobj=out, mtime=0),
+        'bz2': lambda out: bz2.BZ2File(out, 'wb', compresslevel=9),
+        'xz': lambda out: lzma.LZMAFile(out, 'wb', format=lzma.FORMAT_XZ, preset=6),
+        'lzma': lambda out: lzma.LZMAFile(out, 'wb', format=lzma.FORMAT_ALONE, preset=6),
+    }
+
+    # Thread budget of the process, see configure()
+    _budget = None
+
+    def __init__(self, suffix, threads=None):
+        """
+        :param suffix: Compression suffix (gz, bz2, xz, lzma or zst).
+        :param threads: Threads to use, the process budget by default.
+        """
+        if suffix not in self.SINGLE:
+            UscanOutput.uscan_die(f"Unknown suffix file to repack: {suffix}")
+        self.suffix = suffix
+        self.threads = threads or self.budget()
+        self.command = self._command()
+
+    @classmethod
+    def configure(cls, threads=None, jobs=None):
+        """
+        Set the thread budget of the process.
+        :param threads: Threads to use (DEFAULT_THREADS if None); 0 shares the CPU count among jobs.
+        :param jobs: Number of packages processed concurrently.
+        """
+        if threads is None:
+            threads = cls.DEFAULT_THREADS
+        cls._budget = threads or max(1, (os.cpu_count() or 1) // max(1, jobs or 1))
+
+    @classmethod
+    def budget(cls):
+        if cls._budget is None:
+            cls.configure()
+        return cls._budget
+
+    @classmethod
+    def environment(cls):
+        """Environment of the tools compressing on their own (mk-origtargz), spreading xz and zstd on the budget."""
+        env = dict(os.environ)
+        if cls.budget() > 1:
+            # Defaults only: options given by the tool on the command line still win
+            env['XZ_DEFAULTS'] = f"-T{cls.budget()} {env.get('XZ_DEFAULTS', '')}".strip()
+            env.setdefault('ZSTD_NBTHREADS', str(cls.budget()))
+        return env
+
+    def _command(self):
+        """Return the compressor command, or None to compress with the stdlib."""
+        if self.threads > 1 and self.suffix in self.PARALLEL:
+            command = self.PARALLEL[self.suffix](self.threads)
+            if shutil.which(command[0]):
+                return command
+        command = self.SINGLE[self.suffix]
+        if shutil.which(command[0]):
+            return command
+        if self.suffix not in self.STDLIB:
+            UscanOutput.uscan_die(f"{command[0]} is needed to compress .{self.suffix} tarballs")
+        return None
+
+    @property
+    def name(self):
+        return self.command[0] if self.command else f"python {self.suffix} compression"
+
+    def compress(self, source, out):
+        """
+        Compress everything read from the pipe source into the binary file out.
+        :param source: Read end of a pipe (e.g. the stdout of git archive); closed on return.
+        :return: True on success.
+        """
+        UscanOutput.uscan_verbose(f"Compressing with {' '.join(self.command) if self.command else self.name}")
+        if self.command:
+            process = subprocess.Popen(self.command, stdin=source, stdout=out)
+            # The compressor is the only reader left: the writer gets SIGPIPE if it dies
+            source.close()
+            return process.wait() == 0
+        with source, self.STDLIB[self.suffix](out) as compressed:
+            shutil.copyfileobj(source, compressed, self.CHUNK_SIZE)
+        return True
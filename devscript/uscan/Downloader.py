@@ -3,26 +3,65 @@ import requests
 import shutil
 import subprocess
 import re
-import tempfile
 from pathlib import Path
 from CatchRedirections import CatchRedirections
-import UscanOutput
+from HttpPool import HttpPool
+from HttpCache import HttpCache
+from ResultCache import ResultCache
+from Transfer import Transfer
+from Checksums import Checksums, DigestMemo
+from ArtifactStore import ArtifactStore
+from SignatureProbe import SignatureProbe
+from GitMirror import GitMirror
+from Compressor import Compressor
+from UscanOutput import UscanOutput
 import UscanUtils
 
 
 class Downloader:
-    def __init__(self, git_upstream=False, agent=None, timeout=None, pasv='default', destdir=None):
+    # Whether the ssl module is available, shared by every Downloader of the process
+    _ssl_available = None
+    DEFAULT_MAX_PAGE_SIZE = 64  # MiB
+    PAGE_CHUNK_SIZE = 64 * 1024
+    RESUME_RETRIES = 2
+    DEFAULT_GIT_DESCRIBE_DEPTH = 1024
+    # gitmode=partial clones all commits and trees but no blob: describe and
+    # log never read blobs, and git archive fetches the ones of the exported
+    # tree in one batch (tree:0 would fetch every tree in its own round trip)
+    PARTIAL_CLONE_FILTER = 'blob:none'
+
+    def __init__(self, git_upstream=False, agent=None, timeout=None, pasv='default', destdir=None, headers=None,
+                 cache_dir=None, cache_size=None, max_page_size=None, digests=None, artifact_cache_size=None,
+                 git_mirror_size=None, git_describe_depth=None):
         self.git_upstream = git_upstream
         self.agent = agent or "Debian uscan"
         self.timeout = timeout
         self.pasv = pasv
         self.destdir = destdir
-        self.gitrepo_state = 0  # 0: no repo, 1: shallow clone, 2: full clone
+        self.gitrepo_state = 0  # 0: no repo, 1: shallow clone, 2: full clone, 3: partial clone
+        self.gitmode = 'shallow'
+        # Depth past which a shallow clone is unshallowed rather than deepened further for git describe
+        self.git_describe_depth = git_describe_depth or self.DEFAULT_GIT_DESCRIBE_DEPTH
         self.git_export_all = False
         self.ssl = self._check_ssl()
-        self.headers = {}
+        self.headers = headers or {}
+        self.http_cache = HttpCache(os.path.join(cache_dir, 'http'), cache_size) if cache_dir else None
+        self.result_cache = ResultCache(os.path.join(cache_dir, 'results')) if cache_dir else None
+        self.artifacts = ArtifactStore(os.path.join(cache_dir, 'artifacts'), artifact_cache_size) if cache_dir \
+            else None
+        # Persistent mirrors used by git mode instead of temporary clones (git_mirror_size=0 disables them)
+        self.git_mirrors = GitMirror(os.path.join(cache_dir, 'git'), git_mirror_size) \
+            if cache_dir and git_mirror_size != 0 else None
+        self.max_page_size = (max_page_size or self.DEFAULT_MAX_PAGE_SIZE) * 1024 * 1024
+        # Digest algorithms computed while downloading, looked up through self.digests
+        self.digest_algorithms = tuple(digests or ())
+        if self.artifacts and 'sha256' not in self.digest_algorithms:
+            # Address of the downloaded files in the artifact store
+            self.digest_algorithms += ('sha256',)
+        self.digests = DigestMemo()
 
         self.user_agent = self._create_user_agent()
+        self.signature_probe = SignatureProbe(self.user_agent, cache_dir, self.timeout)
 
         # Set FTP passive mode if specified
         if self.pasv != 'default':
@@ -31,6 +70,8 @@ class Downloader:
 
     def _create_user_agent(self):
         user_agent = CatchRedirections()
+        # Share keep-alive connections with every other session of the process
+        HttpPool.instance().mount(user_agent)
         user_agent.headers.update({'User-Agent': self.agent})
         if self.timeout:
             user_agent.timeout = self.timeout
@@ -45,28 +86,91 @@ class Downloader:
         return request
 
     def _check_ssl(self):
-        """Check for SSL availability."""
-        try:
-            requests.get('https://example.com')
-            return True
-        except requests.exceptions.SSLError:
-            UscanOutput.uscan_warn("SSL support is required for HTTPS URLs but is not available")
-            return False
-
-    def download(self, url, fname, optref, base, pkg_dir, pkg, mode=None, gitrepo_dir=None):
-        """Download files from HTTP, FTP, or Git sources."""
+        """Check for SSL support: Python's ssl module, checked once per process without any request."""
+        if Downloader._ssl_available is None:
+            try:
+                import ssl  # noqa: F401
+                Downloader._ssl_available = True
+            except ImportError:
+                UscanOutput.uscan_warn("SSL support is required for HTTPS URLs but is not available")
+                Downloader._ssl_available = False
+        return Downloader._ssl_available
+
+    def ssl_enabled(self):
+        """Return True if HTTPS URLs can be fetched."""
+        return self.ssl
+
+    def get_page(self, url, headers=None):
+        """GET an index page or listing through the shared pool, revalidating the cached copy."""
+        session = HttpPool.instance().session
+        if self.http_cache:
+            return self.http_cache.get(session, url, headers=headers, timeout=self.timeout)
+        return session.get(url, headers=headers, timeout=self.timeout)
+
+    @staticmethod
+    def page_unread(response):
+        """Return True if the body of a stream=True response has not been read yet."""
+        return response._content is False
+
+    def iter_page(self, response):
+        """
+        Yield the (content-decoded) body of a streamed page chunk by chunk.
+        Reading stops past max_page_size: response.truncated is then set.
+        A page read to the end is stored in the HTTP cache, whatever its
+        Content-Length said, unless it exceeds HttpCache.MAX_ENTRY_SIZE.
+        """
+        response.truncated = False
+        size = 0
+        kept = [] if self.http_cache and self.http_cache.cacheable(response) else None
+        for chunk in response.iter_content(self.PAGE_CHUNK_SIZE):
+            size += len(chunk)
+            if size > self.max_page_size:
+                UscanOutput.uscan_warn(f"{response.url} is larger than {self.max_page_size >> 20} MiB, giving up "
+                                       "(see --max-page-size)")
+                response.truncated = True
+                response.close()
+                return
+            if kept is not None and size > HttpCache.MAX_ENTRY_SIZE:
+                UscanOutput.uscan_debug(f"{response.url} is too large to be cached")
+                kept = None
+            elif kept is not None:
+                kept.append(chunk)
+            yield chunk
+        if kept is not None:
+            self.http_cache.save(response.url, response, b''.join(kept))
+
+    def read_page(self, response):
+        """
+        Read the whole body of a streamed page within max_page_size (and
+        store it in the HTTP cache, see iter_page()).
+        :return: The body (response.content from now on), or None if the page is too large.
+        """
+        if not self.page_unread(response):
+            return response.content
+        body = b''.join(self.iter_page(response))
+        if response.truncated:
+            return None
+        response._content = body
+        return body
+
+    def download(self, url, fname, optref, base, pkg_dir, pkg, mode=None, gitrepo_dir=None, stream_to=None):
+        """
+        Download files from HTTP, FTP, or Git sources.
+        :param stream_to: Optional factory of a sink (e.g. a StreamVerification)
+                          fed with the file as it is written, see _fetch().
+        """
         mode = mode or optref.mode
         if mode == 'http':
-            return self._download_http(url, fname, base)
+            return self._download_http(url, fname, base, stream_to)
         elif mode == 'ftp':
-            return self._download_ftp(url, fname)
+            return self._download_ftp(url, fname, stream_to)
         elif mode == 'git':
             return self._download_git(url, fname, optref, base, pkg_dir, pkg, gitrepo_dir)
         else:
             UscanOutput.uscan_warn(f"Unsupported download mode: {mode}")
             return False
 
-    def _download_http(self, url, fname, base):
+    def _download_http(self, url, fname, base, stream_to=None):
         if url.startswith("https") and not self.ssl:
             UscanOutput.uscan_die(f"{UscanOutput.progname}: SSL support is required for HTTPS URLs")
 
@@ -82,35 +186,105 @@ class Downloader:
             elif '@' not in key:
                 UscanOutput.uscan_warn(f"Malformed HTTP header: {key}")
 
-        try:
-            response = self.user_agent.get(url, headers=headers, stream=True)
-            if response.status_code != 200:
-                UscanOutput.uscan_warn(f"Downloading\n  {url} failed: {response.status_code} {response.reason}")
-                return False
+        return self._fetch(url, fname, headers, stream_to)
 
-            with open(fname, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+    def _download_ftp(self, url, fname, stream_to=None):
+        UscanOutput.uscan_verbose(f"Requesting URL:\n   {url}")
+        return self._fetch(url, fname, stream_to=stream_to)
+
+    def _fetch(self, url, fname, headers=None, stream_to=None):
+        """
+        Download url to fname, resuming a partial download left by a previous
+        attempt with Range/If-Range. If the server ignores the range (or the
+        validator changed) it answers 200 and the file is fetched again whole;
+        a range starting elsewhere than asked discards the partial download.
+        Transfers cut by a network error are resumed up to RESUME_RETRIES times.
+        Only http(s) downloads are resumed: other URLs are always fetched whole.
+        Files still served with the validator they were stored with are
+        copied from the artifact store instead.
+
+        Each transfer attempt gets a new sink from stream_to(); the sink is
+        close()d once the file is complete and abort()ed otherwise. Files
+        copied from the artifact store are not streamed.
+        """
+        if self.artifacts and self._from_store(url, fname, headers):
             return True
-        except requests.RequestException as e:
-            UscanOutput.uscan_warn(f"Failed to download {url}: {str(e)}")
-            return False
 
-    def _download_ftp(self, url, fname):
-        UscanOutput.uscan_verbose(f"Requesting URL:\n   {url}")
-        try:
-            response = self.user_agent.get(url, stream=True)
-            if response.status_code != 200:
-                UscanOutput.uscan_warn(f"Downloading\n  {url} failed: {response.status_code} {response.reason}")
+        resumable = url.startswith(('http://', 'https://'))
+        for attempt in range(self.RESUME_RETRIES + 1):
+            offset, validator = Transfer.resume_point(fname, url) if resumable else (0, None)
+            request_headers = dict(headers or {})
+            if offset:
+                request_headers.update({'Range': f"bytes={offset}-", 'If-Range': validator})
+                UscanOutput.uscan_verbose(f"Resuming download of {url} at {offset} bytes")
+            sink = None
+            try:
+                response = self.user_agent.get(url, headers=request_headers, stream=True)
+                if response.status_code == 416 and offset:
+                    # The partial file no longer fits the upstream file
+                    response.close()
+                    Transfer.discard(fname)
+                    continue
+                if response.status_code == 206 and offset and Transfer.range_start(response) != offset:
+                    UscanOutput.uscan_verbose(f"{url} was not resumed at {offset} bytes, downloading it again")
+                    response.close()
+                    Transfer.discard(fname)
+                    continue
+                checksums = Checksums(self.digest_algorithms)
+                if response.status_code == 206 and offset:
+                    sink = stream_to() if stream_to else None
+                    transfer = Transfer(response, url, offset, (checksums, sink))
+                elif response.status_code == 200:
+                    sink = stream_to() if stream_to else None
+                    transfer = Transfer(response, url, sinks=(checksums, sink))
+                else:
+                    UscanOutput.uscan_warn(f"Downloading\n  {url} failed: {response.status_code} {response.reason}")
+                    response.close()
+                    return False
+                if not transfer.save(fname, resumable=resumable):
+                    return False
+                if sink:
+                    sink.close()
+                    sink = None
+                self.digests.record(fname, checksums)
+                validator = Transfer.validator(response)
+                if self.artifacts and validator:
+                    self.artifacts.store(url, validator, fname, checksums.hexdigests()['sha256'])
+                return True
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                if resumable and attempt < self.RESUME_RETRIES and Transfer.resume_point(fname, url)[0]:
+                    UscanOutput.uscan_warn(f"Download of {url} interrupted ({e}), resuming")
+                    continue
+                UscanOutput.uscan_warn(f"Failed to download {url}: {str(e)}")
                 return False
-
-            with open(fname, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return True
+            except (requests.RequestException, OSError) as e:
+                UscanOutput.uscan_warn(f"Failed to download {url}: {str(e)}")
+                return False
+            finally:
+                if sink:
+                    sink.abort()
+        UscanOutput.uscan_warn(f"Failed to download {url}: the partial download could not be resumed")
+        return False
+
+    def _from_store(self, url, fname, headers=None):
+        """Copy url from the artifact store to fname if a HEAD request shows it is unchanged upstream."""
+        entry = self.artifacts.lookup(url)
+        if not entry:
+            return False
+        try:
+            response = self.user_agent.head(url, headers=headers, allow_redirects=True, timeout=self.timeout)
+            response.close()
         except requests.RequestException as e:
-            UscanOutput.uscan_warn(f"Failed to download {url}: {str(e)}")
+            UscanOutput.uscan_debug(f"HEAD {url} failed: {e}")
+            return False
+        length = response.headers.get('Content-Length', '')
+        if not response.ok or Transfer.validator(response) != entry['validator'] or \
+                (length.isdigit() and int(length) != entry['size']):
+            return False
+        if not self.artifacts.materialize(entry, fname):
             return False
+        UscanOutput.uscan_verbose(f"{url} is unchanged upstream, copied it from the download cache")
+        return True
 
     def _download_git(self, url, fname, optref, base, pkg_dir, pkg, gitrepo_dir):
         destdir = Path(self.destdir)
@@ -118,76 +292,115 @@ class Downloader:
         pkg_version = re.search(rf"{pkg}-([\d\w.]+)\.tar", fname).group(1) if re.search(rf"{pkg}-([\d\w.]+)\.tar",
                                                                                         fname) else ""
         suffix = Path(fname).suffix.replace('.', '')
+        if suffix == 'tar':
+            # --vcs-export-uncompressed
+            suffix = None
 
         gitrepo, gitref = url.split(maxsplit=1)
         clean = lambda: shutil.rmtree(gitrepo_dir, ignore_errors=True)
 
         if self.git_upstream:
-            self._handle_git_upstream(abs_dst, pkg, pkg_version, gitref)
+            self._handle_git_upstream(abs_dst, pkg, pkg_version, gitref, suffix)
         else:
-            self._handle_git_download(gitrepo, gitref, base, destdir, gitrepo_dir, abs_dst, pkg, pkg_version)
-
-        if suffix:
-            self._compress_tar(abs_dst, pkg, pkg_version, suffix)
+            self._handle_git_download(gitrepo, gitref, base, destdir, gitrepo_dir, abs_dst, pkg, pkg_version, suffix)
 
         clean()
         return True
 
-    def _handle_git_upstream(self, abs_dst, pkg, version, gitref):
+    def _handle_git_upstream(self, abs_dst, pkg, version, gitref, suffix=None):
         if self.git_export_all:
             self._override_git_attributes()
 
-        self._git_archive(gitref, abs_dst, pkg, version)
+        self._git_archive(gitref, abs_dst, pkg, version, suffix=suffix)
         if self.git_export_all:
             self._restore_git_attributes()
 
-    def _handle_git_download(self, gitrepo, gitref, base, destdir, gitrepo_dir, abs_dst, pkg, version):
+    def _handle_git_download(self, gitrepo, gitref, base, destdir, gitrepo_dir, abs_dst, pkg, version, suffix=None):
+        if self.git_mirrors:
+            # info/attributes of the shared mirror is only rewritten under its exclusive lock
+            clone_filter = self.PARTIAL_CLONE_FILTER if self.gitmode == 'partial' else None
+            with self.git_mirrors.use(gitrepo, exclusive=self.git_export_all, clone_filter=clone_filter) as git_dir:
+                self._export_git(gitref, abs_dst, pkg, version, git_dir, suffix)
+            return
+
         if self.gitrepo_state == 0:
             if self.gitmode == 'shallow':
                 self._shallow_git_clone(gitref, base, destdir, gitrepo_dir)
                 self.gitrepo_state = 1
+            elif self.gitmode == 'partial':
+                self._partial_git_clone(base, destdir, gitrepo_dir)
+                self.gitrepo_state = 3
             else:
                 self._full_git_clone(base, destdir, gitrepo_dir)
                 self.gitrepo_state = 2
 
+        # A partial clone fetches the blobs git archive reads on demand
+        self._export_git(gitref, abs_dst, pkg, version, str(destdir / gitrepo_dir), suffix)
+
+    def _export_git(self, gitref, abs_dst, pkg, version, git_dir, suffix=None):
         if self.git_export_all:
-            self._override_git_attributes()
+            self._override_git_attributes(git_dir)
 
-        self._git_archive(gitref, abs_dst, pkg, version, gitrepo_dir)
+        self._git_archive(gitref, abs_dst, pkg, version, git_dir, suffix)
         if self.git_export_all:
-            self._restore_git_attributes()
+            self._restore_git_attributes(git_dir)
 
-    def _override_git_attributes(self):
-        infodir, attr_file, attr_bkp = self._get_git_paths()
+    def _override_git_attributes(self, git_dir=None):
+        infodir, attr_file, attr_bkp = self._get_git_paths(git_dir)
         Path(infodir).mkdir(parents=True, exist_ok=True)
         if attr_file.exists():
             attr_bkp.write_bytes(attr_file.read_bytes())
         with open(attr_file, 'w') as f:
             f.write("* -export-subst\n* -export-ignore\n")
 
-    def _restore_git_attributes(self):
-        infodir, attr_file, attr_bkp = self._get_git_paths()
+    def _restore_git_attributes(self, git_dir=None):
+        infodir, attr_file, attr_bkp = self._get_git_paths(git_dir)
         if attr_bkp.exists():
             attr_file.write_bytes(attr_bkp.read_bytes())
         else:
             attr_file.unlink()
 
-    def _get_git_paths(self):
-        infodir = subprocess.run(["git", "rev-parse", "--git-path", "info/"], capture_output=True,
+    def _get_git_paths(self, git_dir=None):
+        git = ["git", f"--git-dir={git_dir}"] if git_dir else ["git"]
+        infodir = subprocess.run(git + ["rev-parse", "--git-path", "info/"], capture_output=True,
                                  text=True).stdout.strip()
-        attr_file = Path(subprocess.run(["git", "rev-parse", "--git-path", "info/attributes"], capture_output=True,
+        attr_file = Path(subprocess.run(git + ["rev-parse", "--git-path", "info/attributes"], capture_output=True,
                                         text=True).stdout.strip())
         attr_bkp = Path(f"{attr_file}-uscan")
         return infodir, attr_file, attr_bkp
 
-    def _git_archive(self, gitref, abs_dst, pkg, version, gitrepo_dir=None):
-        cmd = [
-            'git', "--git-dir={}".format(gitrepo_dir or ""),
-            'archive', '--format=tar', f"--prefix={pkg}-{version}/",
-            f"--output={abs_dst}/{pkg}-{version}.tar", gitref
+    def _git_archive(self, gitref, abs_dst, pkg, version, gitrepo_dir=None, suffix=None):
+        """
+        Export gitref as {pkg}-{version}.tar[.suffix] in abs_dst.
+
+        git archive is piped straight into the compressor (see Compressor),
+        whose output goes to a temporary file renamed into place once both
+        succeeded: no uncompressed tarball is written to disk.
+        """
+        compressor = Compressor(suffix) if suffix else None
+        tarball = f"{abs_dst}/{pkg}-{version}.tar" + (f".{suffix}" if suffix else "")
+        cmd = ['git'] + ([f"--git-dir={gitrepo_dir}"] if gitrepo_dir else []) + [
+            'archive', '--format=tar', f"--prefix={pkg}-{version}/", gitref
         ]
-        if subprocess.run(cmd).returncode != 0:
-            UscanOutput.uscan_die("git archive failed")
+
+        fd, tmp = Transfer.temporary_file(tarball)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                if compressor:
+                    archive = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+                    compressed = compressor.compress(archive.stdout, out)
+                    archived = archive.wait() == 0
+                else:
+                    archived = compressed = subprocess.run(cmd, stdout=out).returncode == 0
+            # A dead compressor leaves git archive killed by SIGPIPE: report the cause
+            if not compressed:
+                UscanOutput.uscan_die(f"{compressor.name} failed on the output of git archive")
+            if not archived:
+                UscanOutput.uscan_die("git archive failed")
+            os.replace(tmp, tarball)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
 
     def _shallow_git_clone(self, tag, base, destdir, gitrepo_dir):
         tag = tag.replace("refs/tags/", "").replace("refs/heads/", "")
@@ -198,17 +411,6 @@ class Downloader:
         cmd = ['git', 'clone', '--bare', base, str(destdir / gitrepo_dir)]
         subprocess.run(cmd, check=True)
 
-    def _compress_tar(self, abs_dst, pkg, version, suffix):
-        os.chdir(abs_dst)
-        tar_file = f"{pkg}-{version}.tar"
-        if suffix == 'gz':
-            subprocess.run(["gzip", "-n", "-9", tar_file], check=True)
-        elif suffix == 'xz':
-            subprocess.run(["xz", tar_file], check=True)
-        elif suffix == 'bz2':
-            subprocess.run(["bzip2", tar_file], check=True)
-        elif suffix == 'lzma':
-            subprocess.run(["lzma", tar_file], check=True)
-        else:
-            UscanOutput.uscan_die(f"Unknown suffix file to repack: {suffix}")
-        os.chdir(Path.cwd())
+    def _partial_git_clone(self, base, destdir, gitrepo_dir):
+        cmd = ['git', 'clone', '--bare', f"--filter={self.PARTIAL_CLONE_FILTER}", base, str(destdir / gitrepo_dir)]
+        subprocess.run(cmd, check=True)
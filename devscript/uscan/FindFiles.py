@@ -1,31 +1,146 @@
 import os
-import subprocess
-from packaging.version import Version
+import re
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import UscanOutput
+from CacheDir import CacheDir
+from ChangelogCache import ChangelogCache
 from devscript.Versort import Versort
 from debian.changelog import Changelog
 
 
 class FindFiles:
+    # Header line of a changelog entry, as accepted by python-debian
+    CHANGELOG_HEADER = re.compile(r'^(\w[-+0-9a-z.]*) \(([^\(\) \t]+)\)((?:\s+[-+0-9a-z.]+)+);', re.IGNORECASE)
+    _changelog_caches = {}
+
+    @staticmethod
+    def changelog_cache(cache_dir):
+        """Return the process-wide ChangelogCache of cache_dir (None without a cache)."""
+        if not cache_dir:
+            return None
+        if cache_dir not in FindFiles._changelog_caches:
+            FindFiles._changelog_caches[cache_dir] = ChangelogCache(cache_dir)
+        return FindFiles._changelog_caches[cache_dir]
+
     @staticmethod
-    def changelog_parse(file_path='debian/changelog'):
+    def changelog_parse(file_path='debian/changelog', cache_dir=None):
         """
         Parses a Debian changelog file and returns the package name and version.
+        Only the header of the first entry is read; files it doesn't
+        understand are handed to python-debian.
         """
-        with open(file_path, 'r') as changelog_file:
-            changelog = Changelog(changelog_file)
+        cache = FindFiles.changelog_cache(cache_dir)
+        path = os.path.realpath(file_path)
+        st = os.stat(path)
 
-        # Get the first (most recent) entry
-        most_recent_entry = changelog[0]
-
-        package = most_recent_entry.package
-        version = most_recent_entry.version
+        cached = cache.get(path, st) if cache else None
+        if cached:
+            package, version = cached
+        else:
+            package, version = FindFiles._changelog_head(path) or FindFiles._changelog_full(path)
+            if cache:
+                cache.put(path, st, package, version)
 
         return {
             "Source": package,
             "Version": version,
         }
 
+    @staticmethod
+    def _changelog_head(file_path):
+        """Return (package, version) from the first line, or None if it looks unusual."""
+        with open(file_path, 'rb') as changelog_file:
+            line = changelog_file.readline(4096)
+        match = FindFiles.CHANGELOG_HEADER.match(line.decode('utf-8', 'replace'))
+        if not match:
+            return None
+        return match.group(1), match.group(2)
+
+    @staticmethod
+    def _changelog_full(file_path):
+        """Parse the changelog with python-debian (first entry only)."""
+        with open(file_path, 'r') as changelog_file:
+            changelog = Changelog(changelog_file, max_blocks=1)
+
+        # Get the first (most recent) entry
+        most_recent_entry = changelog[0]
+        return most_recent_entry.package, str(most_recent_entry.version)
+
+    # Threads used to walk the source trees; the walk is bound by filesystem latency
+    WALK_JOBS = 16
+
+    @staticmethod
+    def find_debian_dirs(args, jobs=None, cache_dir=None):
+        """
+        Return the sorted paths of all directories named debian below args,
+        following symlinks and pruning .git, without changing directory.
+
+        With cache_dir, the subdirectory list of every visited directory is
+        kept keyed by its mtime, so an unchanged directory is stat()ed but
+        not read again on the next scan.
+        """
+        index_store = CacheDir(os.path.join(cache_dir, 'finddirs')) if cache_dir else None
+        index_key = json.dumps(sorted(os.path.abspath(arg) for arg in args))
+        index = {}
+        if index_store:
+            try:
+                index = json.loads(index_store.read(index_key) or b'{}')
+            except ValueError:
+                index = {}
+        new_index = {}
+        found = []
+        lock = threading.Lock()
+
+        def visit(path, ancestors):
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                UscanOutput.uscan_warn(f"Couldn't access {path}: {e.strerror}, skipping")
+                return []
+            # A symlink back to one of its ancestors would loop forever
+            ident = (st.st_dev, st.st_ino)
+            if ident in ancestors:
+                UscanOutput.uscan_debug(f"File system loop detected at {path}, skipping")
+                return []
+            ancestors = ancestors | {ident}
+
+            abspath = os.path.abspath(path)
+            cached = index.get(abspath)
+            if cached and cached[0] == st.st_mtime_ns:
+                subdirs = cached[1]
+            else:
+                subdirs = []
+                try:
+                    with os.scandir(path) as entries:
+                        for entry in entries:
+                            try:
+                                if entry.name != '.git' and entry.is_dir():
+                                    subdirs.append(entry.name)
+                            except OSError:
+                                continue
+                except OSError as e:
+                    UscanOutput.uscan_warn(f"Couldn't read {path}: {e.strerror}, skipping")
+                    return []
+
+            with lock:
+                new_index[abspath] = [st.st_mtime_ns, subdirs]
+                if os.path.basename(path) == 'debian':
+                    found.append(path)
+            return [(os.path.join(path, name), ancestors) for name in subdirs]
+
+        with ThreadPoolExecutor(max_workers=jobs or FindFiles.WALK_JOBS) as pool:
+            pending = {pool.submit(visit, os.path.normpath(arg), frozenset()) for arg in args}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.update(pool.submit(visit, *subdir) for subdir in future.result())
+
+        if index_store:
+            index_store.write(index_key, json.dumps(new_index).encode())
+        return sorted(found)
+
     @staticmethod
     def find_watch_files(config):
         opwd = os.getcwd()
@@ -48,49 +163,42 @@ class FindFiles:
                         )
 
                 package, debversion, uversion = FindFiles.scan_changelog(config, opwd, die=True)
+                FindFiles.save_changelog_cache(config)
                 return [(os.getcwd(), package, uversion, config.watchfile)]
 
         # when --watchfile is not used, scan watch files
         args = config.args if config.args else ['.']
         UscanOutput.uscan_verbose(f"Scan watch files in {args}")
 
-        # Run find command to locate directories with debian subdirectories
-        find_command = ['find', '-L'] + args + ['-type', 'd', '(', '-name', '.git', '-prune', '-o', '-name', 'debian',
-                                                '-print', ')']
-        result = subprocess.run(find_command, stdout=subprocess.PIPE, text=True)
-        dirs = result.stdout.splitlines()
+        # Locate directories named debian (like find -L ... -name .git -prune -o -name debian -print)
+        dirs = FindFiles.find_debian_dirs(args, cache_dir=getattr(config, 'cache_dir', None))
 
         if not dirs:
             UscanOutput.uscan_die("No debian directories found")
 
         debdirs = []
-        origdir = os.getcwd()
 
-        for dir in dirs:
-            dir = dir.rstrip('/debian')
-
-            try:
-                os.chdir(origdir)
-                os.chdir(dir)
-            except OSError:
-                UscanOutput.uscan_warn(f"Couldn't chdir {dir}, skipping")
-                continue
+        for debian_dir in dirs:
+            dir = os.path.dirname(debian_dir) or '.'
 
             UscanOutput.uscan_verbose(f"Check debian/watch and debian/changelog in {dir}")
 
             # Check for debian/watch file
-            if os.path.isfile('debian/watch'):
-                if not os.path.isfile('debian/changelog'):
+            if os.path.isfile(os.path.join(dir, 'debian/watch')):
+                if not os.path.isfile(os.path.join(dir, 'debian/changelog')):
                     UscanOutput.uscan_warn(f"Problems reading debian/changelog in {dir}, skipping")
                     continue
 
-                package, debversion, uversion = FindFiles.scan_changelog(config, opwd)
-                if not package:
+                scanned = FindFiles.scan_changelog(config, opwd, pkg_dir=dir)
+                if not scanned:
                     continue
+                package, debversion, uversion = scanned
 
                 UscanOutput.uscan_verbose(f'package="{package}" version="{uversion}" (no epoch/revision)')
                 debdirs.append([debversion, dir, package, uversion])
 
+        FindFiles.save_changelog_cache(config)
+
         if not debdirs:
             UscanOutput.uscan_warn("No watch file found")
 
@@ -115,21 +223,29 @@ class FindFiles:
                 UscanOutput.uscan_warn(f"Skipping {dir}/debian/watch as this package has already been found")
                 continue
 
-            try:
-                os.chdir(origdir)
-                os.chdir(dir)
-            except OSError:
-                UscanOutput.uscan_warn(f"Couldn't chdir {dir}, skipping")
+            if not os.path.isdir(dir):
+                UscanOutput.uscan_warn(f"Couldn't access {dir}, skipping")
                 continue
 
             UscanOutput.uscan_verbose(f"{dir}/debian/changelog sets package={package} version={version}")
-            results.append([dir, package, version, "debian/watch", os.getcwd()])
+            results.append([dir, package, version, "debian/watch", os.path.realpath(dir)])
 
-        os.chdir(origdir)
         return results
 
     @staticmethod
-    def scan_changelog(config, opwd, die=False):
+    def save_changelog_cache(config):
+        cache = FindFiles.changelog_cache(getattr(config, 'cache_dir', None))
+        if cache:
+            cache.save()
+
+    @staticmethod
+    def scan_changelog(config, opwd, die=False, pkg_dir=None):
+        """
+        Read package name and version from debian/changelog of pkg_dir
+        (the current directory by default).
+        """
+        pkg_dir = os.path.abspath(pkg_dir) if pkg_dir else os.getcwd()
+
         def error_func(msg):
             if die:
                 UscanOutput.uscan_die(msg)
@@ -139,7 +255,8 @@ class FindFiles:
 
         # Parse changelog
         try:
-            changelog = FindFiles.changelog_parse()
+            changelog = FindFiles.changelog_parse(os.path.join(pkg_dir, 'debian/changelog'),
+                                                  getattr(config, 'cache_dir', None))
         except Exception as e:
             return error_func("Problems parsing debian/changelog")
 
@@ -153,14 +270,14 @@ class FindFiles:
 
         UscanOutput.uscan_verbose(f'package="{package}" version="{debversion}" (as seen in debian/changelog)')
 
-        if config.check_dirname_level == 2 or (config.check_dirname_level == 1 and os.getcwd() != opwd):
+        if config.check_dirname_level == 2 or (config.check_dirname_level == 1 and pkg_dir != opwd):
             re_pattern = config.check_dirname_regex.replace("PACKAGE", package)
-            good_dirname = os.getcwd().startswith(re_pattern) if "/" in re_pattern else os.path.basename(
-                os.getcwd()).startswith(re_pattern)
+            good_dirname = pkg_dir.startswith(re_pattern) if "/" in re_pattern else os.path.basename(
+                pkg_dir).startswith(re_pattern)
 
             if not good_dirname:
                 return error_func(
-                    f"The directory name {os.path.basename(os.getcwd())} doesn't match the requirement of "
+                    f"The directory name {os.path.basename(pkg_dir)} doesn't match the requirement of "
                     f"--check-dirname-level={config.check_dirname_level} --check-dirname-regex={re_pattern}. "
                     "Set --check-dirname-level=0 to disable this sanity check feature."
                 )
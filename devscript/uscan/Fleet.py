@@ -0,0 +1,175 @@
+import io
+import os
+import sys
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import redirect_stdout, redirect_stderr
+from UscanOutput import UscanOutput
+from WatchFile import WatchFile
+from HttpPool import HttpPool
+
+# Configuration inherited by forked workers (set by the pool initializer)
+_worker_config = None
+# Shared flags set by the workers when they start a package, see Fleet._run_pool()
+_worker_started = None
+
+
+def _init_worker(config, started=None):
+    """Pool initializer: keep the parent's configuration in the worker process."""
+    global _worker_config, _worker_started
+    _worker_config = config
+    _worker_started = started
+
+
+def _process_package(index, pkg_dir, package, version, watchfile, capture=True):
+    """
+    Process a single watch file and return (index, status, stdout, stderr, pool stats).
+    A uscan_die() (SystemExit) or unexpected error only fails this package.
+    The pool stats are (pid, HttpPool stats of the whole process so far).
+    """
+    if _worker_started is not None:
+        _worker_started[index] = 1
+    out, err = io.StringIO(), io.StringIO()
+    opwd = os.getcwd()
+    status = 0
+
+    with redirect_stdout(out if capture else sys.stdout), redirect_stderr(err if capture else sys.stderr):
+        try:
+            os.chdir(pkg_dir)
+            watch = WatchFile(_worker_config, package, pkg_dir, version, watchfile)
+            status = watch.status or watch.process_lines()
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                print(e.code if isinstance(e.code, str) else f"{package}: exited with status {e.code}",
+                      file=sys.stderr)
+                status = 1
+        except Exception:
+            print(f"{UscanOutput.progname} warn: {package}: unexpected error\n{traceback.format_exc()}",
+                  file=sys.stderr)
+            status = 1
+        finally:
+            os.chdir(opwd)
+
+    return index, status, out.getvalue(), err.getvalue(), (os.getpid(), HttpPool.instance().stats())
+
+
+class Fleet:
+    def __init__(self, config, jobs=None):
+        """
+        Runs the packages found by FindFiles.find_watch_files on a bounded worker pool.
+        :param config: UscanConfig instance shared by every package.
+        :param jobs: Number of packages processed concurrently (--jobs N).
+        """
+        self.config = config
+        self.jobs = max(1, int(jobs or getattr(config, 'jobs', None) or 1))
+        self.statuses = []
+        # Results waiting for their predecessors to be reported, and the next index to report
+        self._results = {}
+        self._next_index = 0
+        # Latest HttpPool stats of each worker process
+        self._pool_stats = {}
+
+    @staticmethod
+    def _unpack(entry):
+        """Normalize a find_watch_files() entry to (pkg_dir, package, version, watchfile)."""
+        dir, package, version, watchfile = entry[:4]
+        pkg_dir = entry[4] if len(entry) > 4 else os.path.abspath(dir)
+        return pkg_dir, package, version, watchfile
+
+    def run(self, watch_files):
+        """
+        Process every watch file and report per-package results in input order.
+        :param watch_files: List returned by FindFiles.find_watch_files().
+        :return: 1 if any package failed, otherwise 0.
+        """
+        entries = [self._unpack(entry) for entry in watch_files]
+        self.statuses = [0] * len(entries)
+
+        if self.jobs == 1 or len(entries) <= 1:
+            global _worker_config
+            _worker_config = self.config
+            for index, entry in enumerate(entries):
+                _, self.statuses[index], _, _, _ = _process_package(index, *entry, capture=False)
+            HttpPool.instance().report()
+            return 1 if any(self.statuses) else 0
+
+        UscanOutput.uscan_verbose(f"Processing {len(entries)} packages with {self.jobs} jobs")
+        self._results, self._next_index, self._pool_stats = {}, 0, {}
+        pending = list(range(len(entries)))
+        while pending:
+            left = self._run_pool(entries, pending, self.jobs)
+            if left == pending:
+                # No worker could even start a package
+                for index in left:
+                    self._crashed(entries, index)
+                break
+            pending = left
+
+        HttpPool.instance().report(HttpPool.merge(self._pool_stats.values()))
+        return 1 if any(self.statuses) else 0
+
+    def _run_pool(self, entries, indices, jobs):
+        """
+        Process the packages of indices on a fresh pool of jobs workers.
+
+        A worker killed by a signal or the OOM killer breaks the whole
+        ProcessPoolExecutor: every package not finished yet fails with
+        BrokenProcessPool. Those that had not started are returned, to be
+        run on a fresh pool. If one package was running, it is the one that
+        crashed; if several were, each is run again alone to find out.
+        :return: Indices of the packages left to process.
+        """
+        # fork keeps the (unpicklable) configuration and the imported modules in the workers
+        context = multiprocessing.get_context('fork')
+        started = context.RawArray('b', len(entries))
+        broken = []
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=context,
+                                 initializer=_init_worker, initargs=(self.config, started)) as pool:
+            futures = {pool.submit(_process_package, index, *entries[index]): index for index in indices}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    _, status, out, err, (pid, stats) = future.result()
+                    self._pool_stats[pid] = stats
+                except BrokenProcessPool:
+                    broken.append(index)
+                    continue
+                except Exception as e:
+                    status, out, err = 1, '', f"{UscanOutput.progname} warn: {entries[index][1]}: worker failed: {e}\n"
+                self._collect(entries, index, status, out, err)
+
+        suspects = [index for index in sorted(broken) if started[index]]
+        if len(suspects) == 1:
+            self._crashed(entries, suspects[0])
+        else:
+            for index in suspects:
+                if self._run_pool(entries, [index], 1):
+                    # Not even started alone
+                    self._crashed(entries, index)
+        return [index for index in sorted(broken) if not started[index]]
+
+    def _crashed(self, entries, index):
+        err = f"{UscanOutput.progname} warn: {entries[index][1]}: worker process died\n"
+        self._collect(entries, index, 1, '', err)
+
+    def _collect(self, entries, index, status, out, err):
+        """Store the result of one package and report every result whose predecessors are all done."""
+        self._results[index] = (status, out, err)
+        # Flushing in input order keeps the output deterministic
+        while self._next_index in self._results:
+            self._report(self._next_index, entries[self._next_index], *self._results.pop(self._next_index))
+            self._next_index += 1
+
+    def _report(self, index, entry, status, out, err):
+        """Replay the captured output of one package and record its status."""
+        self.statuses[index] = status
+        if out:
+            sys.stdout.write(out)
+            sys.stdout.flush()
+        if err:
+            sys.stderr.write(err)
+            sys.stderr.flush()
+        if status:
+            UscanOutput.uscan_verbose(f"Processing {entry[3]} in {entry[0]} failed with status {status}")
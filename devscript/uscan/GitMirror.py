@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from CacheDir import CacheDir
+from UscanOutput import UscanOutput
+
+
+class GitMirror:
+    """
+    Persistent bare mirrors of upstream git repositories, shared by every
+    package and every run.
+
+    The mirror of a repository lives in <path>/<sha256 of its URL>.git. It
+    is created once with `git clone --mirror` (into a temporary directory
+    renamed into place) and later brought up to date with an incremental
+    `git fetch --prune`, at most once per process. Updates hold an exclusive
+    flock() on the mirror's lock file and readers (describe, log, archive) a
+    shared one, so packages pointing at the same repository never see a
+    half-fetched mirror. Once the mirrors exceed their size bound, the least
+    recently used ones that nobody holds are removed.
+    """
+    DEFAULT_MAX_SIZE = 8192  # MiB
+
+    # URLs whose mirror was already fetched by this process
+    _fresh = set()
+
+    def __init__(self, path, max_size=None):
+        """
+        :param path: Directory holding the mirrors.
+        :param max_size: Size bound in MiB (defaults to DEFAULT_MAX_SIZE).
+        """
+        self.cache = CacheDir(path)
+        self.max_size = (max_size or self.DEFAULT_MAX_SIZE) * 1024 * 1024
+
+    def path(self, url):
+        """Return the git directory of the mirror of url."""
+        return os.path.join(self.cache.path, CacheDir.hash_key(url) + '.git')
+
+    @staticmethod
+    def _lock_name(path):
+        return f".{os.path.basename(path)}.lock"
+
+    @contextmanager
+    def use(self, url, exclusive=False, clone_filter=None):
+        """
+        Bring the mirror of url up to date and hold it while the caller reads it.
+        :param exclusive: Hold the mirror exclusively (the caller changes its configuration).
+        :param clone_filter: Partial clone filter (e.g. 'blob:none') used if the mirror has to be created;
+                             the missing objects are fetched on demand afterwards.
+        :return: Context manager yielding the git directory.
+        """
+        path = self.path(url)
+        while True:
+            if url not in self._fresh or not os.path.isdir(path):
+                with self.cache.lock(self._lock_name(path)):
+                    self._update(url, path, clone_filter)
+                self._fresh.add(url)
+                self.prune(keep=path)
+            with self.cache.lock(self._lock_name(path), shared=not exclusive):
+                # Pruned by another process between the update and now
+                if not os.path.isdir(path):
+                    continue
+                CacheDir.touch(path)
+                yield path
+                return
+
+    def _update(self, url, path, clone_filter=None):
+        if os.path.isdir(path):
+            UscanOutput.uscan_verbose(f"Updating the git mirror of {url}")
+            self._git(['git', f"--git-dir={path}", 'fetch', '--quiet', '--prune', 'origin'])
+            return
+
+        UscanOutput.uscan_verbose(f"Creating a git mirror of {url} in {path}")
+        tmp = tempfile.mkdtemp(dir=self.cache.path, prefix='.tmp-')
+        try:
+            self._git(['git', 'clone', '--quiet', '--mirror'] +
+                      ([f"--filter={clone_filter}"] if clone_filter else []) + [url, tmp])
+            os.rename(tmp, path)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    @staticmethod
+    def _git(command):
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            UscanOutput.uscan_die(f"Error running command {' '.join(command)}: {result.stderr.strip()}")
+
+    @staticmethod
+    def _size(path):
+        total = 0
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except FileNotFoundError:
+                    pass
+        return total
+
+    def prune(self, keep=None):
+        """Remove least recently used mirrors (but keep) until the mirrors fit in max_size."""
+        mirrors = []
+        for name in os.listdir(self.cache.path):
+            path = os.path.join(self.cache.path, name)
+            if name.startswith('.tmp-'):
+                # Leftovers of clones that died before being renamed into place
+                if CacheDir._older_than(path, 24 * 3600):
+                    shutil.rmtree(path, ignore_errors=True)
+            elif name.endswith('.git') and os.path.isdir(path):
+                mirrors.append((os.stat(path).st_mtime, self._size(path), path))
+
+        total = sum(size for _, size, _ in mirrors)
+        for mtime, size, path in sorted(mirrors):
+            if total <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                with self.cache.lock(self._lock_name(path), blocking=False):
+                    UscanOutput.uscan_verbose(f"Removing least recently used git mirror {path}")
+                    shutil.rmtree(path, ignore_errors=True)
+            except BlockingIOError:
+                # In use by another process
+                continue
+            total -= size
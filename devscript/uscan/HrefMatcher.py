@@ -0,0 +1,294 @@
+import re
+from functools import lru_cache
+from UscanUtils import UscanUtils
+from UscanOutput import UscanOutput
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# <a ... href="..."> and <base href="..."> of an HTML page
+HREF_RE = re.compile(r'<\s*a\s+[^>]*(?<=\s)href\s*=\s*["\'](.*?)["\']', re.IGNORECASE)
+BASE_RE = re.compile(r'<\s*base\s+[^>]*href\s*=\s*["\'](.*?)["\']', re.IGNORECASE)
+# Hrefs whose canonical form ends with text taken from the base URL
+_BASE_TAIL_RE = re.compile(r'^(?:[?#;]|//|$)|(?:^|/)\.\.?/*(?:[?#;]|$)')
+
+_SLASH = ord('/')
+_WORD_BYTES = re.compile(rb'\w')
+_WORD = re.compile(r'\w')
+_SLASH_FREE_CATEGORIES = {sre_constants.CATEGORY_DIGIT, sre_constants.CATEGORY_WORD}
+
+
+class HrefMatcher:
+    """
+    Matches the hrefs of an index page against all the patterns of a watch
+    line at once.
+
+    The patterns are compiled once into a single alternation. Before it runs,
+    each href is checked for the literal strings that any match has to
+    contain. Only the filename part of a pattern (after its last possible
+    '/') is used for this, because a relative href only holds that part.
+    An href is canonicalized only once it has passed that check.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = [re.compile(pattern) for pattern in patterns]
+        self.combined = self._combine(patterns)
+        literals = set()
+        for pattern in patterns:
+            required = self.required_literals(pattern)
+            if not required:
+                literals = None
+                break
+            literals.add(required)
+        # Any of these tuples of substrings must all be present in a matching href
+        self.literals = list(literals) if literals else None
+
+    @classmethod
+    @lru_cache(maxsize=64)
+    def for_patterns(cls, patterns):
+        """Return the (cached) matcher of a tuple of patterns."""
+        return cls(patterns)
+
+    @staticmethod
+    def _combine(patterns):
+        if len(patterns) < 2:
+            return None
+        try:
+            combined = re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+        except re.error:  # backreferences, global inline flags...
+            return None
+        # Group numbers are shifted in the alternation
+        if any(re.search(r'\\\d|\(\?P=', pattern) for pattern in patterns):
+            return None
+        return combined
+
+    @classmethod
+    def required_literals(cls, pattern):
+        """
+        Return the literal strings that follow the last element of pattern
+        that could match a '/', as a tuple (empty if nothing can be relied on).
+        """
+        try:
+            parsed = sre_parse.parse(pattern)
+        except (re.error, RecursionError, OverflowError):
+            return ()
+        if parsed.state.flags & re.IGNORECASE:
+            return ()
+
+        literals, current = [], ''
+        for op, av in parsed.data:
+            if op is sre_constants.LITERAL and av != _SLASH:
+                current += chr(av)
+                continue
+            if current:
+                literals.append(current)
+                current = ''
+            if not cls._slash_free(op, av):
+                literals = []
+        if current:
+            literals.append(current)
+        return tuple(literals)
+
+    @classmethod
+    def _slash_free(cls, op, av):
+        """Return True if the regex element (op, av) can never match a '/'."""
+        if op is sre_constants.LITERAL:
+            return av != _SLASH
+        if op is sre_constants.AT:
+            return True
+        if op is sre_constants.IN:
+            if av and av[0][0] is sre_constants.NEGATE:
+                return False
+            for item_op, item_av in av:
+                if item_op is sre_constants.LITERAL and item_av == _SLASH:
+                    return False
+                if item_op is sre_constants.RANGE and item_av[0] <= _SLASH <= item_av[1]:
+                    return False
+                if item_op is sre_constants.CATEGORY and item_av not in _SLASH_FREE_CATEGORIES:
+                    return False
+                if item_op not in (sre_constants.LITERAL, sre_constants.RANGE, sre_constants.CATEGORY):
+                    return False
+            return True
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            return all(cls._slash_free(*item) for item in av[2])
+        if op is sre_constants.SUBPATTERN:
+            # Local flags (e.g. (?i:...)) change what the literals match
+            return not av[1] and all(cls._slash_free(*item) for item in av[3])
+        if op is sre_constants.BRANCH:
+            return all(cls._slash_free(*item) for branch in av[1] for item in branch)
+        return False
+
+    def may_match(self, href):
+        """Cheap check: False if href can not match any of the patterns."""
+        if self.literals is None or _BASE_TAIL_RE.search(href):
+            return True
+        for required in self.literals:
+            if all(literal in href for literal in required):
+                return True
+        return False
+
+    def any_match(self, href):
+        if self.combined is not None:
+            return self.combined.fullmatch(href) is not None
+        return any(pattern.fullmatch(href) for pattern in self.patterns)
+
+    def matches(self, href, canonicalize):
+        """
+        Return the compiled patterns matching href or its canonical form,
+        together with that canonical form and the href priority.
+        :param canonicalize: Function returning the canonical form of href.
+        :return: ([patterns], canonical, priority), or None if nothing matches.
+        """
+        if not self.may_match(href):
+            return None
+        canonical = canonicalize(href)
+        if not (self.any_match(canonical) or self.any_match(href)):
+            return None
+        matched = [pattern for pattern in self.patterns if pattern.fullmatch(href) or pattern.fullmatch(canonical)]
+        return matched, canonical, UscanUtils.get_priority(canonical)
+
+    def search(self, content, canonicalize):
+        """
+        Yield (pattern, canonical href, priority) for every <a href> of content
+        matching one of the patterns, in page order.
+        """
+        return self.scan((UscanUtils.fix_href(match.group(1)) for match in HREF_RE.finditer(content)),
+                         canonicalize)
+
+    def scan(self, hrefs, canonicalize):
+        """Like search(), for an iterable of already extracted hrefs."""
+        for href in hrefs:
+            result = self.matches(href, canonicalize)
+            if result:
+                matched, canonical, priority = result
+                for pattern in matched:
+                    yield pattern, canonical, priority
+
+
+class HrefStream:
+    """
+    Incremental <a href> extractor for pages read in chunks.
+
+    Each fed chunk is scanned up to its last complete tag (the last '>' or
+    newline not followed by an unclosed '<'); the rest is carried over to
+    the next chunk. Memory use is thus bounded by the chunk size plus
+    MAX_CARRY, whatever the size of the page.
+
+    The <base href> is looked for until the first link is seen, as HTML
+    only allows it in the document head.
+    """
+    MAX_CARRY = 1024 * 1024
+
+    def __init__(self):
+        self.carry = ''
+        self.base = None
+        self.links_seen = False
+
+    @staticmethod
+    def _safe_end(buffer):
+        cut = max(buffer.rfind('>'), buffer.rfind('\n')) + 1
+        while cut:
+            lt = buffer.rfind('<', 0, cut)
+            if lt < 0 or buffer.find('>', lt, cut) >= 0:
+                break
+            cut = lt
+        return cut
+
+    def feed(self, text, final=False):
+        """
+        Add a chunk of the page (str).
+        :param final: True for the last chunk, flushing the carried over text.
+        :return: List of the hrefs of the links completed by this chunk.
+        """
+        buffer = self.carry + text
+        cut = len(buffer) if final else self._safe_end(buffer)
+        if len(buffer) - cut > self.MAX_CARRY:
+            UscanOutput.uscan_debug(f"No complete tag in the last {len(buffer) - cut} characters, scanning them anyway")
+            cut = len(buffer)
+        part, self.carry = buffer[:cut], buffer[cut:]
+
+        if self.base is None and not self.links_seen:
+            match = BASE_RE.search(part)
+            if match:
+                self.base = match.group(1)
+        hrefs = [UscanUtils.fix_href(match.group(1)) for match in HREF_RE.finditer(part)]
+        if hrefs:
+            self.links_seen = True
+        return hrefs
+
+
+class PlainMatcher:
+    """
+    Finds the file patterns of a watch line in a plain-text listing
+    (searchmode=plain), like Perl uscan: the part of each pattern after its
+    last '/' is searched anywhere in the body, starting at a word boundary.
+
+    The body is scanned as bytes with the patterns compiled once, so the
+    listing is neither decoded nor split into lines; only the matches are
+    turned into str. The word boundary is checked by hand on each match
+    rather than written as a leading '\\b', which would keep re from
+    skipping ahead to the literal prefix of the pattern; a non-ASCII byte
+    before a match is decoded so that the check agrees with '\\b' on str.
+    Patterns that are not plain ASCII are matched on the decoded body
+    instead, as their bytes would not follow the str semantics of '\\w',
+    character classes or case folding (nor encode at all for surrogates).
+    """
+
+    def __init__(self, patterns, encoding):
+        self.encoding = encoding
+        self.patterns = []
+        for pattern in patterns:
+            pattern = re.sub(r'^.*/', '', pattern)
+            if pattern not in (known for known, _ in self.patterns):
+                regex = re.compile(pattern.encode(encoding) if pattern.isascii() else pattern)
+                self.patterns.append((pattern, regex))
+
+    @classmethod
+    @lru_cache(maxsize=64)
+    def for_patterns(cls, patterns, encoding='utf-8'):
+        """Return the (cached) matcher of a tuple of patterns."""
+        return cls(patterns, encoding)
+
+    def _is_word(self, body, pos):
+        """Return True if the character at pos of body (bytes or str) is a \\w, as in str patterns."""
+        if isinstance(body, str):
+            return _WORD.fullmatch(body, pos, pos + 1) is not None
+        if body[pos] < 0x80:
+            return _WORD_BYTES.fullmatch(body, pos, pos + 1) is not None
+        # Part of a multibyte character: decode the one (at most 4 bytes long) ending at pos + 1
+        char = body[max(0, pos - 3):pos + 1].decode(self.encoding, 'ignore')[-1:]
+        return _WORD.fullmatch(char) is not None
+
+    def _at_boundary(self, body, pos):
+        if pos == 0:
+            return True
+        return self._is_word(body, pos - 1) != (pos < len(body) and self._is_word(body, pos))
+
+    def search(self, body):
+        """
+        Yield (pattern, matched text) for every match in body (bytes),
+        pattern by pattern and in body order.
+        """
+        text = None
+        for pattern, regex in self.patterns:
+            haystack = body
+            if isinstance(regex.pattern, str):
+                if text is None:
+                    text = body.decode(self.encoding, 'replace')
+                haystack = text
+            pos = 0
+            while True:
+                match = regex.search(haystack, pos)
+                if match is None:
+                    break
+                start, end = match.span()
+                if self._at_boundary(haystack, start):
+                    found = match.group()
+                    yield pattern, found if haystack is text else found.decode(self.encoding, 'replace')
+                    pos = end if end > start else start + 1
+                else:
+                    pos = start + 1
@@ -0,0 +1,114 @@
+import json
+import zlib
+from CacheDir import CacheDir
+from UscanOutput import UscanOutput
+
+
+class HttpCache:
+    """
+    Persistent conditional-GET cache for index pages and FTP listings.
+    A stored entry is one zlib-compressed blob: a JSON header with the
+    validators, a NUL byte and the (already content-decoded) body.
+    """
+    DEFAULT_MAX_SIZE = 256  # MiB
+    # Headers of the original response replayed on a 304
+    KEEP_HEADERS = ('ETag', 'Last-Modified', 'Content-Type')
+    # Request headers (lowercase) that may get a 304 answer
+    CONDITIONAL_HEADERS = ('if-none-match', 'if-modified-since')
+    # Streamed pages larger than this are not kept for the cache while they are read
+    MAX_ENTRY_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, path, max_size=None):
+        """
+        :param path: Cache directory.
+        :param max_size: Size bound in MiB (defaults to DEFAULT_MAX_SIZE).
+        """
+        self.store = CacheDir(path, (max_size or self.DEFAULT_MAX_SIZE) * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, url):
+        """Return (meta, body) cached for url, or None."""
+        blob = self.store.read(url)
+        if blob is None:
+            return None
+        try:
+            header, body = zlib.decompress(blob).split(b'\0', 1)
+            meta = json.loads(header)
+        except (zlib.error, ValueError):
+            UscanOutput.uscan_debug(f"Dropping corrupted cache entry for {url}")
+            self.store.delete(url)
+            return None
+        if meta.get('url') != url:
+            return None
+        return meta, body
+
+    @staticmethod
+    def cacheable(response):
+        """Return True if response is a fresh 200 carrying a validator."""
+        return response.status_code == 200 and not getattr(response, 'from_cache', False) and \
+            ('ETag' in response.headers or 'Last-Modified' in response.headers)
+
+    def save(self, url, response, body=None):
+        """
+        Store a 200 response if it carries a validator.
+        :param body: Body of a streamed response, read by the caller (response.content by default).
+        """
+        if not self.cacheable(response):
+            return
+        headers = {h: response.headers[h] for h in self.KEEP_HEADERS if h in response.headers}
+        meta = {'url': url, 'headers': headers, 'encoding': response.encoding}
+        body = response.content if body is None else body
+        self.store.write(url, zlib.compress(json.dumps(meta).encode() + b'\0' + body, 6))
+
+    def request(self, session, method, url, headers=None, **kwargs):
+        """
+        session.request() with revalidation of the cached copy of url.
+        A 304 is turned into the cached 200 response (response.from_cache is True).
+        With stream=True the body is left unread: the caller stores it with
+        save() once it has read it to the end (see Downloader.iter_page()).
+        """
+        if method != 'GET':
+            return session.request(method, url, headers=headers, **kwargs)
+
+        cached = self.load(url)
+        headers = dict(headers or {})
+        if cached:
+            validators = cached[0]['headers']
+            if 'ETag' in validators:
+                headers['If-None-Match'] = validators['ETag']
+            if 'Last-Modified' in validators:
+                headers['If-Modified-Since'] = validators['Last-Modified']
+
+        response = session.request(method, url, headers=headers, **kwargs)
+        response.from_cache = False
+
+        if response.status_code == 304 and not cached:
+            # Validators of a copy this cache no longer holds (evicted, or passed by the caller):
+            # there is nothing to replay, fetch the page itself
+            UscanOutput.uscan_debug(f"{url} not modified but not cached, requesting it again")
+            response.close()
+            headers = {h: v for h, v in headers.items() if h.lower() not in self.CONDITIONAL_HEADERS}
+            response = session.request(method, url, headers=headers, **kwargs)
+            response.from_cache = False
+
+        if response.status_code == 304 and cached:
+            meta, body = cached
+            if kwargs.get('stream'):
+                response.raw.drain_conn()
+            UscanOutput.uscan_verbose(f"{url} not modified, using cached copy")
+            response.status_code = 200
+            response.reason = 'OK (cached)'
+            response.headers.update(meta['headers'])
+            response._content = body
+            response.encoding = meta.get('encoding')
+            response.from_cache = True
+            self.hits += 1
+        elif response.status_code == 200:
+            self.misses += 1
+            if not kwargs.get('stream'):
+                self.save(url, response)
+        return response
+
+    def get(self, session, url, headers=None, **kwargs):
+        return self.request(session, 'GET', url, headers=headers, **kwargs)
@@ -0,0 +1,122 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from UscanOutput import UscanOutput
+
+
+class _HostSizedAdapter(HTTPAdapter):
+    """HTTPAdapter whose per-host connection pools are sized by HttpPool."""
+
+    def __init__(self, pool, **kwargs):
+        self.pool = pool
+        super().__init__(**kwargs)
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        pool_kwargs['maxsize'] = self.pool.maxsize_for(host_params.get('host'))
+        return host_params, pool_kwargs
+
+
+class HttpPool:
+    """
+    Process-wide HTTP connection pool manager.
+    Every session mounted on it shares the same keep-alive connections and
+    TLS sessions, so repeated hits to one upstream reuse warm connections.
+    """
+    DEFAULT_MAXSIZE = 4
+    # Upstreams many watch files point at get larger pools
+    HOST_MAXSIZE = {
+        'github.com': 16,
+        'codeload.github.com': 16,
+        'ftp.gnu.org': 8,
+        'pypi.org': 8,
+        'pypi.python.org': 8,
+        'files.pythonhosted.org': 8,
+    }
+    MAX_HOSTS = 128
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, default_maxsize=None, host_maxsize=None, max_hosts=None):
+        self.default_maxsize = default_maxsize or self.DEFAULT_MAXSIZE
+        self.host_maxsize = dict(self.HOST_MAXSIZE)
+        self.host_maxsize.update(host_maxsize or {})
+        self.adapter = _HostSizedAdapter(self, pool_connections=max_hosts or self.MAX_HOSTS,
+                                         pool_maxsize=self.default_maxsize)
+        self.session = self.mount(requests.Session())
+
+    @classmethod
+    def instance(cls):
+        """Return the pool shared by the whole process."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def maxsize_for(self, host):
+        """Number of connections kept alive for host."""
+        return self.host_maxsize.get((host or '').lower(), self.default_maxsize)
+
+    def set_host_maxsize(self, host, maxsize):
+        self.host_maxsize[host.lower()] = maxsize
+
+    def mount(self, session):
+        """Route all HTTP(S) traffic of session through the shared pools."""
+        session.mount('http://', self.adapter)
+        session.mount('https://', self.adapter)
+        return session
+
+    def new_session(self):
+        """Return a fresh session (own headers/cookies) on the shared pools."""
+        return self.mount(requests.Session())
+
+    def stats(self):
+        """
+        Per-host connection reuse statistics.
+        :return: Dict host -> {'requests', 'connections', 'hits', 'hit_rate'}
+        """
+        stats = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            conn_pool = pools.get(key)
+            if conn_pool is None:
+                continue
+            host = stats.setdefault(f"{key.key_scheme}://{key.key_host}",
+                                    {'requests': 0, 'connections': 0, 'hits': 0, 'hit_rate': 0.0})
+            host['requests'] += conn_pool.num_requests
+            host['connections'] += conn_pool.num_connections
+
+        for host in stats.values():
+            host['hits'] = max(0, host['requests'] - host['connections'])
+            host['hit_rate'] = host['hits'] / host['requests'] if host['requests'] else 0.0
+        return stats
+
+    @staticmethod
+    def merge(all_stats):
+        """Sum the stats() of several processes (e.g. the workers of a fleet run)."""
+        merged = {}
+        for stats in all_stats:
+            for name, host in stats.items():
+                total = merged.setdefault(name, {'requests': 0, 'connections': 0, 'hits': 0, 'hit_rate': 0.0})
+                for key in ('requests', 'connections', 'hits'):
+                    total[key] += host[key]
+        for host in merged.values():
+            host['hit_rate'] = host['hits'] / host['requests'] if host['requests'] else 0.0
+        return merged
+
+    def report(self, stats=None):
+        """
+        Log the connection reuse statistics.
+        :param stats: Statistics to log instead of those of this process (see merge()).
+        """
+        stats = self.stats() if stats is None else stats
+        if not stats:
+            return
+        total_requests = sum(s['requests'] for s in stats.values())
+        total_hits = sum(s['hits'] for s in stats.values())
+        msg = (f"HTTP connection pool: {total_hits}/{total_requests} requests "
+               f"reused a connection ({100 * total_hits / total_requests if total_requests else 0:.1f}%)\n")
+        for host, s in sorted(stats.items()):
+            msg += f"   {host}: {s['hits']}/{s['requests']} ({100 * s['hit_rate']:.1f}%)\n"
+        UscanOutput.uscan_verbose(msg)
@@ -1,16 +1,61 @@
 import os
+import atexit
+import hashlib
 import shutil
 import subprocess
 import tempfile
+import threading
 import re
 from pathlib import Path
-import UscanOutput
+from UscanOutput import UscanOutput
+from CacheDir import CacheDir
+from VerifyPool import VerifyPool
 
 class UscanKeyring:
-    def __init__(self):
+    """
+    Upstream signing keyring of a package (debian/upstream/signing-key.asc).
+
+    Nothing is done until a signature is actually verified: gpg and gpgv
+    are looked up, and the armored key is dearmored for gpgv, on first use.
+    Dearmored keyrings are cached by the sha256 of the armored key, in
+    memory for the process and in <cache-dir>/keyrings across runs, so
+    packages sharing an upstream key and later runs spawn no gpg at all.
+    """
+    ARMORED = 'debian/upstream/signing-key.asc'
+    DEPRECATED = ('debian/upstream/signing-key.pgp', 'debian/upstream-signing-key.pgp')
+    # sha256 of an armored key -> dearmored keyring, for this process
+    _dearmored = {}
+    _tmpdir = None
+
+    def __init__(self, cache_dir=None):
         self.keyring = None
         self.gpghome = None
+        self.gpgv = None
+        self.gpg = None
+        self.cache = CacheDir(os.path.join(cache_dir, 'keyrings')) if cache_dir else None
+        self._prepare_lock = threading.Lock()
 
+    def __bool__(self):
+        """True if the package has an upstream signing key."""
+        return self.keyring is not None or any(Path(k).exists() for k in (self.ARMORED,) + self.DEPRECATED)
+
+    def find_executable(self, executables):
+        """
+        Find the first executable that exists in the system.
+        """
+        for exe in executables:
+            path = shutil.which(exe)
+            if path:
+                return path
+        return None
+
+    def prepare(self):
+        """Find gpg/gpgv and set up the keyring for gpgv, once."""
+        with self._prepare_lock:
+            if not self.keyring:
+                self._prepare()
+
+    def _prepare(self):
         # Check if gpgv and gpg are available
         self.gpgv = self.find_executable(['gpgv2', 'gpgv'])
         self.gpg = self.find_executable(['gpg2', 'gpg'])
@@ -23,63 +68,96 @@ class UscanKeyring:
         # Handle deprecated binary keyrings and convert them if necessary
         self.handle_keyring()
 
-    def find_executable(self, executables):
-        """
-        Find the first executable that exists in the system.
-        """
-        for exe in executables:
-            path = shutil.which(exe)
-            if path:
-                return path
-        return None
-
     def handle_keyring(self):
         """
         Handle deprecated binary keyrings and convert them to armored format if necessary.
         """
-        keyring_path = Path('debian/upstream/signing-key.asc')
+        keyring_path = Path(self.ARMORED)
 
         # Check if armored key exists
         if keyring_path.exists():
-            self.keyring = str(keyring_path)
+            armored = str(keyring_path)
         else:
+            armored = None
             # Look for deprecated binary keyrings
-            deprecated_keyrings = [
-                'debian/upstream/signing-key.pgp',
-                'debian/upstream-signing-key.pgp'
-            ]
-            binkeyring = next((k for k in deprecated_keyrings if Path(k).exists()), None)
+            binkeyring = next((k for k in self.DEPRECATED if Path(k).exists()), None)
 
             if binkeyring:
                 os.makedirs('debian/upstream', mode=0o700, exist_ok=True)
                 UscanOutput.uscan_verbose(f"Found upstream binary signing keyring: {binkeyring}")
 
                 # Convert to armored key
-                self.keyring = 'debian/upstream/signing-key.asc'
+                armored = self.ARMORED
                 UscanOutput.uscan_warn(
                     f"Found deprecated binary keyring ({binkeyring}). "
-                    f"Please save it in armored format in {self.keyring}. "
-                    "For example:\n   gpg --output {self.keyring} --enarmor {binkeyring}"
+                    f"Please save it in armored format in {armored}. "
+                    f"For example:\n   gpg --output {armored} --enarmor {binkeyring}"
                 )
 
                 # Convert binary keyring to armored format
                 self.spawn_gpg_command([
                     self.gpg, '--homedir', '/dev/null', '--no-options', '-q', '--batch',
-                    '--no-default-keyring', '--output', self.keyring, '--enarmor', binkeyring
+                    '--no-default-keyring', '--output', armored, '--enarmor', binkeyring
                 ])
-                UscanOutput.uscan_warn(f"Generated upstream signing keyring: {self.keyring}")
+                UscanOutput.uscan_warn(f"Generated upstream signing keyring: {armored}")
                 shutil.move(binkeyring, f"{binkeyring}.backup")
                 UscanOutput.uscan_verbose(f"Renamed upstream binary signing keyring: {binkeyring}.backup")
 
         # Convert armored key to binary for use by gpgv
-        if self.keyring and self.keyring.endswith('.asc'):
-            self.gpghome = tempfile.mkdtemp()
-            new_keyring = os.path.join(self.gpghome, 'trustedkeys.gpg')
+        if armored:
+            self.keyring = self.dearmor(armored)
+            self.gpghome = os.path.dirname(self.keyring)
+
+    def dearmor(self, armored):
+        """Return a binary keyring for the armored key file, from the caches if possible."""
+        with open(armored, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+
+        known = self._dearmored.get(digest)
+        if known and os.path.exists(known):
+            return known
+        if self.cache:
+            cached = self.cache.key_path(digest, '.gpg')
+            if os.path.exists(cached):
+                UscanOutput.uscan_verbose(f"Using the cached dearmored keyring of {armored}")
+                self.cache.touch(cached)
+                self._dearmored[digest] = cached
+                return cached
+
+        with tempfile.TemporaryDirectory() as gpghome:
+            new_keyring = os.path.join(gpghome, 'trustedkeys.gpg')
             self.spawn_gpg_command([
-                self.gpg, '--homedir', self.gpghome, '--no-options', '-q', '--batch',
-                '--no-default-keyring', '--output', new_keyring, '--dearmor', self.keyring
+                self.gpg, '--homedir', gpghome, '--no-options', '-q', '--batch',
+                '--no-default-keyring', '--output', new_keyring, '--dearmor', armored
             ])
-            self.keyring = new_keyring
+            if self.cache:
+                keyring = self.cache.write_file(digest, new_keyring, '.gpg')
+            else:
+                # Removed when the process exits
+                keyring = os.path.join(self._private_dir(), f"{digest}.gpg")
+                shutil.copyfile(new_keyring, keyring)
+        self._dearmored[digest] = keyring
+        return keyring
+
+    @classmethod
+    def _private_dir(cls):
+        if cls._tmpdir is None:
+            cls._tmpdir = tempfile.mkdtemp(prefix='uscan-keyrings-')
+            atexit.register(shutil.rmtree, cls._tmpdir, True)
+        return cls._tmpdir
+
+    def submit(self, check, *args):
+        """
+        Run one of verify, verifyv or verify_git on the VerifyPool.
+        :return: Future, raising (uscan_die) if the signature did not verify.
+        """
+        return VerifyPool.instance().submit(args[-1], getattr(self, check), *args)
+
+    def stream_verifier(self, sigfile, label=None):
+        """Start a StreamVerification of the data to be fed against the detached signature sigfile."""
+        self.prepare()
+        UscanOutput.uscan_verbose(f"Verifying OpenPGP signature {sigfile} while downloading {label or 'the file'}")
+        return StreamVerification(self.gpgv, self.keyring, sigfile)
 
     def spawn_gpg_command(self, command):
         """
@@ -94,6 +172,7 @@ class UscanKeyring:
         Verifies the OpenPGP signature of a file using gpgv and extracts the signature.
         """
         UscanOutput.uscan_verbose(f"Verifying OpenPGP self-signature of {newfile} and extracting {sigfile}")
+        self.prepare()
 
         result = subprocess.run([
             self.gpgv, '--homedir', self.gpghome, '--keyring', self.keyring, '-o', sigfile, newfile
@@ -107,6 +186,7 @@ class UscanKeyring:
         Verifies the OpenPGP signature of a file using gpgv.
         """
         UscanOutput.uscan_verbose(f"Verifying OpenPGP signature {sigfile} for {base}")
+        self.prepare()
 
         result = subprocess.run([
             self.gpgv, '--homedir', '/dev/null', '--keyring', self.keyring, sigfile, base
@@ -119,24 +199,29 @@ class UscanKeyring:
         """
         Verifies a GPG-signed Git tag by checking the signature of the tag in the Git repository.
         """
+        self.prepare()
         commit = self.git_show_ref(gitdir, tag, git_upstream)
         file_content = self.git_cat_file(gitdir, commit, git_upstream)
         signature, text = self.extract_signature(file_content)
 
-        with tempfile.TemporaryDirectory() as tempdir:
-            sigfile_path = os.path.join(tempdir, 'sig')
-            txtfile_path = os.path.join(tempdir, 'txt')
-
-            with open(sigfile_path, 'w') as sigfile, open(txtfile_path, 'w') as txtfile:
-                txtfile.write(text)
-                sigfile.write(signature)
-
-            result = subprocess.run([
-                self.gpgv, '--homedir', self.gpghome, '--keyring', self.keyring, sigfile_path, txtfile_path
-            ], capture_output=True)
-
-            if result.returncode != 0:
-                UscanOutput.uscan_die("OpenPGP signature did not verify.")
+        # The signature goes through a pipe and the signed text through stdin
+        sig_read, sig_write = os.pipe()
+        try:
+            process = subprocess.Popen([
+                self.gpgv, '--homedir', self.gpghome, '--keyring', self.keyring, f"/dev/fd/{sig_read}", '-'
+            ], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, pass_fds=(sig_read,))
+        finally:
+            os.close(sig_read)
+        # gpgv reads the whole signature before the data
+        with os.fdopen(sig_write, 'wb') as sig:
+            try:
+                sig.write(signature.encode())
+            except BrokenPipeError:
+                pass
+        process.communicate(text.encode())
+
+        if process.returncode != 0:
+            UscanOutput.uscan_die("OpenPGP signature did not verify.")
 
     def git_show_ref(self, gitdir, tag, git_upstream=False):
         """
@@ -177,3 +262,52 @@ class UscanKeyring:
         text = match.group(1)
         signature = match.group(2)
         return signature, text
+
+
+class StreamVerification:
+    """
+    gpgv checking a detached signature against data written to its stdin.
+
+    Used as a Transfer sink: the downloaded bytes are piped to gpgv as they
+    are written to disk, so the file is never read back for verification
+    and the result is ready when the download ends.
+    """
+
+    def __init__(self, gpgv, keyring, sigfile):
+        self.sigfile = sigfile
+        self.process = subprocess.Popen([gpgv, '--homedir', '/dev/null', '--keyring', keyring, sigfile, '-'],
+                                        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL)
+        self.complete = False
+        self.broken = False
+
+    def update(self, data):
+        if self.broken:
+            return
+        try:
+            self.process.stdin.write(data)
+        except BrokenPipeError:
+            # gpgv gave up early (bad signature file...): result() reports it
+            self.broken = True
+
+    def close(self):
+        """End of the data: the verification can complete."""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            self.broken = True
+        self.complete = True
+
+    def abort(self):
+        """The transfer failed: drop this verification."""
+        self.process.kill()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.wait()
+
+    def result(self):
+        """Wait for gpgv (uscan_die if the signature did not verify)."""
+        if self.process.wait() != 0 or self.broken:
+            UscanOutput.uscan_die("OpenPGP signature did not verify.")
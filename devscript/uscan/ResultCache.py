@@ -0,0 +1,47 @@
+import json
+import hashlib
+from CacheDir import CacheDir
+
+
+class ResultCache:
+    """
+    Persistent memo of watch line search results.
+    The key covers the watch line, its mangle rules and a hash of the page
+    that was searched, so an unchanged page yields the previous
+    (newversion, newfile, upstream_url, newfile_base) without re-running
+    href extraction, pattern matching, mangling and sorting.
+    """
+    SCHEMA = 1
+    DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+    MANGLES = ('pagemangle', 'uversionmangle', 'dirversionmangle', 'downloadurlmangle', 'filenamemangle',
+               'versionmangle')
+
+    def __init__(self, path, max_size=None):
+        self.store = CacheDir(path, max_size or self.DEFAULT_MAX_SIZE)
+
+    @classmethod
+    def make_key(cls, line, rules, page, extra=None):
+        """
+        :param line: Watch line text.
+        :param rules: Dict of mangle rule lists (and other options) affecting the result.
+        :param page: Fetched page (bytes), or its sha256 hexdigest (str).
+        :param extra: Any other JSON-serializable input of the search.
+        """
+        digest = page if isinstance(page, str) else hashlib.sha256(page).hexdigest()
+        return json.dumps([cls.SCHEMA, line, rules, digest, extra],
+                          sort_keys=True, default=str)
+
+    def get(self, key):
+        data = self.store.read(key)
+        if data is None:
+            return None
+        try:
+            entry = json.loads(data)
+        except ValueError:
+            self.store.delete(key)
+            return None
+        return entry if entry.get('key') == key else None
+
+    def put(self, key, **result):
+        result['key'] = key
+        self.store.write(key, json.dumps(result).encode())
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from CacheDir import CacheDir
+from UscanOutput import UscanOutput
+
+
+class SignatureProbe:
+    """
+    Looks for the usual OpenPGP signature files next to an upstream tarball
+    (pgpmode=default/auto).
+
+    The HEAD requests for all the suffixes are sent at once, from a small
+    process-wide thread pool, as soon as the tarball URL is known; their
+    answers are collected after the tarball download. When none of them
+    finds a signature, the upstream directory is remembered as unsigned
+    for NEGATIVE_TTL seconds, and later runs skip the probes for it.
+    """
+    SUFFIXES = ('asc', 'gpg', 'pgp', 'sig', 'sign')
+    NEGATIVE_TTL = 7 * 24 * 3600
+    MAX_WORKERS = 8
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, session, cache_dir=None, timeout=None):
+        """
+        :param session: requests session the probes are sent with.
+        :param cache_dir: Root of the persistent caches, None to not remember unsigned directories.
+        """
+        self.session = session
+        self.timeout = timeout
+        self.store = CacheDir(os.path.join(cache_dir, 'signatures')) if cache_dir else None
+
+    @classmethod
+    def executor(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=cls.MAX_WORKERS, thread_name_prefix='uscan-sig')
+            return cls._executor
+
+    @staticmethod
+    def directory(url):
+        return url.rsplit('/', 1)[0] + '/'
+
+    def known_unsigned(self, url):
+        """Return True if the directory of url was found without signatures less than NEGATIVE_TTL ago."""
+        if not self.store:
+            return False
+        data = self.store.read(self.directory(url))
+        if data is None:
+            return False
+        try:
+            entry = json.loads(data)
+        except ValueError:
+            return False
+        return entry.get('dir') == self.directory(url) and time.time() - entry.get('time', 0) < self.NEGATIVE_TTL
+
+    def remember_unsigned(self, url):
+        if self.store:
+            entry = {'dir': self.directory(url), 'time': time.time()}
+            self.store.write(self.directory(url), json.dumps(entry).encode())
+
+    def _exists(self, url):
+        """HEAD url: True if it exists, False if not, None on a network error."""
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+            response.close()
+            return response.ok
+        except requests.RequestException as e:
+            UscanOutput.uscan_debug(f"HEAD {url} failed: {e}")
+            return None
+
+    def start(self, url):
+        """
+        Start probing the signature URLs of url in the background.
+        :return: Handle to pass to first_found().
+        """
+        if self.known_unsigned(url):
+            UscanOutput.uscan_verbose(f"No OpenPGP signatures in {self.directory(url)} at the last check, "
+                                      "not probing again")
+            return []
+        pool = self.executor()
+        return [(suffix, pool.submit(self._exists, f"{url}.{suffix}")) for suffix in self.SUFFIXES]
+
+    def first_found(self, url, probes):
+        """
+        Wait for the probes started by start(url).
+        :return: The first suffix (in SUFFIXES order) with a signature, or None.
+        """
+        failed = False
+        for index, (suffix, future) in enumerate(probes):
+            found = future.result()
+            if found:
+                for _, pending in probes[index + 1:]:
+                    pending.cancel()
+                return suffix
+            if found is None:
+                failed = True
+        if probes and not failed:
+            self.remember_unsigned(url)
+        return None
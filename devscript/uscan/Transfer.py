@@ -0,0 +1,249 @@
+import os
+import re
+import json
+import time
+import secrets
+import requests
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError
+from UscanOutput import UscanOutput
+
+_CONTENT_RANGE_RE = re.compile(r'bytes\s+(\d+)-\d+/(?:\d+|\*)$')
+
+
+class Transfer:
+    """
+    Copies the body of a stream=True response to a file.
+
+    The body is read straight into a reusable bytearray, whose size grows
+    from MIN_BUFFER up to MAX_BUFFER while reads keep filling it, and each
+    read is handed straight to an unbuffered file. The data goes to a
+    partial file next to the target (preallocated from Content-Length
+    where the platform allows it) which is renamed into place only once
+    the whole body has arrived, so a failed transfer never leaves a
+    half-written file behind.
+
+    A resumable transfer writes to <target>.part. If it fails and the
+    response carried a validator, <target>.part.meta records the URL, the
+    validator and the size actually written, so that the next attempt can
+    ask for the rest with Range/If-Range (see resume_point()). The meta
+    file is only written once the part file has been truncated to its
+    real size: after a hard kill there is none, and the download starts
+    over.
+    """
+    MIN_BUFFER = 64 * 1024
+    MAX_BUFFER = 4 * 1024 * 1024
+    PART_SUFFIX = '.part'
+    META_SUFFIX = '.part.meta'
+
+    def __init__(self, response, url=None, offset=0, sinks=()):
+        """
+        :param offset: Bytes of the part file that this (206) response continues.
+        :param sinks: Objects whose update() is fed the whole file as it is written
+                      (Checksums, StreamVerification...).
+        """
+        self.response = response
+        self.url = url or response.url
+        self.offset = offset
+        self.sinks = [sink for sink in sinks if sink is not None]
+        self.size = 0
+        self.elapsed = 0.0
+
+    def expected_size(self):
+        """Return the body size announced by the server, or None if unknown or content-encoded."""
+        headers = self.response.headers
+        if headers.get('Content-Encoding', 'identity') != 'identity':
+            return None
+        length = headers.get('Content-Length', '')
+        return int(length) if length.isdigit() else None
+
+    @staticmethod
+    def validator(response):
+        """Return the If-Range validator of a response: strong ETag, else Last-Modified, else None."""
+        if response.headers.get('Content-Encoding', 'identity') != 'identity' or \
+                response.headers.get('Accept-Ranges', '').lower() == 'none':
+            return None
+        etag = response.headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return response.headers.get('Last-Modified')
+
+    @staticmethod
+    def range_start(response):
+        """Return the first byte position of a 206 response, or None."""
+        match = _CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+        return int(match.group(1)) if match else None
+
+    @classmethod
+    def resume_point(cls, fname, url):
+        """
+        Return (offset, validator) to resume the download of url into fname,
+        or (0, None) if there is nothing usable to resume from.
+        """
+        try:
+            with open(fname + cls.META_SUFFIX) as f:
+                meta = json.load(f)
+            size = os.stat(fname + cls.PART_SUFFIX).st_size
+        except (OSError, ValueError):
+            return 0, None
+        if meta.get('url') != url or meta.get('size') != size or not meta.get('validator') or not size:
+            return 0, None
+        return size, meta['validator']
+
+    @classmethod
+    def discard(cls, fname):
+        """Remove the partial download of fname, if any."""
+        for suffix in (cls.META_SUFFIX, cls.PART_SUFFIX):
+            cls._unlink(fname + suffix)
+
+    @classmethod
+    def temporary_file(cls, fname):
+        """
+        Create a hidden temporary file next to fname, to be renamed onto it once written.
+        Unlike mkstemp() files (0600) it is created 0666 less the umask, like fname would be.
+        :return: (fd, path)
+        """
+        directory, base = os.path.split(os.path.abspath(fname))
+        while True:
+            tmp = os.path.join(directory, f".{base}.{secrets.token_hex(4)}{cls.PART_SUFFIX}")
+            try:
+                return os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), tmp
+            except FileExistsError:
+                continue
+
+    @staticmethod
+    def _preallocate(fd, size):
+        if not size or not hasattr(os, 'posix_fallocate'):
+            return
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            # Not supported by the filesystem: the file simply grows as it is written
+            pass
+
+    def _feed_prefix(self, part):
+        """Feed the sinks with the bytes of part this transfer resumes after."""
+        buffer = bytearray(self.MIN_BUFFER * 16)
+        view = memoryview(buffer)
+        remaining = self.offset
+        with open(part, 'rb', buffering=0) as f:
+            while remaining > 0:
+                read = f.readinto(view[:min(remaining, len(buffer))])
+                if not read:
+                    break
+                for sink in self.sinks:
+                    sink.update(view[:read])
+                remaining -= read
+
+    def _copy(self, raw, out):
+        # Reading raw bypasses iter_content(), which maps these to requests exceptions
+        try:
+            self._copy_raw(raw, out)
+        except ProtocolError as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        except DecodeError as e:
+            raise requests.exceptions.ContentDecodingError(e)
+        except ReadTimeoutError as e:
+            raise requests.exceptions.ConnectionError(e)
+
+    def _copy_raw(self, raw, out):
+        buffer = bytearray(self.MIN_BUFFER)
+        view = memoryview(buffer)
+        while True:
+            read = raw.readinto(view)
+            if not read:
+                return
+            written = 0
+            while written < read:
+                written += out.write(view[written:read])
+            for sink in self.sinks:
+                sink.update(view[:read])
+            self.size += read
+            if read == len(buffer) and len(buffer) < self.MAX_BUFFER:
+                view.release()
+                buffer = bytearray(len(buffer) * 2)
+                view = memoryview(buffer)
+
+    def save(self, fname, resumable=False):
+        """
+        Write the body to fname.
+        :param resumable: Write through <fname>.part and keep it after a failure.
+                          Otherwise a private temporary file is used and removed.
+        :return: True on success; False (with a warning) on a short body.
+        Connection errors are raised as the requests exceptions they are.
+        """
+        expected = self.expected_size()
+        raw = self.response.raw
+        # Undo any Content-Encoding, as iter_content() did
+        raw.decode_content = True
+
+        if resumable:
+            tmp = fname + self.PART_SUFFIX
+            # Stale until this transfer records where it stopped
+            self._unlink(fname + self.META_SUFFIX)
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT, 0o666)
+        else:
+            fd, tmp = self.temporary_file(fname)
+        start = time.monotonic()
+        complete = False
+        try:
+            with os.fdopen(fd, 'wb', buffering=0) as out:
+                out.truncate(self.offset)
+                out.seek(self.offset)
+                if self.offset and self.sinks:
+                    self._feed_prefix(tmp)
+                if expected:
+                    self._preallocate(out.fileno(), self.offset + expected)
+                try:
+                    self._copy(raw, out)
+                finally:
+                    out.truncate(self.offset + self.size)
+                if expected is not None and self.size != expected:
+                    UscanOutput.uscan_warn(f"Downloading\n  {self.url} failed: got {self.size} bytes "
+                                           f"out of {expected}")
+                    return False
+            os.replace(tmp, fname)
+            complete = True
+        finally:
+            self.response.close()
+            if not complete and resumable:
+                self._keep_partial(fname, tmp)
+            elif not complete:
+                self._unlink(tmp)
+
+        self.elapsed = time.monotonic() - start
+        if self.offset:
+            UscanOutput.uscan_verbose(f"Resumed {self.url} at {self.offset} bytes")
+        UscanOutput.uscan_verbose(f"Downloaded {self.url}: {self.size} bytes in {self.elapsed:.2f}s "
+                                  f"({self.rate()})")
+        return True
+
+    def _keep_partial(self, fname, part):
+        validator = self.validator(self.response)
+        size = self.offset + self.size
+        if not validator or not size:
+            self._unlink(part)
+            return
+        meta = {'url': self.url, 'validator': validator, 'size': size}
+        try:
+            with open(fname + self.META_SUFFIX, 'w') as f:
+                json.dump(meta, f)
+        except OSError:
+            self._unlink(part)
+            return
+        UscanOutput.uscan_verbose(f"Kept {size} bytes of {self.url} in {part} to resume later")
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def rate(self):
+        """Human-readable throughput of the transfer."""
+        speed = self.size / self.elapsed if self.elapsed else 0
+        for unit in ('B/s', 'KiB/s', 'MiB/s'):
+            if speed < 1024:
+                return f"{speed:.1f} {unit}"
+            speed /= 1024
+        return f"{speed:.1f} GiB/s"
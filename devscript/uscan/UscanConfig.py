@@ -2,6 +2,7 @@ import sys
 import os
 from devscript.DevConfig import DevConfig
 import UscanOutput
+from CacheDir import CacheDir
 
 
 class UscanConfig(DevConfig):
@@ -15,21 +16,30 @@ class UscanConfig(DevConfig):
     def __init__(self):
         super().__init__()
         self.bare = None
+        self.cache_dir = None
         self.check_dirname_level = None
         self.check_dirname_regex = None
         self.compression = None
+        self.compress_threads = None
         self.copyright_file = None
         self.destdir = None
         self.download = None
         self.download_current_version = None
+        self.download_cache_size = None
         self.download_debversion = None
         self.download_version = None
         self.exclusion = None
+        self.git_describe_depth = None
+        self.git_mirror_size = None
         self.log = None
+        self.log_digest = None
         self.orig = None
         self.package = None
         self.pasv = None
         self.http_header = {}
+        self.http_cache_size = None
+        self.jobs = None
+        self.max_page_size = None
         self.repack = None
         self.safe = None
         self.signature = None
@@ -49,6 +59,15 @@ class UscanConfig(DevConfig):
             ['destdir=s', 'USCAN_DESTDIR', lambda self, val: (setattr(self, 'destdir', val) if os.path.isdir(val) else (0, f"The directory to store downloaded files: {val}"))],
             ['exclusion!', 'USCAN_EXCLUSION', 'bool', 1],
             ['timeout=i', 'USCAN_TIMEOUT', r'^\d+$', 20],
+            ['jobs=i', 'USCAN_JOBS', r'^[1-9]\d*$', 1],
+            ['compress-threads=i', 'USCAN_COMPRESS_THREADS', r'^\d+$', 1],
+            ['cache-dir=s', 'USCAN_CACHE_DIR', None, CacheDir.default_root()],
+            ['no-cache', None, lambda self: setattr(self, 'cache_dir', None)],
+            ['http-cache-size=i', 'USCAN_HTTP_CACHE_SIZE', r'^\d+$', 256],
+            ['max-page-size=i', 'USCAN_MAX_PAGE_SIZE', r'^[1-9]\d*$', 64],
+            ['download-cache-size=i', 'USCAN_DOWNLOAD_CACHE_SIZE', r'^\d+$', 2048],
+            ['git-mirror-size=i', 'USCAN_GIT_MIRROR_SIZE', r'^\d+$', 8192],
+            ['git-describe-depth=i', 'USCAN_GIT_DESCRIBE_DEPTH', r'^[1-9]\d*$', 1024],
             ['user-agent|useragent=s', 'USCAN_USER_AGENT', r'\w+', lambda self: self.default_user_agent],
             ['repack', 'USCAN_REPACK', 'bool'],
             ['bare', None, 'bool', 0],
@@ -58,6 +77,7 @@ class UscanConfig(DevConfig):
             ['download-version=s'],
             ['download-debversion|dversion=s'],
             ['log', None, 'bool'],
+            ['log-digest=s', 'USCAN_LOG_DIGEST', r'^(?:md5|sha256|blake2b)$', 'md5'],
             ['package=s'],
             ['uversion|upstream-version=s'],
             ['vcs-export-uncompressed', 'USCAN_VCS_EXPORT_UNCOMPRESSED', 'bool'],
@@ -174,9 +194,44 @@ class UscanConfig(DevConfig):
         --no-symlink   Don’t rename nor repack upstream tarball
         --timeout N    Specifies how much time, in seconds, we give remote
                        servers to respond (default 20 seconds)
+        --jobs N       Process up to N packages concurrently; the output of
+                       each package is still reported in order (default 1)
+        --compress-threads N
+                       Threads used to compress VCS exports and given to
+                       the xz/zstd of mk-origtargz; 0 shares the CPUs among
+                       the --jobs (default 1). Only with 1 are the tarballs
+                       the same bytes on every machine: the multi-threaded
+                       compressors write different output
+        --cache-dir DIR
+                       Directory of the persistent caches
+                       (default: $XDG_CACHE_HOME/uscan)
+        --no-cache     Don’t use the persistent caches
+        --http-cache-size N
+                       Maximum size in MiB of the cache of upstream index
+                       pages, revalidated with ETag/Last-Modified (default 256)
+        --max-page-size N
+                       Give up on upstream index pages larger than N MiB
+                       (default 64)
+        --download-cache-size N
+                       Maximum size in MiB of the cache of downloaded files,
+                       reused while upstream serves them unchanged
+                       (default 2048)
+        --git-mirror-size N
+                       Maximum size in MiB of the local mirrors of upstream
+                       git repositories, updated with incremental fetches;
+                       0 clones into a temporary directory instead
+                       (default 8192)
+        --git-describe-depth N
+                       Deepen shallow clones up to N commits to find the
+                       tag git describe needs, then fetch the whole history;
+                       only without mirrors (--git-mirror-size 0), as a mirror
+                       always holds the whole history (default 1024)
         --user-agent, --useragent
                        Override the default user agent string
         --log          Record md5sum changes of repackaging
+        --log-digest ALGO
+                       Digest recorded by --log: md5 (default), sha256
+                       or blake2b
         --help         Show this message
         --version      Show version information
 
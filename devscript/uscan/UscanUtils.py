@@ -1,5 +1,9 @@
 import re
-import UscanOutput
+from UscanOutput import UscanOutput
+
+_PRIORITY_RE = re.compile(r'\.tar\.(gz|bz2|lzma|xz)', re.IGNORECASE)
+_PRIORITIES = {'gz': 1, 'bz2': 2, 'lzma': 3, 'xz': 4}
+
 
 class UscanUtils:
     @staticmethod
@@ -114,18 +118,13 @@ class UscanUtils:
     def get_priority(href):
         """
         Determines the priority based on the file extension.
-        Equivalent to Perl's get_priority subroutine.
+        Equivalent to Perl's get_priority subroutine (.tar.gz wins over
+        .tar.bz2, then .tar.lzma and .tar.xz), with a single regex search.
         """
-        priority = 0
-        if re.search(r'\.tar\.gz', href, re.IGNORECASE):
-            priority = 1
-        elif re.search(r'\.tar\.bz2', href, re.IGNORECASE):
-            priority = 2
-        elif re.search(r'\.tar\.lzma', href, re.IGNORECASE):
-            priority = 3
-        elif re.search(r'\.tar\.xz', href, re.IGNORECASE):
-            priority = 4
-        return priority
+        found = _PRIORITY_RE.findall(href)
+        if not found:
+            return 0
+        return min(_PRIORITIES[suffix.lower()] for suffix in found)
 
     @staticmethod
     def quoted_regex_parse(pattern):
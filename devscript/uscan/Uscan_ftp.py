@@ -1,9 +1,8 @@
 import re
-import requests
 from UscanOutput import UscanOutput
 from UscanUtils import UscanUtils
 from Uscan_xtp import Uscan_xtp
-from devscript import Versort
+from devscript.Versort import Versort
 
 class Uscan_ftp:
     def __init__(self, parse_result, downloader, search_result, uversionmangle, watchfile, line, shared=None, versionmode='ignore'):
@@ -26,7 +25,7 @@ class Uscan_ftp:
         UscanOutput.uscan_verbose(f"Requesting URL:\n   {self.parse_result['base']}")
 
         # Perform the GET request to the FTP site
-        response = requests.get(self.parse_result['base'])
+        response = self.downloader.get_page(self.parse_result['base'])
         if response.status_code != 200:
             UscanOutput.uscan_warn(
                 f"In watch file {self.watchfile}, reading FTP directory\n  {self.parse_result['base']} failed: {response.status_code}"
@@ -126,7 +125,7 @@ class Uscan_ftp:
 
         # Request the content of the directory
         base = f"{site}{dir}"
-        response = requests.get(base)
+        response = downloader.get_page(base)
         if response.status_code != 200:
             UscanOutput.uscan_warn(f"In watch file {watchfile}, reading webpage\n  {base} failed: {response.status_code}")
             return ''
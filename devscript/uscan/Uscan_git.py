@@ -8,7 +8,7 @@ from Uscan_vcs import Uscan_vcs
 
 class Uscan_git:
     def __init__(self, versionless, parse_result, search_result, gitrepo_dir, uversionmangle, watchfile, line, mode,
-                 downloader, pretty='describe', gitmode='full', date='iso'):
+                 downloader, pretty='describe', gitmode='full', date='iso', shared=None):
         """
         Initializes the Uscan_git class with attributes related to Git repository handling.
 
@@ -22,8 +22,9 @@ class Uscan_git:
         :param mode: The mode of operation ('git' or other).
         :param downloader: Downloader object managing repository states.
         :param pretty: Format for git describe or log.
-        :param gitmode: Mode for cloning ('full' or 'shallow').
+        :param gitmode: Mode for cloning ('full', 'shallow' or 'partial').
         :param date: Date format for git log.
+        :param shared: Shared state such as download_version.
         """
         self.versionless = versionless
         self.parse_result = parse_result
@@ -37,10 +38,12 @@ class Uscan_git:
         self.pretty = pretty
         self.gitmode = gitmode
         self.date = date
+        self.shared = shared
 
     def git_search(self):
         """
         Searches for a new file and version in the Git repository, handling both versionless and tagged modes.
+        Tags are listed with git ls-remote, without cloning the repository.
 
         :return: Tuple containing newversion and newfile, or None if not found.
         """
@@ -49,8 +52,18 @@ class Uscan_git:
         if self.versionless:
             newfile = self.parse_result.get('filepattern')  # e.g., 'HEAD' or 'heads/<branch>'
 
-            if self.pretty == 'describe':
-                self.gitmode = 'full'
+            clone_filter = self.downloader.PARTIAL_CLONE_FILTER if self.gitmode == 'partial' else None
+
+            if self.downloader.git_mirrors:
+                # describe/log run against the persistent mirror, nothing is cloned. A mirror holds
+                # the whole history, so gitmode=shallow and the deepening of shallow clones below do not
+                # apply: the next fetch --prune of a shallow mirror fetches the whole history of every tag
+                with self.downloader.git_mirrors.use(self.parse_result.get('base'),
+                                                     clone_filter=clone_filter) as git_dir:
+                    newversion = self._versionless_version(git_dir, newfile)
+                if newversion is None:
+                    return None
+                return newversion, newfile
 
             # Handle shallow cloning
             if self.gitmode == 'shallow' and self.parse_result.get('filepattern') == 'HEAD':
@@ -76,6 +89,17 @@ class Uscan_git:
                 self._execute_command(clone_command)
                 self.downloader.gitrepo_state = 1
 
+            elif self.gitmode == 'partial':
+                # Commits and trees only, blobs are fetched when the tarball is exported
+                clone_command = [
+                    'git', 'clone', '--quiet', '--bare', f"--filter={clone_filter}",
+                    self.parse_result.get('base'),
+                    os.path.join(self.downloader.destdir, self.gitrepo_dir)
+                ]
+                UscanOutput.uscan_verbose(f"Cloning repository partially: {' '.join(clone_command)}")
+                self._execute_command(clone_command)
+                self.downloader.gitrepo_state = 3
+
             else:
                 # Full clone
                 clone_command = [
@@ -87,100 +111,162 @@ class Uscan_git:
                 self._execute_command(clone_command)
                 self.downloader.gitrepo_state = 2
 
-            # Retrieve version information
-            if self.pretty == 'describe':
-                describe_command = [
-                    'git', f"--git-dir={os.path.join(self.downloader.destdir, self.gitrepo_dir)}",
-                    'describe', '--tags'
-                ]
-                UscanOutput.uscan_verbose(f"Running git describe: {' '.join(describe_command)}")
-                newversion = self._execute_command(describe_command).replace('-', '.').strip()
+            git_dir = os.path.join(self.downloader.destdir, self.gitrepo_dir)
+            if self.pretty == 'describe' and self.gitmode == 'shallow':
+                self._deepen_for_describe(git_dir, newfile)
+            newversion = self._versionless_version(git_dir, newfile)
+            if newversion is None:
+                return None
+            return newversion, newfile
 
-                # Apply version mangling rules
-                if UscanUtils.mangle(self.watchfile, self.line, 'uversionmangle:', self.uversionmangle, newversion):
-                    return None
+        # Tagged mode: the refs advertised by the remote are all that is needed,
+        # the tree is only cloned or fetched when the tarball is downloaded
+        patterns = [self.parse_result.get('filepattern')]
+        command = ['git', '-c', 'protocol.version=2', 'ls-remote', '--refs']
+        if all(pattern.startswith('refs/tags/') for pattern in patterns):
+            # Lets the server leave out the branches of the ref advertisement
+            command.append('--tags')
+        command.append(self.parse_result.get('base'))
+        vcs = Uscan_vcs(
+            pkg=None,
+            search_result=self.search_result or {},
+            config=None,
+            compression=None,
+            patterns=patterns,
+            uversionmangle=self.uversionmangle,
+            watchfile=self.watchfile,
+            line=self.line,
+            shared=self.shared or {}
+        )
+        return vcs.get_refs(command, r"^\S+\s+(\S+)$", 'git')
 
-            else:
-                # Handle 'log' or other pretty formats
-                original_tz = os.environ.get('TZ')
-                os.environ['TZ'] = 'UTC'
-                newfile = self.parse_result.get('filepattern')  # e.g., 'HEAD' or 'heads/<branch>'
-
-                if newfile == 'HEAD':
-                    log_command = [
-                        'git', f"--git-dir={os.path.join(self.downloader.destdir, self.gitrepo_dir)}",
-                        'log', '-1',
-                        f"--date=format-local:{self.date}",
-                        f"--pretty={self.pretty}"
-                    ]
-                else:
-                    branch = newfile.replace('heads/', '')
-                    log_command = [
-                        'git', f"--git-dir={os.path.join(self.downloader.destdir, self.gitrepo_dir)}",
-                        'log', '-1', '-b', branch,
-                        f"--date=format-local:{self.date}",
-                        f"--pretty={self.pretty}"
-                    ]
-
-                UscanOutput.uscan_verbose(f"Running git log: {' '.join(log_command)}")
-                newversion = self._execute_command(log_command)
-                os.environ['TZ'] = original_tz
-                newversion = newversion.strip()
+    def _deepen_for_describe(self, git_dir, newfile):
+        """
+        Deepen a shallow clone until git describe answers as on the full history.
 
-            return newversion, newfile
+        The history is deepened exponentially (depth 1, 2, 4...), the tags
+        pointing into it being fetched along, until the nearest tag is
+        reachable and every shallow boundary commit is one of its ancestors:
+        nothing describe could pick or count then lies beyond the boundary.
+        Past downloader.git_describe_depth commits the clone is unshallowed.
+        Only temporary clones are deepened, git mirrors are always complete.
 
-        def git_upstream_url(self):
-            """
-            Constructs the upstream URL for the Git repository, appending the versioned file path if necessary.
-
-            :return: The upstream URL.
-            """
-            upstream_url = f"{self.parse_result.get('base')} {self.search_result.get('newfile')}"
-            return upstream_url
-
-        def git_newfile_base(self):
-            """
-            Alias for _vcs_newfile_base, generating the base name for the new file from the Git repository.
-
-            :return: The base name for the new file.
-            """
-            vcs = Uscan_vcs(
-                pkg=None,
-                search_result=self.search_result,
-                config=None,
-                compression=None,
-                patterns=None,
-                uversionmangle=self.uversionmangle,
-                watchfile=self.watchfile,
-                line=self.line,
-                shared=None
-            )
-            return vcs._vcs_newfile_base()
-
-        def git_clean(self):
-            """
-            Cleans up the cloned Git repository by removing its directory if certain conditions are met.
-
-            :return: Always returns 0.
-            """
-            # Assuming verbosity is managed globally or passed as an argument; here, using UscanOutput
-            verbosity = UscanOutput.get_verbose()
-
-            if (self.downloader.gitrepo_state > 0 and
-                    verbosity < 2 and
-                    not self.downloader.git_upstream):
-                repo_path = os.path.join(self.downloader.destdir, self.gitrepo_dir)
-                UscanOutput.uscan_verbose(f"Removing git repo ({repo_path})")
-                try:
-                    shutil.rmtree(repo_path)
-                    self.downloader.gitrepo_state = 0
-                except Exception as e:
-                    UscanOutput.uscan_warn(f"Errors during git repo clean: {e}")
-            else:
-                repo_path = os.path.join(self.downloader.destdir, self.gitrepo_dir)
-                UscanOutput.uscan_debug(f"Keep git repo ({repo_path})")
+        :param git_dir: Git directory of the shallow clone.
+        :param newfile: The ref searched ('HEAD' or 'heads/<branch>').
+        """
+        git = ['git', f"--git-dir={git_dir}"]
+        if newfile == 'HEAD':
+            ref = self._execute_command(git + ['symbolic-ref', 'HEAD']).strip()
+        else:
+            ref = f"refs/{newfile}"
+        refspec = f"+{ref}:{ref}"
+        shallow = os.path.join(git_dir, 'shallow')
+
+        depth = 1
+        while os.path.exists(shallow):
+            tag = subprocess.run(git + ['describe', '--tags', '--abbrev=0', ref], stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL, text=True)
+            if tag.returncode == 0:
+                with open(shallow) as f:
+                    boundary = f.read().split()
+                if all(subprocess.run(git + ['merge-base', '--is-ancestor', commit, tag.stdout.strip()]).returncode == 0
+                       for commit in boundary):
+                    UscanOutput.uscan_verbose(f"Tag {tag.stdout.strip()} reached at depth {depth}")
+                    return
+            if depth >= self.downloader.git_describe_depth:
+                UscanOutput.uscan_verbose(f"No conclusive tag within {depth} commits, fetching the whole history")
+                self._execute_command(git + ['fetch', '--quiet', '--unshallow', 'origin', refspec])
+                return
+            UscanOutput.uscan_verbose(f"Deepening the clone by {depth} commits to reach a tag")
+            self._execute_command(git + ['fetch', '--quiet', f"--deepen={depth}", 'origin', refspec])
+            depth *= 2
+
+    def _versionless_version(self, git_dir, newfile):
+        """
+        Compute the version of a HEAD or heads/<branch> line with git describe or git log.
+
+        :param git_dir: Git directory holding the upstream history.
+        :param newfile: The ref searched ('HEAD' or 'heads/<branch>').
+        :return: The new version, or None if uversionmangle failed.
+        """
+        if self.pretty == 'describe':
+            describe_command = ['git', f"--git-dir={git_dir}", 'describe', '--tags']
+            if newfile != 'HEAD':
+                describe_command.append(newfile)
+            UscanOutput.uscan_verbose(f"Running git describe: {' '.join(describe_command)}")
+            newversion = self._execute_command(describe_command).replace('-', '.').strip()
+
+            # Apply version mangling rules
+            if UscanUtils.mangle(self.watchfile, self.line, 'uversionmangle:', self.uversionmangle, newversion):
+                return None
+            return newversion
+
+        # Handle 'log' or other pretty formats
+        log_command = [
+            'git', f"--git-dir={git_dir}", 'log', '-1',
+            f"--date=format-local:{self.date}",
+            f"--pretty={self.pretty}",
+            newfile
+        ]
+        UscanOutput.uscan_verbose(f"Running git log: {' '.join(log_command)}")
+        result = subprocess.run(log_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                env=dict(os.environ, TZ='UTC'))
+        if result.returncode != 0:
+            UscanOutput.uscan_die(f"Error running command {' '.join(log_command)}: {result.stderr.strip()}")
+        return result.stdout.strip()
+
+    def git_upstream_url(self):
+        """
+        Constructs the upstream URL for the Git repository, appending the versioned file path if necessary.
+
+        :return: The upstream URL.
+        """
+        upstream_url = f"{self.parse_result.get('base')} {self.search_result.get('newfile')}"
+        return upstream_url
+
+    def git_newfile_base(self):
+        """
+        Alias for _vcs_newfile_base, generating the base name for the new file from the Git repository.
+
+        :return: The base name for the new file.
+        """
+        vcs = Uscan_vcs(
+            pkg=None,
+            search_result=self.search_result,
+            config=None,
+            compression=None,
+            patterns=None,
+            uversionmangle=self.uversionmangle,
+            watchfile=self.watchfile,
+            line=self.line,
+            shared=None
+        )
+        return vcs._vcs_newfile_base()
+
+    def git_clean(self):
+        """
+        Cleans up the cloned Git repository by removing its directory if certain conditions are met.
+
+        :return: Always returns 0.
+        """
+        # Assuming verbosity is managed globally or passed as an argument; here, using UscanOutput
+        verbosity = UscanOutput.get_verbose()
+
+        if (self.downloader.gitrepo_state > 0 and
+                verbosity < 2 and
+                not self.downloader.git_upstream):
+            repo_path = os.path.join(self.downloader.destdir, self.gitrepo_dir)
+            UscanOutput.uscan_verbose(f"Removing git repo ({repo_path})")
+            try:
+                shutil.rmtree(repo_path)
+                self.downloader.gitrepo_state = 0
+            except Exception as e:
+                UscanOutput.uscan_warn(f"Errors during git repo clean: {e}")
+        else:
+            repo_path = os.path.join(self.downloader.destdir, self.gitrepo_dir)
+            UscanOutput.uscan_debug(f"Keep git repo ({repo_path})")
 
-            return 0
+        return 0
 
     # Helper method to execute commands
     def _execute_command(self, command):
@@ -1,9 +1,38 @@
+import codecs
+import hashlib
 import re
-import requests
+from functools import lru_cache, partial
 from urllib.parse import urlparse, urljoin, urlunparse
-import UscanOutput
-import UscanUtils
-import Uscan_xtp
+from UscanOutput import UscanOutput
+from UscanUtils import UscanUtils
+from Uscan_xtp import Uscan_xtp
+from AsyncHttp import AsyncHttp
+from HrefMatcher import BASE_RE, HrefMatcher, HrefStream, PlainMatcher
+from ResultCache import ResultCache
+from devscript.Versort import Versort
+
+
+# Relative href made of plain path segments only (no scheme, query, '.' or '..')
+_PLAIN_HREF_RE = re.compile(r'(?![./])(?!.*(?:^|/)\.\.?(?:/|$))(?:[^/?#;:\s]+/)*[^/?#;:\s]+/?\Z')
+
+
+def _canonicalize_dots(base, url):
+    parsed_url = urlparse(urljoin(base, url))
+    path_parts = parsed_url.path.split('/')
+    canonicalized_path = []
+    for part in path_parts:
+        if part == '..':
+            if canonicalized_path:
+                canonicalized_path.pop()
+        elif part != '.' and part:
+            canonicalized_path.append(part)
+    return urlunparse(parsed_url._replace(path='/'.join(canonicalized_path)))
+
+
+@lru_cache(maxsize=256)
+def _canonical_dir(base):
+    """Return the canonical form of base's directory, with a trailing '/'."""
+    return _canonicalize_dots(base, '_')[:-1]
 
 
 class Uscan_http:
@@ -17,10 +46,14 @@ class Uscan_http:
         self.patterns = []
         self.sites = []
         self.basedirs = []
+        self.memo_key = None
+        self.memo_hit = None
+        self.memo_pending = None
 
-    def handle_redirection(self, pattern, additional_bases=None):
+    def handle_redirection(self, pattern, additional_bases=None, redirections=None):
         additional_bases = additional_bases or []
-        redirections = self.downloader.get_redirections()
+        if redirections is None:
+            redirections = self.downloader.get_redirections()
         patterns, base_sites, base_dirs = [], [], []
 
         if redirections:
@@ -48,53 +81,80 @@ class Uscan_http:
         return patterns, base_sites, base_dirs
 
     def http_search(self):
+        """Synchronous wrapper around http_search_async()."""
+        return AsyncHttp.run(self.http_search_async())
+
+    async def http_search_async(self, engine=None):
+        engine = engine or AsyncHttp.default()
         if self.parse_result.get("base").startswith("https") and not self.downloader.ssl_enabled():
             UscanOutput.uscan_die(
                 "The liblwp-protocol-https-perl package must be installed to use https URLs"
             )
 
         UscanOutput.uscan_verbose(f"Requesting URL: {self.parse_result.get('base')}")
-        request = requests.Request("GET", self.parse_result.get("base"))
+        headers = {}
 
         # Set headers
         for key, value in self.downloader.headers.items():
             base_url, hdr = key.split('@', 1)
             if re.match(rf'^{re.escape(base_url)}(?:/.*)?$', self.parse_result.get("base")):
-                request.headers[hdr] = value
+                headers[hdr] = value
                 UscanOutput.uscan_verbose(f"Set per-host custom header {hdr} for {self.parse_result.get('base')}")
             else:
                 UscanOutput.uscan_debug(f"{self.parse_result.get('base')} does not start with {base_url}")
 
-        request.headers.update({"Accept-Encoding": "gzip", "Accept": "*/*"})
+        headers.update({"Accept-Encoding": "gzip", "Accept": "*/*"})
 
-        session = requests.Session()
-        response = session.send(session.prepare_request(request))
+        response, redirections = await engine.fetch(self.parse_result.get("base"), headers=headers,
+                                                    cache=self.downloader.http_cache,
+                                                    timeout=self.downloader.timeout, stream=True)
 
         if not response.ok:
             UscanOutput.uscan_warn(
                 f"In watchfile {self.watchfile}, reading webpage {self.parse_result.get('base')} failed: "
                 + response.reason
             )
+            response.close()
             return None
 
-        patterns, base_sites, base_dirs = self.handle_redirection(self.parse_result.get("filepattern"))
+        patterns, base_sites, base_dirs = self.handle_redirection(self.parse_result.get("filepattern"),
+                                                                  redirections=redirections)
         self.patterns.extend(patterns)
         self.sites.extend(base_sites)
         self.basedirs.extend(base_dirs)
 
-        content = response.text
-        UscanOutput.uscan_extra_debug(f"Received content:\n{content}\n[End of received content] by HTTP")
+        searchmode = self.parse_result.get("searchmode") or "html"
+        if searchmode not in ("html", "plain"):
+            UscanOutput.uscan_warn(f'Unknown searchmode "{searchmode}", skipping')
+            response.close()
+            return None
 
-        if not self.parse_result.get("searchmode") or self.parse_result.get("searchmode") == "html":
-            hrefs = self.html_search(content, self.patterns)
-        elif self.parse_result.get("searchmode") == "plain":
-            hrefs = self.plain_search(content)
+        # Large pages that pagemangle does not need as a whole are searched while they are read
+        if searchmode == "html" and not self.parse_result.get("pagemangle") and \
+                self.downloader.page_unread(response):
+            streamed = await self.stream_search(engine, response, self.patterns)
+            if streamed is None:
+                return None
+            hrefs, digest = streamed
+            if self.memo_lookup(digest, redirections):
+                return self.memo_hit['newversion'], self.memo_hit['newfile']
         else:
-            UscanOutput.uscan_warn(f'Unknown searchmode "{self.parse_result.get("searchmode")}", skipping')
-            return None
+            if await engine.call(self.downloader.read_page, response) is None:
+                return None
+
+            # Same page, same rules: reuse the result of the previous run
+            if self.memo_lookup(response.content, redirections):
+                return self.memo_hit['newversion'], self.memo_hit['newfile']
+
+            if searchmode == "html":
+                content = response.text
+                UscanOutput.uscan_extra_debug(f"Received content:\n{content}\n[End of received content] by HTTP")
+                hrefs = self.html_search(content, self.patterns)
+            else:
+                hrefs = self.plain_search(response.content, response.encoding)
 
         if hrefs:
-            hrefs = sorted(hrefs, key=lambda x: x[0], reverse=True)
+            hrefs = Versort.versort(hrefs)
             msg = "Found the following matching hrefs on the web page (newest first):\n"
             for href in hrefs:
                 msg += f"   {href[2]} ({href[1]}) index={href[0]} {href[3]}\n"
@@ -120,8 +180,35 @@ class Uscan_http:
                 )
                 return None
 
+        if self.memo_key:
+            self.memo_pending = {'newversion': newversion, 'newfile': newfile}
         return newversion, newfile
 
+    def memo_lookup(self, page, redirections):
+        """
+        Look the search result of this line up in the result cache.
+        :param page: Fetched page (bytes) or its sha256 hexdigest, None to skip the cache.
+        :return: True if memo_hit holds the previous result for the same page and rules.
+        """
+        if not self.downloader.result_cache or page is None:
+            return False
+        self.memo_key = ResultCache.make_key(self.line, self._memo_rules(), page,
+                                             [redirections, self.shared.get("download_version")])
+        self.memo_hit = self.downloader.result_cache.get(self.memo_key)
+        if self.memo_hit:
+            UscanOutput.uscan_verbose(
+                f"Page {self.parse_result.get('base')} unchanged, reusing the previous search result"
+            )
+            return True
+        return False
+
+    def _memo_rules(self):
+        """Options of this line that change the outcome of a search."""
+        rules = {name: self.parse_result.get(name) or getattr(self, name, None) for name in ResultCache.MANGLES}
+        for option in ("searchmode", "searchlimit", "versionmode", "versionless"):
+            rules[option] = self.parse_result.get(option) or getattr(self, option, None)
+        return rules
+
     def http_upstream_url(self):
         newfile = self.parse_result.get("newfile")
 
@@ -173,7 +260,13 @@ class Uscan_http:
         return upstream_url
 
     def http_newdir(self, https, line, site, dir, pattern, dirversionmangle, watchfile, lineptr, download_version):
-        session = requests.Session()
+        """Synchronous wrapper around http_newdir_async()."""
+        return AsyncHttp.run(self.http_newdir_async(https, line, site, dir, pattern, dirversionmangle, watchfile,
+                                                    lineptr, download_version))
+
+    async def http_newdir_async(self, https, line, site, dir, pattern, dirversionmangle, watchfile, lineptr,
+                                download_version, engine=None):
+        engine = engine or AsyncHttp.default()
         base = site + dir
         short_versions = Uscan_xtp.partial_version(download_version)
 
@@ -183,21 +276,20 @@ class Uscan_http:
             )
 
         UscanOutput.uscan_verbose(f"Requesting URL: {base}")
-        response = session.get(base)
+        response, redirections = await engine.fetch(base, cache=self.downloader.http_cache,
+                                                    timeout=self.downloader.timeout, stream=True)
 
         if not response.ok:
             UscanOutput.uscan_warn(
                 f"In watch file {watchfile}, reading webpage {base} failed: {response.reason}"
             )
+            response.close()
             return ''
 
-        content = response.content
-        if response.headers.get("Content-Encoding", "").lower() == "gzip":
-            try:
-                content = response.content.decode("gzip")
-            except Exception as e:
-                UscanOutput.uscan_warn(f"Unable to decode remote content: {str(e)}")
-                return ''
+        # requests has already undone any gzip Content-Encoding
+        content = await engine.call(self.downloader.read_page, response)
+        if content is None:
+            return ''
 
         UscanOutput.uscan_extra_debug(
             f"Received content:\n{content.decode()}\n[End of received content] by HTTP"
@@ -205,8 +297,7 @@ class Uscan_http:
 
         content = self.clean_content(content.decode())
 
-        dirpatterns, base_sites, base_dirs = self.handle_redirection(line, pattern, base)
-        self.downloader.clear_redirections()
+        dirpatterns, base_sites, base_dirs = self.handle_redirection(pattern, redirections=redirections)
 
         hrefs = []
         for parsed in self.html_search(content, dirpatterns, 'dirversionmangle'):
@@ -216,11 +307,12 @@ class Uscan_http:
             )
             hrefs.append((mangled_version, href, match_description))
 
-        # Extract only matched hrefs
+        # Prefer the directories matching the download version, like Perl uscan
         matched_hrefs = [href for href in hrefs if href[2]]
         if matched_hrefs:
-            matched_hrefs = sorted(matched_hrefs, key=lambda x: x[0], reverse=True)
-            newdir = matched_hrefs[0][1]
+            newdir = Versort.upstream_versort(matched_hrefs)[0][1]
+        elif hrefs:
+            newdir = Versort.upstream_versort(hrefs)[0][1]
         else:
             UscanOutput.uscan_warn(f"No matching hrefs for pattern in {watchfile}: {site}{dir}{pattern}")
             return ''
@@ -229,63 +321,103 @@ class Uscan_http:
         newdir = newdir.rstrip('/').split('/')[-1]
         return newdir
 
-    def handle_redirection(self, line, pattern, base):
-        patterns, base_sites, base_dirs = [], [], []
-        for redirection in self.downloader.get_redirections():
-            base_dir = re.sub(r'^\w+://[^/]+/', '/', redirection)
-            base_dir = re.sub(r'/[^/]*(?:[#?].*)?$', '/', base_dir)
-
-            base_site_match = re.match(r'^(\w+://[^/]+)', redirection)
-            if base_site_match:
-                base_site = base_site_match.group(1)
-                patterns.append(re.escape(base_site) + re.escape(base_dir) + pattern)
-                base_sites.append(base_site)
-                base_dirs.append(base_dir)
-
-        return patterns, base_sites, base_dirs
-
     def clean_content(self, content):
         # Fix unquoted href attributes
-        content = re.sub(r'href\s*=\s*([^\s>]+)', r'href="\1"', content, flags=re.IGNORECASE)
+        content = re.sub(r'href\s*=\s*(?=[^"\'])([^\s>]+)', r'href="\1"', content, flags=re.IGNORECASE)
         # Remove HTML comments
         content = re.sub(r'<!--.*?-->', '', content, flags=re.DOTALL)
         return content
 
     def url_canonicalize_dots(self, base, url):
-        parsed_url = urlparse(urljoin(base, url))
-        path_parts = parsed_url.path.split('/')
-        canonicalized_path = []
-        for part in path_parts:
-            if part == '..':
-                if canonicalized_path:
-                    canonicalized_path.pop()
-            elif part != '.' and part:
-                canonicalized_path.append(part)
-        return urlunparse(parsed_url._replace(path='/'.join(canonicalized_path)))
-
-    def html_search(self, content, patterns, mangle):
+        # Plain relative paths (the bulk of an index page) are simply
+        # appended to the canonical directory of base
+        if _PLAIN_HREF_RE.match(url):
+            return _canonical_dir(base) + url.rstrip('/')
+        return _canonicalize_dots(base, url)
+
+    def html_search(self, content, patterns, mangle='uversionmangle'):
         # Modify content if pagemangle is specified
         if self.parse_result.get("pagemangle"):
             UscanUtils.mangle(
                 self.watchfile, self.line, 'pagemangle:', self.parse_result["pagemangle"], content
             )
 
-        base_match = re.search(r'<\s*base\s+[^>]*href\s*=\s*["\'](.*?)["\']', content, re.IGNORECASE)
-        self.parse_result['urlbase'] = self.url_canonicalize_dots(self.parse_result['base'],
-                                                                  base_match.group(1)) if base_match else \
-        self.parse_result['base']
-
+        base_match = BASE_RE.search(content)
+        self.set_urlbase(base_match.group(1) if base_match else None)
+
+        matcher = HrefMatcher.for_patterns(tuple(patterns))
+        canonicalize = partial(self.url_canonicalize_dots, self.parse_result['urlbase'])
+        return [self.parse_href(href_canonical, pattern, mangle, priority)
+                for pattern, href_canonical, priority in matcher.search(content, canonicalize)]
+
+    async def stream_search(self, engine, response, patterns, mangle='uversionmangle'):
+        """
+        html_search() on a stream=True response, run while the page is read.
+        Only the current chunk and the matching hrefs are kept in memory.
+        With the searchlimit option (listing sorted newest first), reading
+        stops once that many hrefs have matched.
+        :return: Tuple (hrefs, sha256 hexdigest of the page or None if reading
+                 stopped early), or None if the page exceeds max_page_size.
+        """
+        limit = int(self.parse_result.get("searchlimit") or 0)
+        if limit and self.shared.get("download_version"):
+            # The wanted version can be anywhere in the listing
+            limit = 0
+        matcher = HrefMatcher.for_patterns(tuple(patterns))
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+        digest = hashlib.sha256()
+        stream = HrefStream()
+        chunks = self.downloader.iter_page(response)
+        canonicalize = None
         hrefs = []
-        for match in re.finditer(r'<\s*a\s+[^>]*(?<=\s)href\s*=\s*["\'](.*?)["\']', content, re.IGNORECASE):
-            href = UscanUtils.fix_href(match.group(1))
-            href_canonical = self.url_canonicalize_dots(self.parse_result['urlbase'], href)
 
-            for pattern in patterns:
-                if re.fullmatch(pattern, href) or re.fullmatch(pattern, href_canonical):
-                    hrefs.append(self.parse_href(href_canonical, pattern, mangle))
-        return hrefs
+        while True:
+            chunk = await engine.call(next, chunks, None)
+            if chunk is None and response.truncated:
+                return None
+            final = chunk is None
+            if not final:
+                digest.update(chunk)
+            found = stream.feed(decoder.decode(chunk or b'', final), final)
+            if canonicalize is None and (found or final):
+                # The <base href> has been seen by now if the page has one
+                self.set_urlbase(stream.base)
+                canonicalize = partial(self.url_canonicalize_dots, self.parse_result['urlbase'])
+            for pattern, href_canonical, priority in matcher.scan(found, canonicalize):
+                hrefs.append(self.parse_href(href_canonical, pattern, mangle, priority))
+            if final:
+                return hrefs, digest.hexdigest()
+            if limit and len(hrefs) >= limit:
+                UscanOutput.uscan_verbose(f"Found {len(hrefs)} matching hrefs, stop reading "
+                                          f"{self.parse_result.get('base')} (searchlimit)")
+                response.close()
+                return hrefs, None
+
+    def set_urlbase(self, base_href):
+        """Set parse_result['urlbase'] from the <base href> of the page (None if it has none)."""
+        if not base_href:
+            self.parse_result['urlbase'] = self.parse_result['base']
+            return
+        urlbase = self.url_canonicalize_dots(self.parse_result['base'], base_href)
+        # Canonicalization drops the trailing '/' of a directory, which relative hrefs are resolved in
+        if urlparse(urljoin(self.parse_result['base'], base_href)).path.endswith('/'):
+            urlbase += '/'
+        self.parse_result['urlbase'] = urlbase
+
+    def plain_search(self, body, encoding=None):
+        """
+        Search the patterns in a plain-text listing (bytes) without decoding it.
+        Matches are relative to the page URL, as Perl uscan does.
+        """
+        if UscanOutput.get_verbose() > 2:
+            UscanOutput.uscan_extra_debug(
+                f"Received content:\n{body.decode(encoding or 'utf-8', 'replace')}\n[End of received content] by HTTP"
+            )
+        self.set_urlbase(None)
+        matcher = PlainMatcher.for_patterns(tuple(self.patterns), encoding or 'utf-8')
+        return [self.parse_href(href, pattern, 'uversionmangle') for pattern, href in matcher.search(body)]
 
-    def parse_href(self, href, pattern, mangle):
+    def parse_href(self, href, pattern, mangle, priority=None):
         mangled_version = ""
         if not self.parse_result.get("versionless"):
             match = re.match(pattern, href)
@@ -293,7 +425,9 @@ class Uscan_http:
 
         if UscanUtils.mangle(self.watchfile, self.line, mangle + ":", self.parse_result[mangle], mangled_version):
             return None
-        priority = f"{mangled_version}-{UscanUtils.get_priority(href)}"
+        if priority is None:
+            priority = UscanUtils.get_priority(href)
+        priority = f"{mangled_version}-{priority}"
         return priority, mangled_version, href, ""
 
     def match_download_version(self, mangled_version, download_version, short_versions):
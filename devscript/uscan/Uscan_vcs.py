@@ -3,7 +3,7 @@ import subprocess
 import os
 from UscanUtils import UscanUtils
 from UscanOutput import UscanOutput
-from devscript import Versort
+from devscript.Versort import Versort
 
 
 class Uscan_vcs:
@@ -54,11 +54,15 @@ class Uscan_vcs:
 
         # Execute the command and capture the output
         try:
-            result = subprocess.run(command, stdout=subprocess.PIPE, text=True)
-            output_lines = result.stdout.splitlines()
-        except subprocess.CalledProcessError:
+            result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        except FileNotFoundError:
             UscanOutput.uscan_die(f"{os.path.basename(__file__)}: you must have the {package} package installed")
             return None
+        if result.returncode != 0:
+            # An unreachable repository must not look like one without matching refs
+            UscanOutput.uscan_die(f"Error running command {' '.join(command)}: {result.stderr.strip()}")
+            return None
+        output_lines = result.stdout.splitlines()
 
         refs = []
 
@@ -69,7 +73,10 @@ class Uscan_vcs:
             if match:
                 ref = match.group(1)
                 for pattern in self.patterns:
-                    version = '.'.join([m for m in re.match(pattern, ref).groups() if m])
+                    ref_match = re.match(f"^{pattern}$", ref)
+                    if not ref_match:
+                        continue
+                    version = '.'.join([m for m in ref_match.groups() if m])
 
                     # Apply version mangling rules
                     if UscanUtils.mangle(self.watchfile, self.line, 'uversionmangle:', self.uversionmangle, version):
@@ -84,7 +91,7 @@ class Uscan_vcs:
             UscanOutput.uscan_verbose(f"Found the following matching refs:\n{ref_list_str}")
 
             # Handle the shared download_version
-            if self.shared.get('download_version') and self.search_result['versionmode'] != 'ignore':
+            if self.shared.get('download_version') and self.search_result.get('versionmode') != 'ignore':
                 vrefs = [r for r in refs if r[0] == self.shared['download_version']]
                 if vrefs:
                     newversion, newfile = vrefs[0]
@@ -0,0 +1,46 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from UscanOutput import UscanOutput
+
+
+class VerifyPool:
+    """
+    Process-wide pool running OpenPGP verifications (gpgv subprocesses).
+
+    Jobs are submitted as soon as a tarball and its signature are on disk
+    and return futures, so downloads and the following watch lines go on
+    while gpgv runs; the pool is sized to the CPU count. A failed
+    verification raises (uscan_die) when its future's result is taken.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='uscan-gpgv')
+
+    @classmethod
+    def instance(cls):
+        """Return the pool shared by the whole process."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @staticmethod
+    def _timed(label, func, args):
+        start = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            UscanOutput.uscan_verbose(f"OpenPGP verification of {label} took {time.monotonic() - start:.2f}s")
+
+    def submit(self, label, func, *args):
+        """
+        Run func(*args) on the pool.
+        :param label: What is verified, for the latency report.
+        :return: Future of the result.
+        """
+        return self.executor.submit(self._timed, label, func, args)
@@ -2,11 +2,12 @@ import re
 import os
 from pathlib import Path
 from Downloader import Downloader
-import UscanOutput
+from UscanOutput import UscanOutput
 import UscanConfig
 from WatchLine import WatchLine
 from Keyring import UscanKeyring
-from packaging.version import parse as Version
+from Compressor import Compressor
+from devscript.Versort import Versort
 
 class WatchFile:
     ANY_VERSION = r'(?:[-_]?[Vv]?(\d[\-+\.:\~\da-zA-Z]*))'
@@ -27,7 +28,14 @@ class WatchFile:
             agent=config.user_agent,
             pasv=config.pasv,
             destdir=config.destdir,
-            headers=config.http_header
+            headers=config.http_header,
+            cache_dir=config.cache_dir,
+            cache_size=config.http_cache_size,
+            max_page_size=config.max_page_size,
+            digests=(config.log_digest,) if config.log else (),
+            artifact_cache_size=config.download_cache_size,
+            git_mirror_size=config.git_mirror_size,
+            git_describe_depth=config.git_describe_depth
         )
         self.signature = config.signature
         self.group = []
@@ -37,7 +45,8 @@ class WatchFile:
         self.watch_version = 0
         self.watchlines = []
         self.shared = self.new_shared()
-        self.keyring = UscanKeyring()
+        self.keyring = UscanKeyring(config.cache_dir)
+        Compressor.configure(config.compress_threads, config.jobs)
 
         self._process_watchfile()
 
@@ -148,6 +157,8 @@ class WatchFile:
 
         for watch_line in self.watchlines:
             result = watch_line.process()
+            # A line stopping before mkorigtargz() may still have verifications running
+            watch_line.wait_verifications()
             if result:
                 self.status = result
         return self.status
@@ -252,6 +263,10 @@ class WatchFile:
                 last_versions.append(line.parse_result.get('lastversion'))
                 last_debian_mangled_uversions.append(line.parse_result.get('mangled_lastversion'))
 
+        # Signatures were verified in the background while the next lines went on
+        for line in self.watchlines:
+            line.wait_verifications()
+
         # Construct version strings with checksums if applicable
         new_version = '+~'.join(filter(None, new_versions))
         if newChecksum:
@@ -267,11 +282,10 @@ class WatchFile:
         UscanOutput.dehs_tags['debian-mangled-uversion'] = '+~'.join(filter(None, last_debian_mangled_uversions))
 
         # Compare upstream and mangled versions
-        mangled_ver = Version(f"1:{UscanOutput.dehs_tags['debian-mangled-uversion']}-0")
-        upstream_ver = Version(f"1:{new_version}-0")
-        if mangled_ver == upstream_ver:
+        order = Versort.upstream_compare(UscanOutput.dehs_tags['debian-mangled-uversion'], new_version)
+        if order == 0:
             UscanOutput.dehs_tags['status'] = "up to date"
-        elif mangled_ver > upstream_ver:
+        elif order > 0:
             UscanOutput.dehs_tags['status'] = "only older package available"
         else:
             UscanOutput.dehs_tags['status'] = "newer package available"
@@ -3,14 +3,14 @@ import os
 import re
 import subprocess
 import shutil
-import hashlib
 import tempfile
-import UscanOutput
+from UscanOutput import UscanOutput
 import UscanUtils
 from Keyring import UscanKeyring
+from VerifyPool import VerifyPool
+from Compressor import Compressor
 from pathlib import Path
-
-from packaging.version import parse as Version
+from devscript.Versort import Versort
 
 
 class WatchLine:
@@ -47,6 +47,7 @@ class WatchLine:
         self.repacksuffix = None
         self.unzipopt = None
         self.searchmode = None
+        self.searchlimit = None
         self.dirversionmangle = []
         self.downloadurlmangle = []
         self.dversionmangle = []
@@ -69,6 +70,7 @@ class WatchLine:
         self.signature_available = False
         self.must_download = False
         self.mangled_version = None
+        self.verifications = []
         self.sites = []
         self.basedirs = []
         self.patterns = []
@@ -81,6 +83,11 @@ class WatchLine:
         self.upstream_url = None
         self.newfile_base = None
 
+        # Search result memoization (see ResultCache)
+        self.memo_key = None
+        self.memo_hit = None
+        self.memo_pending = None
+
         # Additional configurable attributes with defaults
         self.date = '%Y%m%d'
         self.decompress = False
@@ -222,6 +229,18 @@ class WatchLine:
         elif opt.startswith("compression="):
             _, comp = opt.split("=")
             self.compression = UscanUtils.get_compression(comp)
+        elif opt.startswith("gitmode="):
+            _, gitmode = opt.split("=")
+            if gitmode in ('shallow', 'full', 'partial'):
+                self.gitmode = gitmode
+            else:
+                UscanOutput.uscan_warn(f"Invalid gitmode: {gitmode}")
+        elif opt.startswith("searchlimit="):
+            _, limit = opt.split("=")
+            if limit.isdigit():
+                self.searchlimit = int(limit)
+            else:
+                UscanOutput.uscan_warn(f"Invalid searchlimit: {limit}")
         else:
             UscanOutput.uscan_warn(f"Unrecognized option: {opt}")
 
@@ -280,6 +299,11 @@ class WatchLine:
         else:
             self.mode = self.mode or 'ftp'
 
+        if self.memo_hit:
+            self.upstream_url = self.memo_hit['upstream_url']
+            UscanOutput.uscan_verbose(f"Upstream URL identified as: {self.upstream_url} (cached)")
+            return self.status
+
         self.upstream_url = self._do('upstream_url')
         if self.status:
             return self.status
@@ -290,9 +314,19 @@ class WatchLine:
     def get_newfile_base(self):
         """Determine the local filename for the new file based on mangling rules."""
         UscanOutput.uscan_debug("Running get_newfile_base()")
-        self.newfile_base = self._do('newfile_base')
-        if self.status:
-            return self.status
+        if self.memo_hit:
+            self.newfile_base = self.memo_hit['newfile_base']
+            self.search_result.update(self.memo_hit['search_result'])
+        else:
+            self.newfile_base = self._do('newfile_base')
+            if self.status:
+                return self.status
+            if self.memo_pending:
+                self.downloader.result_cache.put(
+                    self.memo_key, upstream_url=self.upstream_url, newfile_base=self.newfile_base,
+                    search_result=self.search_result, **self.memo_pending
+                )
+                self.memo_pending = None
 
         UscanOutput.uscan_verbose(
             f"Filename for downloaded file: {self.newfile_base}"
@@ -317,11 +351,10 @@ class WatchLine:
             'component-upstream-version': []
         }
 
-        mangled_ver = Version(mangled_lastversion)
-        upstream_ver = Version(self.search_result['newversion'])
+        order = Versort.upstream_compare(mangled_lastversion, self.search_result['newversion'])
         compver = (
-            'same' if mangled_ver == upstream_ver else
-            'older' if mangled_ver > upstream_ver else
+            'same' if order == 0 else
+            'older' if order > 0 else
             'newer'
         )
 
@@ -363,7 +396,8 @@ class WatchLine:
             return 0
 
         # Configure downloader
-        self.downloader.git_export_all(self.gitexport == 'all')
+        self.downloader.git_export_all = self.gitexport == 'all'
+        self.downloader.gitmode = self.gitmode
 
         download_available = False
         upstream_base = os.path.basename(self.upstream_url)
@@ -376,6 +410,26 @@ class WatchLine:
             )
         WatchLine.already_downloaded[self.newfile_base] = True
 
+        # Look for signature files while the tarball downloads
+        sig_probes = None
+        if self.pgpmode in ['default', 'auto'] and self.shared.get('signature') == 1:
+            sig_probes = self.downloader.signature_probe.start(self.upstream_url)
+
+        # A signature whose URL is known up front is fetched first, so that the
+        # tarball is verified while it streams in
+        early_sig = None
+        streamed = []
+        stream_to = None
+        if self.pgpmode == 'mangle' and self.shared.get('signature') == 1 and not self.decompress and self.keyring:
+            early_sig = self._signature_file(sigfile_base)
+            if early_sig is None:
+                return 1
+            self._download_signature(*early_sig)
+            if self.signature_available:
+                def stream_to():
+                    streamed.append(self.keyring.stream_verifier(self.sigfile, self.newfile_base))
+                    return streamed[-1]
+
         # Attempt to download the tarball if pgpmode is not 'previous'
         if self.pgpmode != 'previous':
             dest_path = os.path.join(self.config['destdir'], self.newfile_base)
@@ -383,7 +437,7 @@ class WatchLine:
                 UscanOutput.uscan_verbose(f"Overwriting existing file: {self.newfile_base}")
                 download_available = self.downloader.download(
                     self.upstream_url, dest_path, self, self.parse_result.get('base'),
-                    self.pkg_dir, self.pkg, self.mode
+                    self.pkg_dir, self.pkg, self.mode, stream_to=stream_to
                 )
                 if download_available:
                     UscanOutput.dehs_verbose(f"Successfully downloaded package: {self.newfile_base}")
@@ -399,7 +453,7 @@ class WatchLine:
                 UscanOutput.uscan_verbose(f"Downloading package: {upstream_base}")
                 download_available = self.downloader.download(
                     self.upstream_url, dest_path, self, self.parse_result.get('base'),
-                    self.pkg_dir, self.pkg, self.mode, self.gitrepo_dir
+                    self.pkg_dir, self.pkg, self.mode, self.gitrepo_dir, stream_to=stream_to
                 )
                 if download_available:
                     UscanOutput.dehs_verbose(f"Downloaded upstream package: {upstream_base}")
@@ -424,14 +478,17 @@ class WatchLine:
                 return 1
 
             else:
-                self.keyring.verify(
+                self.verifications.append(self.keyring.submit(
+                    'verify',
                     os.path.join(self.config['destdir'], sigfile_base),
                     os.path.join(self.config['destdir'], self.newfile_base)
-                )
+                ))
                 self.signature_available = 3
 
         # Decompression if necessary
         if download_available == 1 and self.decompress:
+            # The file to decompress may be the one extracted by the verification
+            self.wait_verifications()
             suffix = UscanUtils.get_suffix(sigfile_base)
             decompress_cmds = {
                 '.gz': '/bin/gunzip',
@@ -452,43 +509,70 @@ class WatchLine:
         pgpsig_url = None
         if self.pgpmode in ['default', 'auto'] and self.shared.get('signature') == 1:
             UscanOutput.uscan_verbose("Checking for common OpenPGP signatures.")
-            for suffix in ['asc', 'gpg', 'pgp', 'sig', 'sign']:
+            suffix = self.downloader.signature_probe.first_found(self.upstream_url, sig_probes or [])
+            if suffix:
                 sig_url = f"{self.upstream_url}.{suffix}"
-                if self.downloader.user_agent.head(sig_url).ok:
-                    if self.pgpmode == 'default':
-                        UscanOutput.uscan_warn(
-                            f"Possible signature found at: {sig_url}\nAdd opts=pgpsigurlmangle=s/\\$/.{suffix}/ "
-                            "or opts=pgpmode=auto in debian/watch for more details."
-                        )
-                        self.pgpmode = 'none'
-                    else:
-                        self.pgpmode = 'mangle'
-                        self.pgpsigurlmangle = [f"s/$/.'{suffix}'/"]
-                    break
+                if self.pgpmode == 'default':
+                    UscanOutput.uscan_warn(
+                        f"Possible signature found at: {sig_url}\nAdd opts=pgpsigurlmangle=s/\\$/.{suffix}/ "
+                        "or opts=pgpmode=auto in debian/watch for more details."
+                    )
+                    self.pgpmode = 'none'
+                else:
+                    self.pgpmode = 'mangle'
+                    self.pgpsigurlmangle = [f"s/$/.'{suffix}'/"]
             UscanOutput.uscan_verbose("Finished checking for signature files.")
             self.signature_available = 0
         if self.pgpmode == 'mangle':
-            pgpsig_url = self.upstream_url
-            if UscanUtils.mangle(self.watchfile, self.line, 'pgpsigurlmangle:', self.pgpsigurlmangle, pgpsig_url):
-                return 1
-            suffix_sig = re.search(r"\.[a-zA-Z]+$", pgpsig_url).group(0)[1:] if re.search(r"\.[a-zA-Z]+$",
-                                                                                          pgpsig_url) else "pgp"
-            UscanOutput.uscan_debug(f"Adding {suffix_sig} suffix based on {pgpsig_url}.")
-            sigfile = f"{sigfile_base}.{suffix_sig}"
-
-            if self.shared.get('signature') == 1:
-                UscanOutput.uscan_verbose(f"Downloading signature from {pgpsig_url} as {sigfile}")
-                self.signature_available = self.downloader.download(
-                    pgpsig_url, os.path.join(self.config['destdir'], sigfile), self,
-                    self.parse_result.get('base'), self.pkg_dir, self.pkg, self.mode
-                )
-            else:
-                self.signature_available = 1 if os.path.exists(os.path.join(self.config['destdir'], sigfile)) else 0
-            self.sigfile = os.path.join(self.config['destdir'], sigfile)
+            if not early_sig:
+                sig = self._signature_file(sigfile_base)
+                if sig is None:
+                    return 1
+                if self.shared.get('signature') == 1:
+                    self._download_signature(*sig)
+                else:
+                    self.sigfile = os.path.join(self.config['destdir'], sig[1])
+                    self.signature_available = 1 if os.path.exists(self.sigfile) else 0
+
+            if self.signature_available and download_available:
+                if streamed and streamed[-1].complete:
+                    # gpgv has already read the whole tarball
+                    self.verifications.append(VerifyPool.instance().submit(self.newfile_base, streamed[-1].result))
+                elif self.keyring:
+                    self.verifications.append(self.keyring.submit(
+                        'verifyv', self.sigfile, os.path.join(self.config['destdir'], self.newfile_base)
+                    ))
+                else:
+                    UscanOutput.uscan_warn(f"No upstream signing key found, {self.sigfile} is not verified")
+
+    def _signature_file(self, sigfile_base):
+        """Return (signature URL, signature file name) for pgpmode=mangle, or None on a bad pgpsigurlmangle."""
+        pgpsig_url = self.upstream_url
+        if UscanUtils.mangle(self.watchfile, self.line, 'pgpsigurlmangle:', self.pgpsigurlmangle, pgpsig_url):
+            return None
+        suffix_sig = re.search(r"\.[a-zA-Z]+$", pgpsig_url).group(0)[1:] if re.search(r"\.[a-zA-Z]+$",
+                                                                                      pgpsig_url) else "pgp"
+        UscanOutput.uscan_debug(f"Adding {suffix_sig} suffix based on {pgpsig_url}.")
+        return pgpsig_url, f"{sigfile_base}.{suffix_sig}"
+
+    def _download_signature(self, pgpsig_url, sigfile):
+        UscanOutput.uscan_verbose(f"Downloading signature from {pgpsig_url} as {sigfile}")
+        self.sigfile = os.path.join(self.config['destdir'], sigfile)
+        self.signature_available = self.downloader.download(
+            pgpsig_url, self.sigfile, self, self.parse_result.get('base'), self.pkg_dir, self.pkg, self.mode
+        )
+
+    def wait_verifications(self):
+        """Wait for the signature verifications of this line (uscan_die if one failed)."""
+        while self.verifications:
+            self.verifications.pop(0).result()
 
     def mkorigtargz(self):
         """Call mk_origtargz to build source tarball."""
         UscanOutput.uscan_debug("line: mkorigtargz()")
+        # Never build an orig tarball from an unverified download, nor let a
+        # failed verification go unreported when nothing is built
+        self.wait_verifications()
         if not self.must_download:
             return 0
 
@@ -526,7 +610,9 @@ class WatchLine:
             args.append(path)
 
             UscanOutput.uscan_verbose("Running mk-origtargz with options: " + " ".join(args))
-            result = subprocess.run(["mk-origtargz"] + args, capture_output=True, text=True)
+            # Lets the xz/zstd run by mk-origtargz use the compression thread budget
+            result = subprocess.run(["mk-origtargz"] + args, capture_output=True, text=True,
+                                    env=Compressor.environment())
             if result.returncode != 0:
                 UscanOutput.uscan_die("mk-origtargz failed")
 
@@ -554,21 +640,21 @@ class WatchLine:
             with open(uscanlog_path, 'a') as uscanlog:
                 uscanlog.write("# uscan log\n")
                 if self.symlink != "rename":
-                    umd5sum = hashlib.md5()
-                    omd5sum = hashlib.md5()
-
-                    with open(path, 'rb') as uf, open(os.path.join(self.config['destdir'], target), 'rb') as of:
-                        umd5sum.update(uf.read())
-                        omd5sum.update(of.read())
-                    umd5hex = umd5sum.hexdigest()
-                    omd5hex = omd5sum.hexdigest()
-
-                    if umd5hex == omd5hex:
+                    # Hashed in flight by the Downloader when it fetched the file
+                    algorithm = self.config.get("log_digest") or "md5"
+                    uhex = self.downloader.digests.hexdigest(
+                        os.path.join(self.config['destdir'], self.newfile_base), algorithm
+                    )
+                    ohex = self.downloader.digests.hexdigest(
+                        os.path.join(self.config['destdir'], target), algorithm
+                    )
+
+                    if uhex == ohex:
                         uscanlog.write(f"# == {self.newfile_base}\t-->\t{target}\t(same)\n")
                     else:
                         uscanlog.write(f"# !! {self.newfile_base}\t-->\t{target}\t(changed)\n")
-                    uscanlog.write(f"{umd5hex}  {self.newfile_base}\n")
-                    uscanlog.write(f"{omd5hex}  {target}\n")
+                    uscanlog.write(f"{uhex}  {self.newfile_base}\n")
+                    uscanlog.write(f"{ohex}  {target}\n")
 
     def clean(self):
         """Clean temporary files."""
@@ -0,0 +1,212 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The uscan (and devscript) modules import each other by their flat names
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'devscript', 'uscan'), os.path.join(ROOT, 'devscript')]
+
+
+@pytest.fixture(scope='session')
+def signing_key(tmp_path_factory):
+    """
+    Generate an OpenPGP key and return (gnupg home, armored public key path).
+    """
+    if not (shutil.which('gpg') and shutil.which('gpgv')):
+        pytest.skip('gpg and gpgv are needed')
+    home = tmp_path_factory.mktemp('gnupg')
+    os.chmod(home, 0o700)
+    subprocess.run(['gpg', '--homedir', str(home), '--batch', '--passphrase', '', '--quick-gen-key',
+                    'Upstream <upstream@example.org>', 'ed25519', 'sign', 'never'],
+                   check=True, capture_output=True)
+    armored = home / 'signing-key.asc'
+    subprocess.run(['gpg', '--homedir', str(home), '--armor', '--output', str(armored), '--export'],
+                   check=True, capture_output=True)
+    return home, armored
+
+
+def sign(signing_key, path):
+    """Write the detached armored signature path.asc of path and return its path."""
+    home, _ = signing_key
+    subprocess.run(['gpg', '--homedir', str(home), '--batch', '--yes', '--armor', '--detach-sign',
+                    '--output', f"{path}.asc", str(path)], check=True, capture_output=True)
+    return f"{path}.asc"
+
+
+@pytest.fixture
+def package_dir(tmp_path, monkeypatch, signing_key):
+    """Work from a package directory whose debian/upstream/signing-key.asc is signing_key."""
+    pkg = tmp_path / 'pkg'
+    (pkg / 'debian' / 'upstream').mkdir(parents=True)
+    shutil.copyfile(signing_key[1], pkg / 'debian' / 'upstream' / 'signing-key.asc')
+    monkeypatch.chdir(pkg)
+    return pkg
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """
+    Serve server.files ({path: bytes}) with a strong ETag, honouring
+    If-None-Match and Range/If-Range; server.range_shift moves the start of
+    every 206 answer, server.chunked sends 200 answers without Content-Length.
+    Each request waits server.delay seconds; server.max_in_flight records
+    how many were handled at once.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.answer(send_body=False)
+
+    def do_GET(self):
+        self.answer()
+
+    def answer(self, send_body=True):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.in_flight -= 1
+        body = self.server.files.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        status, start = 200, 0
+        requested = self.headers.get('Range', '')
+        if requested.startswith('bytes=') and self.headers.get('If-Range', etag) == etag:
+            start = int(requested[len('bytes='):].rstrip('-'))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(body)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status, start = 206, max(0, start + self.server.range_shift)
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+        if status == 200 and self.server.chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            if send_body:
+                for n in range(0, len(body), 64 * 1024):
+                    chunk = body[n:n + 64 * 1024]
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                self.wfile.write(b'0\r\n\r\n')
+            return
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """A local HTTP server: fill server.files, fetch server.url(path), inspect server.requests."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), UpstreamHandler)
+    server.daemon_threads = True
+    # Clients closing a page they stopped reading are expected
+    server.handle_error = lambda request, address: None
+    server.files, server.requests, server.range_shift, server.chunked = {}, [], 0, False
+    server.lock, server.delay, server.in_flight, server.max_in_flight = threading.Lock(), 0, 0, 0
+    server.url = lambda path: f"http://127.0.0.1:{server.server_port}{path}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_downloader(tmp_path):
+    """Build Downloaders (with the keyword arguments of Downloader)."""
+    from Downloader import Downloader
+    return lambda **kwargs: Downloader(destdir=str(tmp_path), timeout=10, **kwargs)
+
+
+@pytest.fixture
+def downloader(make_downloader):
+    """A Downloader without any cache."""
+    return make_downloader()
+
+
+def searcher(downloader, base, filepattern, **options):
+    """A Uscan_http line searching filepattern on the page base."""
+    parse_result = {'base': base, 'filepattern': filepattern}
+    parse_result.update({mangle: [] for mangle in ('pagemangle', 'uversionmangle', 'dirversionmangle',
+                                                   'downloadurlmangle')})
+    parse_result.update(options)
+    from Uscan_http import Uscan_http
+    return Uscan_http(downloader, parse_result, {}, 'debian/watch', f"{base} {filepattern}", {})
+
+
+def html_page(links, size, head=''):
+    """An index page of about size bytes listing links, spread evenly over the page."""
+    filler = '<p>%s</p>\n' % ('x' * 70)
+    body = ''.join(f'<a href="{link}">{link}</a>\n' + filler * (size // len(filler) // len(links))
+                   for link in links)
+    return f"<html><head>{head}</head><body>\n{body}</body></html>\n".encode()
+
+
+def git(*args, cwd=None):
+    """Run git quietly and return its stdout."""
+    return subprocess.run(('git',) + args, cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def upstream_repo(tmp_path):
+    """
+    Build a local upstream git repository and return its path.
+
+    History: 40 commits on master, tags v0.5 (commit 5) and annotated v2.0
+    (commit 20), a side branch forked at commit 10 carrying tag v3.0 and
+    merged back, then 5 more commits with v4.0 two commits after the merge.
+    """
+    repo = tmp_path / 'upstream'
+    git('init', '--quiet', '--initial-branch=master', str(repo))
+    for key, value in (('user.name', 'Upstream'), ('user.email', 'upstream@example.org'),
+                       ('uploadpack.allowFilter', 'true'), ('uploadpack.allowAnySHA1InWant', 'true')):
+        git('config', key, value, cwd=repo)
+
+    def commit(message, name='f'):
+        (repo / name).write_text(message + '\n')
+        git('add', name, cwd=repo)
+        git('commit', '--quiet', '-m', message, cwd=repo)
+
+    for n in range(1, 41):
+        commit(str(n))
+        if n == 5:
+            git('tag', 'v0.5', cwd=repo)
+        if n == 20:
+            git('tag', '-a', '-m', 'release 2.0', 'v2.0', cwd=repo)
+    git('checkout', '--quiet', '-b', 'side', 'HEAD~30', cwd=repo)
+    for n in range(1, 4):
+        commit(f"side {n}", 'g')
+    git('tag', 'v3.0', cwd=repo)
+    git('checkout', '--quiet', 'master', cwd=repo)
+    git('merge', '--quiet', '--no-edit', 'side', cwd=repo)
+    for n in range(1, 6):
+        commit(f"tail {n}")
+        if n == 2:
+            git('tag', 'v4.0', cwd=repo)
+    return repo
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import stat
+import time
+
+from ArtifactStore import ArtifactStore
+from CacheDir import CacheDir
+
+
+def count_evictions(monkeypatch):
+    passes = []
+    evict = CacheDir.evict
+    monkeypatch.setattr(CacheDir, 'evict', lambda self, *args: passes.append(self.path) or evict(self, *args))
+    return passes
+
+
+def test_eviction_cadence_is_shared_by_the_processes(tmp_path, monkeypatch):
+    passes = count_evictions(monkeypatch)
+    path = str(tmp_path / 'cache')
+
+    CacheDir(path, 1 << 20).write('a', b'a')
+    assert len(passes) == 1
+    # Another process (or instance) right after: the stamp says eviction is not due
+    for n in range(CacheDir.EVICT_EVERY - 1):
+        CacheDir(path, 1 << 20).write(f"b{n}", b'b')
+    assert len(passes) == 1
+
+    past = time.time() - CacheDir.EVICT_INTERVAL - 1
+    os.utime(os.path.join(path, CacheDir.EVICT_STAMP), (past, past))
+    CacheDir(path, 1 << 20).write('c', b'c')
+    assert len(passes) == 2
+
+
+def test_eviction_every_so_many_writes(tmp_path, monkeypatch):
+    passes = count_evictions(monkeypatch)
+    cache = CacheDir(str(tmp_path / 'cache'), 1 << 20)
+    for n in range(2 * CacheDir.EVICT_EVERY):
+        cache.write(str(n), b'x')
+    # The first write (no stamp yet), then every EVICT_EVERY writes
+    assert len(passes) == 3
+
+
+def test_artifact_store_does_not_evict_on_every_store(tmp_path, monkeypatch):
+    passes = count_evictions(monkeypatch)
+    store = ArtifactStore(str(tmp_path / 'artifacts'))
+    for n in range(5):
+        fname = tmp_path / f"pkg-{n}.tar.gz"
+        fname.write_bytes(b'%d' % n)
+        store.store(f"https://example.org/pkg-{n}.tar.gz", f'"{n}"', str(fname), f"{n:064x}")
+    assert passes == [store.blobs.path]
+
+
+def stored(tmp_path, content):
+    store = ArtifactStore(str(tmp_path / 'artifacts'))
+    fname = tmp_path / 'pkg-1.0.tar.gz'
+    fname.write_bytes(content)
+    url = 'https://example.org/pkg-1.0.tar.gz'
+    store.store(url, '"1"', str(fname), hashlib.sha256(content).hexdigest())
+    return store, store.lookup(url)
+
+
+def test_materialize_checks_the_blob_digest(tmp_path):
+    store, entry = stored(tmp_path, b'upstream tarball\n' * 100)
+    assert store.materialize(entry, str(tmp_path / 'copy.tar.gz'))
+    assert (tmp_path / 'copy.tar.gz').read_bytes() == b'upstream tarball\n' * 100
+
+    # Damaged in place, size unchanged
+    blob = store.blobs.key_path(entry['sha256'])
+    with open(blob, 'r+b') as f:
+        f.write(b'U')
+    assert not store.materialize(entry, str(tmp_path / 'damaged.tar.gz'))
+    assert not os.path.exists(blob)
+    assert not (tmp_path / 'damaged.tar.gz').exists()
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.part')] == []
+
+
+def test_materialized_copy_is_created_under_the_umask(tmp_path):
+    store, entry = stored(tmp_path, b'upstream tarball\n')
+    previous = os.umask(0o077)
+    try:
+        assert store.materialize(entry, str(tmp_path / 'copy.tar.gz'))
+    finally:
+        os.umask(previous)
+    assert stat.S_IMODE(os.stat(tmp_path / 'copy.tar.gz').st_mode) == 0o600
@@ -0,0 +1,77 @@
+import os
+import shutil
+import stat
+import subprocess
+
+import pytest
+
+from Compressor import Compressor
+
+
+@pytest.fixture(autouse=True)
+def budget():
+    yield
+    Compressor._budget = None
+
+
+def compress(tmp_path, suffix, data):
+    source, target = tmp_path / 'source', tmp_path / f"target.{suffix}"
+    source.write_bytes(data)
+    with open(target, 'wb') as out:
+        assert Compressor(suffix).compress(open(source, 'rb'), out)
+    return target.read_bytes()
+
+
+def test_single_threaded_by_default(monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 64)
+    monkeypatch.delenv('XZ_DEFAULTS', raising=False)
+    Compressor.configure(jobs=2)
+    assert Compressor.budget() == 1
+    assert 'XZ_DEFAULTS' not in Compressor.environment()
+
+
+def test_threads_on_request(monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 64)
+    Compressor.configure(0, jobs=4)
+    assert Compressor.budget() == 16
+    Compressor.configure(3, jobs=4)
+    assert Compressor.budget() == 3
+
+
+@pytest.mark.skipif(shutil.which('xz') is None, reason='xz is needed')
+def test_default_output_matches_xz(tmp_path):
+    data = os.urandom(1 << 16) * 8
+    Compressor.configure()
+    assert compress(tmp_path, 'xz', data) == subprocess.run(['xz'], input=data, capture_output=True, check=True).stdout
+
+
+@pytest.mark.skipif(shutil.which('git') is None, reason='git is needed')
+def test_git_archive_reports_the_dead_compressor(tmp_path, monkeypatch, make_downloader):
+    repo = tmp_path / 'repo'
+    subprocess.run(['git', 'init', '--quiet', str(repo)], check=True)
+    (repo / 'README').write_bytes(os.urandom(1 << 20).hex().encode())
+    subprocess.run(['git', '-C', str(repo), 'add', 'README'], check=True)
+    subprocess.run(['git', '-C', str(repo), '-c', 'user.name=u', '-c', 'user.email=u@example.org',
+                    'commit', '--quiet', '-m', 'init'], check=True)
+    monkeypatch.setattr(Compressor, '_command', lambda self: ['false'])
+
+    with pytest.raises(SystemExit, match='false failed'):
+        make_downloader()._git_archive('HEAD', str(tmp_path), 'pkg', '1.0', str(repo / '.git'), 'xz')
+    assert not list(tmp_path.glob('pkg-1.0.tar*')) and not list(tmp_path.glob('.pkg-1.0*'))
+
+
+@pytest.mark.skipif(shutil.which('git') is None, reason='git is needed')
+def test_git_archive_is_created_under_the_umask(tmp_path, make_downloader):
+    repo = tmp_path / 'repo'
+    subprocess.run(['git', 'init', '--quiet', str(repo)], check=True)
+    (repo / 'README').write_text('upstream\n')
+    subprocess.run(['git', '-C', str(repo), 'add', 'README'], check=True)
+    subprocess.run(['git', '-C', str(repo), '-c', 'user.name=u', '-c', 'user.email=u@example.org',
+                    'commit', '--quiet', '-m', 'init'], check=True)
+
+    previous = os.umask(0o077)
+    try:
+        make_downloader()._git_archive('HEAD', str(tmp_path), 'pkg', '1.0', str(repo / '.git'), 'xz')
+    finally:
+        os.umask(previous)
+    assert stat.S_IMODE(os.stat(tmp_path / 'pkg-1.0.tar.xz').st_mode) == 0o600
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import stat
+
+import pytest
+import requests
+
+from Downloader import Downloader
+from Transfer import Transfer
+
+
+def test_ssl_check_sends_no_request(monkeypatch, make_downloader):
+    def request(*args, **kwargs):
+        raise AssertionError('the SSL check went to the network')
+
+    monkeypatch.setattr(requests.Session, 'request', request)
+    monkeypatch.setattr(Downloader, '_ssl_available', None)
+    assert make_downloader().ssl_enabled()
+    assert Downloader._ssl_available is True
+    assert make_downloader().ssl_enabled()
+
+
+CONTENT = bytes(range(256)) * 4096
+
+
+def partial_download(http_server, tmp_path, validator=None, size=100000):
+    """Serve CONTENT and leave the first size bytes of it as an interrupted download."""
+    http_server.files['/pkg-1.0.tar.gz'] = CONTENT
+    url = http_server.url('/pkg-1.0.tar.gz')
+    fname = str(tmp_path / 'pkg-1.0.tar.gz')
+    validator = validator or '"%s"' % hashlib.sha256(CONTENT).hexdigest()[:16]
+    with open(fname + Transfer.PART_SUFFIX, 'wb') as f:
+        f.write(CONTENT[:size])
+    with open(fname + Transfer.META_SUFFIX, 'w') as f:
+        json.dump({'url': url, 'validator': validator, 'size': size}, f)
+    return url, fname
+
+
+def check_downloaded(fname):
+    with open(fname, 'rb') as f:
+        assert f.read() == CONTENT
+    assert not os.path.exists(fname + Transfer.PART_SUFFIX)
+    assert not os.path.exists(fname + Transfer.META_SUFFIX)
+
+
+def test_download_resumes_the_partial_file(tmp_path, monkeypatch, http_server, downloader):
+    offsets = []
+    save = Transfer.save
+    monkeypatch.setattr(Transfer, 'save', lambda self, *args, **kwargs: offsets.append(self.offset) or
+                        save(self, *args, **kwargs))
+    url, fname = partial_download(http_server, tmp_path)
+    assert downloader._download_http(url, fname, http_server.url('/'))
+    check_downloaded(fname)
+    assert [request[2].get('Range') for request in http_server.requests] == ['bytes=100000-']
+    assert offsets == [100000]
+
+
+def test_download_restarts_when_upstream_changed(tmp_path, http_server, downloader):
+    url, fname = partial_download(http_server, tmp_path, validator='"changed"')
+    assert downloader._download_http(url, fname, http_server.url('/'))
+    check_downloaded(fname)
+    # If-Range did not match: the server answered 200 with the whole file
+    assert [request[2].get('If-Range') for request in http_server.requests] == ['"changed"']
+
+
+def test_download_restarts_on_a_misplaced_range(tmp_path, http_server, downloader):
+    http_server.range_shift = -10
+    url, fname = partial_download(http_server, tmp_path)
+    assert downloader._download_http(url, fname, http_server.url('/'))
+    check_downloaded(fname)
+    assert [request[2].get('Range') for request in http_server.requests] == ['bytes=100000-', None]
+
+
+@pytest.fixture
+def umask():
+    previous = os.umask(0o027)
+    yield 0o027
+    os.umask(previous)
+
+
+def test_downloads_are_created_under_the_umask(tmp_path, http_server, downloader, umask):
+    http_server.files['/pkg-1.0.tar.gz'] = CONTENT
+    fname = str(tmp_path / 'pkg-1.0.tar.gz')
+    assert downloader._download_http(http_server.url('/pkg-1.0.tar.gz'), fname, http_server.url('/'))
+    assert stat.S_IMODE(os.stat(fname).st_mode) == 0o640
+
+    fd, tmp = Transfer.temporary_file(fname)
+    os.close(fd)
+    assert stat.S_IMODE(os.stat(tmp).st_mode) == 0o640
+    assert os.path.dirname(tmp) == str(tmp_path) and os.path.basename(tmp).startswith('.pkg-1.0.tar.gz.')
@@ -0,0 +1,52 @@
+import os
+import signal
+import time
+
+import Fleet
+from UscanOutput import UscanOutput
+
+
+class FakeWatchFile:
+    """Stands for WatchFile: the package name says how processing goes."""
+
+    def __init__(self, config, package, pkg_dir, version, watchfile):
+        self.package = package
+        self.status = 0
+
+    def process_lines(self):
+        if self.package.startswith('crash'):
+            time.sleep(0.1)
+            os.kill(os.getpid(), signal.SIGKILL)
+        if self.package.startswith('die'):
+            UscanOutput.uscan_die(f"{self.package} is broken")
+        time.sleep(0.2)
+        print(f"{self.package} processed")
+        return 0
+
+
+def run(tmp_path, monkeypatch, capfd, packages, jobs):
+    monkeypatch.setattr(Fleet, 'WatchFile', FakeWatchFile)
+    entries = []
+    for package in packages:
+        (tmp_path / package).mkdir()
+        entries.append((str(tmp_path / package), package, '1.0', 'debian/watch'))
+    fleet = Fleet.Fleet(None, jobs)
+    status = fleet.run(entries)
+    out, err = capfd.readouterr()
+    return status, fleet.statuses, out, err
+
+
+def test_failures_are_confined_to_their_package(tmp_path, monkeypatch, capfd):
+    packages = ['a', 'die-b', 'c', 'd']
+    status, statuses, out, err = run(tmp_path, monkeypatch, capfd, packages, 3)
+    assert status == 1 and statuses == [0, 1, 0, 0]
+    assert out.splitlines() == ['a processed', 'c processed', 'd processed']
+    assert 'die-b is broken' in err
+
+
+def test_killed_worker_only_fails_its_package(tmp_path, monkeypatch, capfd):
+    packages = ['a', 'b', 'crash-c', 'd', 'e', 'f', 'g']
+    status, statuses, out, err = run(tmp_path, monkeypatch, capfd, packages, 3)
+    assert status == 1 and statuses == [0, 0, 1, 0, 0, 0, 0]
+    assert out.splitlines() == [f"{package} processed" for package in packages if package != 'crash-c']
+    assert 'crash-c: worker process died' in err
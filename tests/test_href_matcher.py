@@ -0,0 +1,27 @@
+import re
+
+from HrefMatcher import PlainMatcher
+
+PATTERN = r'pkg-([\d.]+)\.tar\.gz'
+
+
+def found(patterns, body, encoding='utf-8'):
+    return [text for _, text in PlainMatcher(tuple(patterns), encoding).search(body.encode(encoding))]
+
+
+def test_word_boundary_matches_str_semantics():
+    body = 'pkg-1.0.tar.gz épkg-2.0.tar.gz -pkg-3.0.tar.gz xpkg-4.0.tar.gz ﬁpkg-5.0.tar.gz'
+    expected = [match.group() for match in re.finditer(r'\b' + PATTERN, body)]
+    assert found([PATTERN], body) == expected == ['pkg-1.0.tar.gz', 'pkg-3.0.tar.gz']
+    assert found([PATTERN], 'épkg-2.0.tar.gz pkg-1.0.tar.gz', 'latin-1') == ['pkg-1.0.tar.gz']
+
+
+def test_non_ascii_pattern():
+    body = 'paquet-été-1.0.tar.gz\npaquet-été-1.2.tar.gz\n'
+    assert found([r'paquet-été-([\d.]+)\.tar\.gz'], body) == ['paquet-été-1.0.tar.gz', 'paquet-été-1.2.tar.gz']
+    assert found([r'paquet-été-([\d.]+)\.tar\.gz'], body, 'latin-1') == ['paquet-été-1.0.tar.gz',
+                                                                          'paquet-été-1.2.tar.gz']
+
+
+def test_pattern_that_does_not_encode():
+    assert found(['pkg-\udcff-([\\d.]+)', PATTERN], 'pkg-1.0.tar.gz') == ['pkg-1.0.tar.gz']
@@ -0,0 +1,68 @@
+from HttpPool import HttpPool
+
+
+def page(size):
+    return b''.join(b'<a href="pkg-1.%d.tar.gz">pkg</a>\n' % n for n in range(size // 32))
+
+
+def get(downloader, url):
+    return downloader.http_cache.get(HttpPool.instance().session, url, timeout=10, stream=True)
+
+
+def test_unmodified_page_is_served_from_cache(tmp_path, http_server, make_downloader):
+    downloader = make_downloader(cache_dir=str(tmp_path / 'cache'))
+    http_server.files['/index.html'] = page(4096)
+    url = http_server.url('/index.html')
+
+    first = downloader.get_page(url)
+    second = downloader.get_page(url)
+    assert not first.from_cache and second.from_cache
+    assert second.content == first.content == http_server.files['/index.html']
+    assert http_server.requests[-1][2]['If-None-Match'] == first.headers['ETag']
+
+
+def test_large_chunked_page_is_cached_once_read(tmp_path, http_server, make_downloader):
+    downloader = make_downloader(cache_dir=str(tmp_path / 'cache'))
+    http_server.chunked = True
+    http_server.files['/big.html'] = page(3 * 1024 * 1024)
+    url = http_server.url('/big.html')
+
+    first = get(downloader, url)
+    assert 'Content-Length' not in first.headers and downloader.page_unread(first)
+    assert downloader.read_page(first) == http_server.files['/big.html']
+
+    second = get(downloader, url)
+    assert second.from_cache and downloader.read_page(second) == http_server.files['/big.html']
+
+
+def test_page_read_partly_is_not_cached(tmp_path, http_server, make_downloader):
+    downloader = make_downloader(cache_dir=str(tmp_path / 'cache'))
+    http_server.chunked = True
+    http_server.files['/big.html'] = page(1024 * 1024)
+    url = http_server.url('/big.html')
+
+    first = get(downloader, url)
+    next(downloader.iter_page(first))
+    first.close()
+    assert downloader.http_cache.load(url) is None
+
+    second = get(downloader, url)
+    assert not second.from_cache
+    assert b''.join(downloader.iter_page(second)) == http_server.files['/big.html']
+    assert downloader.http_cache.load(url)[1] == http_server.files['/big.html']
+    assert downloader.http_cache.hits == 0 and downloader.http_cache.misses == 2
+
+
+def test_not_modified_without_cached_copy_is_fetched_again(tmp_path, http_server, make_downloader):
+    downloader = make_downloader(cache_dir=str(tmp_path / 'cache'))
+    http_server.files['/index.html'] = page(4096)
+    url = http_server.url('/index.html')
+    etag = downloader.get_page(url).headers['ETag']
+
+    # The entry is evicted while the caller still holds its validator
+    downloader.http_cache.store.delete(url)
+    response = downloader.http_cache.get(HttpPool.instance().session, url, headers={'If-None-Match': etag},
+                                         timeout=10)
+    assert response.status_code == 200 and not response.from_cache
+    assert response.content == http_server.files['/index.html']
+    assert [request[2].get('If-None-Match') for request in http_server.requests[-2:]] == [etag, None]
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from AsyncHttp import AsyncHttp
+from conftest import html_page, searcher
+
+
+LISTING = b'pkg-1.0.tar.gz\npkg-1.10.tar.gz  xpkg-9.0.tar.gz\npkg-1.9.tar.gz\r\npkg-1.2.tar.gz.asc\n'
+
+
+def test_plain_search(http_server, downloader):
+    http_server.files['/releases/'] = LISTING
+    line = searcher(downloader, http_server.url('/releases/'), r'pkg-([\d.]+)\.tar\.gz', searchmode='plain')
+    assert line.http_search() == ('1.10', 'pkg-1.10.tar.gz')
+
+
+def test_plain_search_without_match(http_server, downloader):
+    http_server.files['/releases/'] = LISTING
+    line = searcher(downloader, http_server.url('/releases/'), r'other-([\d.]+)\.tar\.gz', searchmode='plain')
+    assert line.http_search() is None
+
+
+@pytest.mark.parametrize('offset', [0, -7, -20, 3])
+def test_streamed_search_across_chunks(http_server, downloader, offset):
+    http_server.chunked = True
+    page = html_page([f"pkg-1.{n}.tar.gz" for n in range(20)], 512 * 1024)
+    # Put the newest link astride the boundary of the second 64 KiB chunk
+    newest = b'<a href="pkg-2.0.tar.gz">new</a>\n'
+    cut = 128 * 1024 + offset - len(newest) // 2
+    http_server.files['/releases/'] = page[:cut] + newest + page[cut:]
+    line = searcher(downloader, http_server.url('/releases/'), r'pkg-([\d.]+)\.tar\.gz')
+    assert line.http_search() == ('2.0', http_server.url('/releases/pkg-2.0.tar.gz'))
+
+
+def test_streamed_search_honours_base_href(http_server, downloader):
+    http_server.chunked = True
+    base = http_server.url('/releases/mirror/')
+    http_server.files['/releases/'] = html_page(['pkg-1.0.tar.gz', 'pkg-2.0.tar.gz'], 256 * 1024,
+                                                f'<base href="{base}">')
+    line = searcher(downloader, http_server.url('/releases/'), r'mirror/pkg-([\d.]+)\.tar\.gz')
+    assert line.http_search() == ('2.0', base + 'pkg-2.0.tar.gz')
+
+
+def test_search_stopped_early_is_not_cached(tmp_path, http_server, make_downloader):
+    downloader = make_downloader(cache_dir=str(tmp_path / 'cache'))
+    http_server.chunked = True
+    url = http_server.url('/releases/')
+    http_server.files['/releases/'] = html_page([f"pkg-1.{n}.tar.gz" for n in range(20, 0, -1)], 1024 * 1024)
+
+    line = searcher(downloader, url, r'pkg-([\d.]+)\.tar\.gz', searchlimit='1')
+    assert line.http_search() == ('1.20', http_server.url('/releases/pkg-1.20.tar.gz'))
+    assert downloader.http_cache.load(url) is None
+
+    line = searcher(downloader, url, r'pkg-([\d.]+)\.tar\.gz')
+    assert line.http_search() == ('1.20', http_server.url('/releases/pkg-1.20.tar.gz'))
+    assert downloader.http_cache.load(url)[1] == http_server.files['/releases/']
+
+
+def release_tree(http_server, packages):
+    """Serve /pub/<package>/<dir>/ listings, the newest release being in 10.0/."""
+    for package in packages:
+        dirs = ['1.0', '2.0', '10.0', 'old']
+        http_server.files[f"/pub/{package}/"] = html_page([f"{d}/" for d in dirs], 4096)
+        for d in dirs[:-1]:
+            http_server.files[f"/pub/{package}/{d}/"] = html_page(
+                [f"{package}-{d}.{n}.tar.gz" for n in (1, 3, 2)], 4096)
+
+
+def walker(downloader, http_server, package):
+    return searcher(downloader, http_server.url(f"/pub/{package}/"), rf'{package}-([\d.]+)\.tar\.gz')
+
+
+def walk_serially(downloader, http_server, package):
+    line = walker(downloader, http_server, package)
+    newdir = line.http_newdir(False, line.line, http_server.url(''), f"/pub/{package}/", r'(\d[\d.]*)', [],
+                              line.watchfile, line.line, None)
+    line.parse_result['base'] = http_server.url(f"/pub/{package}/{newdir}/")
+    return line.http_search()
+
+
+async def walk_concurrently(engine, lines, http_server, packages):
+    newdirs = await asyncio.gather(*(
+        line.http_newdir_async(False, line.line, http_server.url(''), f"/pub/{package}/", r'(\d[\d.]*)', [],
+                               line.watchfile, line.line, None, engine=engine)
+        for line, package in zip(lines, packages)))
+    for line, package, newdir in zip(lines, packages, newdirs):
+        line.parse_result['base'] = http_server.url(f"/pub/{package}/{newdir}/")
+    return await engine.search_all(lines)
+
+
+def test_concurrent_walk_finds_what_the_serial_walk_finds(http_server, downloader):
+    packages = [f"pkg{n}" for n in range(8)]
+    release_tree(http_server, packages)
+    serial = [walk_serially(downloader, http_server, package) for package in packages]
+    assert serial[0] == ('10.0.3', http_server.url('/pub/pkg0/10.0/pkg0-10.0.3.tar.gz'))
+
+    http_server.delay = 0.05
+    engine = AsyncHttp(max_connections=3)
+    try:
+        lines = [walker(downloader, http_server, package) for package in packages]
+        found = AsyncHttp.run(walk_concurrently(engine, lines, http_server, packages))
+    finally:
+        engine.close()
+    assert [result for result, _ in found] == serial
+    assert [url for _, url in found] == [newfile for _, newfile in serial]
+    # Requests were multiplexed, but never over more connections than allowed
+    assert 1 < http_server.max_in_flight <= engine.max_connections
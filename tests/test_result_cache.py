@@ -0,0 +1,44 @@
+import pytest
+
+from conftest import html_page, searcher
+
+PATTERN = r'pkg-([\d.]+)\.tar\.gz'
+
+
+@pytest.fixture
+def search(tmp_path, http_server, make_downloader):
+    """Search /releases/ like a watch line would, remembering the result as WatchLine does."""
+    downloader = make_downloader(cache_dir=str(tmp_path / 'cache'))
+    http_server.files['/releases/'] = html_page([f"pkg-1.{n}.tar.gz" for n in range(5)], 64 * 1024)
+
+    def run(**options):
+        line = searcher(downloader, http_server.url('/releases/'), PATTERN, **options)
+        result = line.http_search()
+        if line.memo_pending:
+            downloader.result_cache.put(line.memo_key, upstream_url=result[1], newfile_base='',
+                                        search_result={}, **line.memo_pending)
+        return line, result
+    return run
+
+
+def test_unchanged_page_reuses_the_result(search, http_server):
+    first, result = search()
+    assert first.memo_hit is None and result == ('1.4', http_server.url('/releases/pkg-1.4.tar.gz'))
+
+    second, again = search()
+    assert second.memo_hit['newversion'] == '1.4' and again == result
+    assert second.memo_pending is None
+
+
+def test_changed_page_misses(search, http_server):
+    search()
+    http_server.files['/releases/'] = html_page([f"pkg-1.{n}.tar.gz" for n in range(6)], 64 * 1024)
+
+    line, result = search()
+    assert line.memo_hit is None and result[0] == '1.5'
+
+
+def test_changed_mangle_rule_misses(search):
+    first, _ = search()
+    line, _ = search(uversionmangle=['s{rc}{~rc}'])
+    assert line.memo_hit is None and line.memo_key != first.memo_key
@@ -0,0 +1,56 @@
+import pytest
+
+from conftest import sign
+from Keyring import UscanKeyring
+from WatchLine import WatchLine
+
+
+def mangle_line(tmp_path, downloader, http_server, name):
+    """A pgpmode=mangle line whose tarball and signature are served by http_server."""
+    destdir = tmp_path / 'dest'
+    destdir.mkdir()
+    keyring = UscanKeyring()
+    line = WatchLine({'download': 1, 'signature': 1}, keyring, {'destdir': str(destdir)}, downloader,
+                     '', 'pkg', '.', '1.0', 'debian/watch', 4)
+    line.upstream_url = http_server.url(f"/{name}")
+    line.newfile_base = name
+    line.parse_result = {'base': http_server.url('/')}
+    line.mode = 'http'
+    line.pgpmode = 'mangle'
+    line.must_download = False
+    line._signature_file = lambda base: (f"{line.upstream_url}.asc", f"{base}.asc")
+
+    streamed = []
+    stream_verifier = keyring.stream_verifier
+    keyring.stream_verifier = lambda *args: streamed.append(stream_verifier(*args)) or streamed[-1]
+    return line, streamed
+
+
+def serve(tmp_path, http_server, signing_key, name, signed, served):
+    path = tmp_path / name
+    path.write_bytes(signed)
+    with open(sign(signing_key, path), 'rb') as f:
+        http_server.files[f"/{name}.asc"] = f.read()
+    http_server.files[f"/{name}"] = served
+
+
+def test_streamed_tarball_verifies(tmp_path, package_dir, signing_key, http_server, downloader):
+    content = b'upstream tarball\n' * 10000
+    serve(tmp_path, http_server, signing_key, 'pkg-1.0.tar.gz', content, content)
+    line, streamed = mangle_line(tmp_path, downloader, http_server, 'pkg-1.0.tar.gz')
+
+    line.download_file_and_sig()
+    assert len(streamed) == 1 and streamed[0].complete
+    assert line.mkorigtargz() == 0
+    assert line.verifications == []
+
+
+def test_tampered_streamed_tarball_fails_the_run(tmp_path, package_dir, signing_key, http_server, downloader):
+    content = b'upstream tarball\n' * 10000
+    serve(tmp_path, http_server, signing_key, 'pkg-1.1.tar.gz', content, content.replace(b'\n', b' ', 1))
+    line, streamed = mangle_line(tmp_path, downloader, http_server, 'pkg-1.1.tar.gz')
+
+    line.download_file_and_sig()
+    assert len(streamed) == 1 and streamed[0].complete
+    with pytest.raises(SystemExit, match='did not verify'):
+        line.mkorigtargz()
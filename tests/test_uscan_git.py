@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from conftest import git
+from Uscan_git import Uscan_git
+
+
+def describe(downloader, url, ref, gitmode):
+    """Run the versionless describe search of `url ref` and return its version."""
+    search = Uscan_git(True, {'base': url, 'filepattern': ref}, {}, f"pkg-{gitmode}.git", [], 'debian/watch',
+                       f"{url} {ref}", 'git', downloader, pretty='describe', gitmode=gitmode)
+    newversion, newfile = search.git_search()
+    assert newfile == ref
+    return newversion
+
+
+@pytest.mark.parametrize('ref, tag', [('HEAD', 'v4.0'), ('heads/stable', 'v2.0')])
+def test_deepened_describe_matches_the_full_clone(tmp_path, upstream_repo, make_downloader, ref, tag):
+    # stable is 10 commits past v2.0, master 3 commits past v4.0 (whose history holds the merged v3.0)
+    git('branch', 'stable', 'master~16', cwd=upstream_repo)
+    url = f"file://{upstream_repo}"
+
+    full = describe(make_downloader(git_mirror_size=0), url, ref, 'full')
+    assert full.startswith(f"{tag}.")
+    assert describe(make_downloader(), url, ref, 'shallow') == full
+
+    # Only the commits down to the tag were fetched
+    shallow_dir = os.path.join(tmp_path, 'pkg-shallow.git')
+    assert os.path.exists(os.path.join(shallow_dir, 'shallow'))
+    assert int(git('--git-dir', shallow_dir, 'rev-list', '--count', '--all')) < \
+        int(git('rev-list', '--count', '--all', cwd=upstream_repo))
+
+
+def test_mirror_describe_matches_the_full_clone(tmp_path, upstream_repo, make_downloader):
+    url = f"file://{upstream_repo}"
+    full = describe(make_downloader(git_mirror_size=0), url, 'HEAD', 'full')
+    assert describe(make_downloader(cache_dir=str(tmp_path / 'cache')), url, 'HEAD', 'shallow') == full
+
+
+def tagged_search(make_downloader, url, filepattern, shared=None):
+    search = Uscan_git(False, {'base': url, 'filepattern': filepattern}, {}, 'pkg-temporary.git', [],
+                       'debian/watch', f"{url} {filepattern}", 'git', make_downloader(), shared=shared)
+    return search.git_search()
+
+
+def test_tagged_search_picks_the_newest_tag(tmp_path, upstream_repo, make_downloader):
+    for tag in ('v4.9', 'v4.10', 'other-9.0'):
+        git('tag', tag, 'master~1', cwd=upstream_repo)
+    url = f"file://{upstream_repo}"
+    assert tagged_search(make_downloader, url, r'refs/tags/v([\d.]+)') == ('4.10', 'refs/tags/v4.10')
+    assert tagged_search(make_downloader, url, r'refs/tags/v(\d+)\.0') == ('4', 'refs/tags/v4.0')
+    assert tagged_search(make_downloader, url, r'refs/tags/v([\d.]+)', {'download_version': '2.0'}) == \
+        ('2.0', 'refs/tags/v2.0')
+    # Nothing was cloned
+    assert not (tmp_path / 'pkg-temporary.git').exists()
+
+
+def test_tagged_search_fails_on_an_unreachable_repository(tmp_path, make_downloader):
+    with pytest.raises(SystemExit, match='ls-remote'):
+        tagged_search(make_downloader, f"file://{tmp_path}/missing", r'refs/tags/v([\d.]+)')
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import sign
+from Keyring import UscanKeyring
+from WatchLine import WatchLine
+
+
+def tarball(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return path
+
+
+def test_pooled_verifications_pass(tmp_path, package_dir, signing_key):
+    keyring = UscanKeyring()
+    line = SimpleNamespace(verifications=[])
+    for n in range(4):
+        path = tarball(tmp_path, f"pkg-{n}.tar.gz", b'upstream %d' % n)
+        line.verifications.append(keyring.submit('verifyv', sign(signing_key, path), str(path)))
+
+    WatchLine.wait_verifications(line)
+    assert line.verifications == []
+
+
+def test_failed_verification_is_raised_by_the_waiter(tmp_path, package_dir, signing_key):
+    keyring = UscanKeyring()
+    good = tarball(tmp_path, 'good.tar.gz', b'good')
+    bad = tarball(tmp_path, 'bad.tar.gz', b'original')
+    good_sig, bad_sig = sign(signing_key, good), sign(signing_key, bad)
+    bad.write_bytes(b'tampered')
+
+    line = SimpleNamespace(verifications=[keyring.submit('verifyv', good_sig, str(good)),
+                                          keyring.submit('verifyv', bad_sig, str(bad))])
+    with pytest.raises(SystemExit, match='did not verify'):
+        WatchLine.wait_verifications(line)
+
+
+def test_mkorigtargz_waits_even_without_building(tmp_path, package_dir, signing_key):
+    keyring = UscanKeyring()
+    path = tarball(tmp_path, 'pkg.tar.gz', b'original')
+    sig = sign(signing_key, path)
+    path.write_bytes(b'tampered')
+
+    line = SimpleNamespace(verifications=[keyring.submit('verifyv', sig, str(path))], must_download=False)
+    line.wait_verifications = lambda: WatchLine.wait_verifications(line)
+    with pytest.raises(SystemExit, match='did not verify'):
+        WatchLine.mkorigtargz(line)
@@ -0,0 +1,42 @@
+import random
+import shutil
+import subprocess
+from functools import cmp_to_key
+
+import pytest
+
+from devscript.Versort import Versort
+
+VERSIONS = ['0', '0.0', '00', '1', '1.0', '1.0~rc1', '1.0~rc1~1', '1.0~', '1.0+dfsg', '1.0a', '1.0A', '1.0.0',
+            '1.00', '1.01', '1.1', '1.10', '1.9', '1:0.1', '2:1.0', '1.0-1', '1.0-1~bpo1', '1.0-10', '1.0-2',
+            '1.0-1.1', '1.0-0', '1.0-a', '1.0-1-1', '1.2.3-4ubuntu1', '10', '9.99', '1.0+', '1.0.',
+            '123456789012345678901234567890', '123456789012345678901234567891', '2.0~beta', '2.0~alpha',
+            '2.0~~', '2.0~~a', '2.0-~', '0:1.0']
+
+
+def dpkg_compare(a, b):
+    for relation, result in (('lt', -1), ('gt', 1)):
+        returncode = subprocess.run(['dpkg', '--compare-versions', a, relation, b]).returncode
+        assert returncode in (0, 1), f"dpkg rejected {a} or {b}"
+        if returncode == 0:
+            return result
+    return 0
+
+
+@pytest.mark.skipif(not shutil.which('dpkg'), reason='needs dpkg')
+def test_versort_orders_like_dpkg():
+    versions = VERSIONS[:]
+    random.Random(0).shuffle(versions)
+    expected = sorted(versions, key=cmp_to_key(dpkg_compare), reverse=True)
+    result = [version for version, _ in Versort.versort([[version, None] for version in versions])]
+    assert [Versort.version_key(v) for v in result] == [Versort.version_key(v) for v in expected]
+    for a, b in zip(expected, expected[1:]):
+        assert Versort.compare(a, b) == dpkg_compare(a, b)
+
+
+@pytest.mark.skipif(not shutil.which('dpkg'), reason='needs dpkg')
+def test_upstream_versort_orders_like_dpkg():
+    upstream = [version for version in VERSIONS if ':' not in version and '-' not in version]
+    expected = sorted(upstream, key=cmp_to_key(lambda a, b: dpkg_compare(f"1:{a}-0", f"1:{b}-0")), reverse=True)
+    result = [version for version, _ in Versort.upstream_versort([[version, None] for version in upstream])]
+    assert [Versort.upstream_key(v) for v in result] == [Versort.upstream_key(v) for v in expected]